@@ -0,0 +1,298 @@
+"""
+Name:  AccessionIndex.py
+Purpose:
+    A local index of the reference IDs we already know: DOI ID, PubMed ID,
+    PMC ID and MGI ID, so code that maps one to another (e.g., DOI ID to
+    PubMed ID in PubMedAgent) can look there before going to NCBI.
+
+    Lookups are exact (DOI IDs are not case sensitive, so they are matched
+    in lower case) and are dict lookups.
+
+    An index can be
+        - loaded from the database (loadFromDb()): the IDs of every
+          reference in MGI
+        - saved to and loaded from a tab delimited file with a header line
+          naming the columns (doi, pubmed, pmc, mgiid). IDs not known are ''.
+
+    Example:
+        index = AccessionIndex.AccessionIndex()
+        index.load('/data/loads/accessions.tsv')
+        PubMedAgent.setAccessionIndex(index)
+        ... PubMedAgent DOI lookups now only go to NCBI for new DOIs ...
+
+    If run as a script, write an index file of all MGI references from the
+    database. See AccessionIndex.py -h
+"""
+import sys
+import argparse
+
+FILE_FD = '\t'          # index file field delimiter
+
+# AccessionRecord ID attributes
+RECORD_ATTRS = [ 'doiID', 'pubmedID', 'pmcID', 'mgiID', ]
+
+# index file columns, in the order we write them
+FILE_COLUMNS = [ 'doi', 'pubmed', 'pmc', 'mgiid', ]
+
+# IDs for each MGI reference
+# (ldb 1 = MGI, 29 = PubMed, 65 = DOI, PMC looked up by name)
+REFERENCE_IDS_QUERY = '''
+    select a.accid mgiid, a2.accid pubmed, a3.accid doi, a4.accid pmc
+    from bib_refs r join acc_accession a on
+            (a._object_key = r._refs_key and a._logicaldb_key=1 -- mgi
+            and a._mgitype_key=1 and a.prefixpart='MGI:' )
+        left outer join acc_accession a2 on
+            (a2._object_key = r._refs_key and a2._logicaldb_key=29 -- pubmed
+            and a2._mgitype_key=1 )
+        left outer join acc_accession a3 on
+            (a3._object_key = r._refs_key and a3._logicaldb_key=65 -- doi
+            and a3._mgitype_key=1 )
+        left outer join acc_accession a4 on
+            (a4._object_key = r._refs_key and a4._mgitype_key=1
+            and a4._logicaldb_key = (select _logicaldb_key from acc_logicaldb
+                                        where name = 'PMC') )
+    '''
+#-----------------------------------
+
+def normalizeDoiID(doiID):
+    return (doiID or '').strip().lower()
+
+def normalizePmcID(pmcID):
+    pmcID = (pmcID or '').strip().upper()
+    if pmcID and not pmcID.startswith('PMC'):
+        pmcID = 'PMC' + pmcID
+    return pmcID
+
+def normalizeMgiID(mgiID):
+    return (mgiID or '').strip().upper()
+#-----------------------------------
+
+class AccessionRecord (object):
+    """
+    IS	the IDs we know for one reference
+    HAS	doiID, pubmedID, pmcID, mgiID (strings, '' if not known)
+    """
+    def __init__(self, doiID='', pubmedID='', pmcID='', mgiID=''):
+        self.doiID    = (doiID or '').strip()
+        self.pubmedID = str(pubmedID or '').strip()
+        self.pmcID    = normalizePmcID(pmcID)
+        self.mgiID    = normalizeMgiID(mgiID)
+
+    def __str__(self):
+        return 'AccessionRecord: %s %s %s %s' % (self.doiID, self.pubmedID,
+                                                    self.pmcID, self.mgiID)
+# end class AccessionRecord -----------------------------------
+
+class AccessionIndex (object):
+    """
+    IS	an index of reference IDs
+    HAS	AccessionRecords, dicts mapping each kind of ID to its record
+    DOES add() - add/merge the IDs for a reference
+         getByDoiID(), getByPubMedID(), getByPmcID(), getByMgiID() - lookups
+         getPubMedID(doiID), getPmcID(doiID) - the common mappings
+         load(), save(), loadFromDb()
+    """
+    def __init__(self):
+        self.doi2Rcd    = {}    # normalized DOI ID -> AccessionRecord
+        self.pubmed2Rcd = {}
+        self.pmc2Rcd    = {}
+        self.mgi2Rcd    = {}
+        self.hits = 0           # lookups that found a record
+        self.misses = 0
+    #-----------------------------------
+
+    def add(self, doiID='', pubmedID='', pmcID='', mgiID=''):
+        """
+        Add the IDs of a reference. If any of the IDs is already in the
+            index, the IDs are merged into that reference's record
+            (new non-blank IDs win). If the IDs link two or more records,
+            they are merged into one (the first one's IDs win).
+            IDs that are replaced are removed from the index.
+        Return the AccessionRecord.
+        """
+        new = AccessionRecord(doiID, pubmedID, pmcID, mgiID)
+        found = []                      # distinct records new's IDs are in
+        for d, key in self._getKeys(new):
+            rcd = d.get(key)
+            if rcd is not None and rcd not in found:
+                found.append(rcd)
+
+        if not found:
+            rcd = new
+        else:
+            rcd = found[0]
+            for other in found:
+                self._unindex(other)
+            for other in found[1:]:
+                for attr in RECORD_ATTRS:
+                    if not getattr(rcd, attr):
+                        setattr(rcd, attr, getattr(other, attr))
+            for attr in RECORD_ATTRS:
+                if getattr(new, attr):
+                    setattr(rcd, attr, getattr(new, attr))
+        self._index(rcd)
+        return rcd
+    #-----------------------------------
+
+    def _getKeys(self, rcd):
+        """ Return list of (dict, key) for the IDs of rcd that are not blank
+        """
+        keys = []
+        for d, key in [ (self.doi2Rcd,    normalizeDoiID(rcd.doiID)),
+                        (self.pubmed2Rcd, rcd.pubmedID),
+                        (self.pmc2Rcd,    rcd.pmcID),
+                        (self.mgi2Rcd,    rcd.mgiID), ]:
+            if key:
+                keys.append((d, key))
+        return keys
+
+    def _index(self, rcd):
+        for d, key in self._getKeys(rcd):
+            d[key] = rcd
+
+    def _unindex(self, rcd):
+        for d, key in self._getKeys(rcd):
+            if d.get(key) is rcd:
+                del d[key]
+    #-----------------------------------
+
+    def _lookup(self, d, key):
+        rcd = d.get(key)
+        if rcd is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return rcd
+
+    def getByDoiID(self, doiID):
+        return self._lookup(self.doi2Rcd, normalizeDoiID(doiID))
+
+    def getByPubMedID(self, pubmedID):
+        return self._lookup(self.pubmed2Rcd, str(pubmedID).strip())
+
+    def getByPmcID(self, pmcID):
+        return self._lookup(self.pmc2Rcd, normalizePmcID(pmcID))
+
+    def getByMgiID(self, mgiID):
+        return self._lookup(self.mgi2Rcd, normalizeMgiID(mgiID))
+    #-----------------------------------
+
+    def getPubMedID(self, doiID):
+        """ Return the PubMed ID for doiID, or None if not known
+        """
+        rcd = self.getByDoiID(doiID)
+        return (rcd and rcd.pubmedID) or None
+
+    def getPmcID(self, doiID):
+        """ Return the PMC ID for doiID, or None if not known
+        """
+        rcd = self.getByDoiID(doiID)
+        return (rcd and rcd.pmcID) or None
+    #-----------------------------------
+
+    def getRecords(self):
+        """ Return list of the (distinct) AccessionRecords
+        """
+        rcds = {}
+        for d in (self.doi2Rcd, self.pubmed2Rcd, self.pmc2Rcd, self.mgi2Rcd):
+            for rcd in d.values():
+                rcds[id(rcd)] = rcd
+        return list(rcds.values())
+    #-----------------------------------
+
+    def __len__(self):
+        return len(self.getRecords())
+    #-----------------------------------
+
+    def getStatistics(self):
+        """ Return list of strings describing the index and its lookups
+        """
+        return [
+            'DOI IDs:        %d' % len(self.doi2Rcd),
+            'PubMed IDs:     %d' % len(self.pubmed2Rcd),
+            'PMC IDs:        %d' % len(self.pmc2Rcd),
+            'MGI IDs:        %d' % len(self.mgi2Rcd),
+            'Lookup hits:    %d' % self.hits,
+            'Lookup misses:  %d' % self.misses,
+            ]
+    #-----------------------------------
+
+    def load(self, filename):
+        """ Add the IDs in an index file (see save()).
+            Return the number of lines read.
+        """
+        numRead = 0
+        with open(filename, 'r') as fp:
+            columns = fp.readline().rstrip('\n').split(FILE_FD)
+            for line in fp:
+                values = dict(zip(columns, line.rstrip('\n').split(FILE_FD)))
+                self.add(doiID    = values.get('doi', ''),
+                         pubmedID = values.get('pubmed', ''),
+                         pmcID    = values.get('pmc', ''),
+                         mgiID    = values.get('mgiid', ''))
+                numRead += 1
+        return numRead
+    #-----------------------------------
+
+    def save(self, filename):
+        """ Write the index to a tab delimited file
+        """
+        with open(filename, 'w') as fp:
+            fp.write(FILE_FD.join(FILE_COLUMNS) + '\n')
+            for rcd in self.getRecords():
+                fp.write(FILE_FD.join([ rcd.doiID, rcd.pubmedID, rcd.pmcID,
+                                                        rcd.mgiID ]) + '\n')
+    #-----------------------------------
+
+    def loadFromDb(self, db):
+        """ Add the IDs of every MGI reference.
+            db is an initialized db module.
+            Return the number of references read.
+        """
+        rcds = db.sql([REFERENCE_IDS_QUERY], 'auto')[-1]
+        for r in rcds:
+            self.add(doiID=r['doi'], pubmedID=r['pubmed'], pmcID=r['pmc'],
+                                                        mgiID=r['mgiid'])
+        return len(rcds)
+# end class AccessionIndex -----------------------------------
+
+#-----------------------------------
+# if run as a script, write an index file from the database
+#-----------------------------------
+
+def getArgs():
+    parser = argparse.ArgumentParser( \
+        description='write an accession index file of all MGI references')
+
+    parser.add_argument('filename', help="index file to write")
+
+    parser.add_argument('-s', '--server', dest='server', action='store',
+        required=False, default='dev',
+        help='db server: prod, or dev (default)')
+
+    args =  parser.parse_args()
+
+    if args.server == 'prod':
+        args.host = 'bhmgidb01'
+        args.db = 'prod'
+    if args.server == 'dev':
+        args.host = 'bhmgidevdb01'
+        args.db = 'prod'
+
+    return args
+#-----------------------------------
+
+if __name__ == "__main__":
+    import db as dbModule
+
+    args = getArgs()
+    dbModule.set_sqlServer(args.host)
+    dbModule.set_sqlDatabase(args.db)
+    dbModule.set_sqlUser("mgd_public")
+    dbModule.set_sqlPassword("mgdpub")
+
+    index = AccessionIndex()
+    numRead = index.loadFromDb(dbModule)
+    index.save(args.filename)
+    sys.stderr.write("%d references written to %s\n" % (numRead,
+                                                            args.filename))
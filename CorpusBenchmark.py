@@ -0,0 +1,119 @@
+"""
+Name:  CorpusBenchmark.py
+Purpose:
+    Common code for benchmarks that run some code (DoiFinder, the splitter,
+    ...) over every text in an ExtractedTextCorpus in parallel and report
+    on the results and timings.
+
+    runOverCorpus() fans the corpus entries out to a pool of processes.
+    Each process opens its own CorpusReader, so only the (small) index
+    entries are sent to the processes, never the texts. Options the
+    per document function depends on must be set in each process by an
+    initializer: module globals set in the parent only reach the workers
+    when they are forked, not under the spawn/forkserver start methods.
+
+    See DoiBenchmark.py for an example.
+"""
+import time
+import json
+import multiprocessing
+import ExtractedTextCorpus
+from Instrumentation import percentile
+
+_reader = None          # the CorpusReader in a worker process
+#-----------------------------------
+
+def _initWorker(corpusPath, initializer=None, initargs=()):
+    """ Open the corpus once in each worker process, run the initializer
+    """
+    global _reader
+    _reader = ExtractedTextCorpus.CorpusReader(corpusPath)
+    if initializer is not None:
+        initializer(*initargs)
+#-----------------------------------
+
+def _runOne(args):
+    """ Run func on the text of one corpus entry in a worker process
+    """
+    func, entry = args
+    return func(entry, _reader.getText(entry))
+#-----------------------------------
+
+def runOverCorpus(corpusPath,   # path to ExtractedTextCorpus
+                func,           # func(entry, text) -> result, must be
+                                #  picklable (e.g., a module level function)
+                entries=None,   # list of CorpusEntries to run over,
+                                #  None means all of them
+                workers=4,      # number of processes, 1 means run in this
+                                #  process (easier to debug/profile)
+                chunksize=20,   # entries sent to a worker at a time
+                initializer=None,   # initializer(*initargs) is run once in
+                initargs=(),        #  each worker process (e.g., to set
+                                    #  options func depends on), must be
+                                    #  picklable
+    ):
+    """
+    Return (list of results in entry order, total elapsed wall time)
+    """
+    startTime = time.time()
+    if entries is None:
+        with ExtractedTextCorpus.CorpusReader(corpusPath) as reader:
+            entries = reader.getEntries()
+
+    work = [ (func, e) for e in entries ]
+    if workers <= 1:
+        _initWorker(corpusPath, initializer, initargs)
+        results = [ _runOne(w) for w in work ]
+        _reader.close()
+    else:
+        with multiprocessing.Pool(workers, _initWorker,
+                            (corpusPath, initializer, initargs)) as pool:
+            results = pool.map(_runOne, work, chunksize)
+
+    return results, time.time() - startTime
+#-----------------------------------
+
+def getTimingSummary(seconds,   # list of per document times (seconds)
+                    wallTime,   # total elapsed time for all documents
+    ):
+    """
+    Return dict summarizing per document times and throughput
+    """
+    n = len(seconds)
+    return {'documents'      : n,
+            'wall_seconds'   : wallTime,
+            'docs_per_second': n / wallTime if wallTime else 0.0,
+            'mean_seconds'   : sum(seconds) / n if n else 0.0,
+            'p50_seconds'    : percentile(seconds, 50),
+            'p99_seconds'    : percentile(seconds, 99),
+            'max_seconds'    : max(seconds) if n else 0.0,
+            }
+#-----------------------------------
+
+def formatTimingSummary(timing):
+    """ Return list of report lines for a getTimingSummary() dict
+    """
+    return [
+        'Documents:        %d' % timing['documents'],
+        'Wall time:        %8.3f sec' % timing['wall_seconds'],
+        'Throughput:       %8.1f docs/sec' % timing['docs_per_second'],
+        'Mean per doc:     %8.3f ms' % (1000 * timing['mean_seconds']),
+        'p50 per doc:      %8.3f ms' % (1000 * timing['p50_seconds']),
+        'p99 per doc:      %8.3f ms' % (1000 * timing['p99_seconds']),
+        'Max per doc:      %8.3f ms' % (1000 * timing['max_seconds']),
+        ]
+#-----------------------------------
+
+def saveResults(results, filename):
+    """ Save benchmark results (a json-able dict) to be used as a baseline
+    """
+    with open(filename, 'w') as fp:
+        json.dump(results, fp, indent=1, sort_keys=True)
+#-----------------------------------
+
+def loadResults(filename):
+    """ Load benchmark results saved by saveResults()
+    """
+    with open(filename, 'r') as fp:
+        return json.load(fp)
+#-----------------------------------
@@ -0,0 +1,272 @@
+"""
+Name:  DoiBenchmark.py
+Purpose:
+    Reproducible, offline benchmark of PdfParser.DoiFinder.
+    Runs DoiFinder.getDoiID() over the texts in an ExtractedTextCorpus whose
+    entries have a known (expected) DOI ID, in parallel, and reports
+        - accuracy overall, per DOI prefix (e.g., '10.1371'), and per journal
+        - throughput and per document p50/p99 latency of getDoiID()
+    The results can be saved and used as a baseline for later runs, in which
+    case the report also shows what changed: documents that were fixed or
+    broken, and the change in accuracy and speed.
+
+    This is the offline, parallel version of test/doiRetry.py.
+    Build the corpus with ExtractedTextCorpus.py (which includes DOI IDs).
+
+    Example:
+        DoiBenchmark.py /data/corpus/refs2020 --save baseline.json
+        ... change DoiFinder ...
+        DoiBenchmark.py /data/corpus/refs2020 --baseline baseline.json
+
+    See DoiBenchmark.py -h
+"""
+import sys
+import time
+import argparse
+import CorpusBenchmark
+import ExtractedTextCorpus
+import PdfParser
+from extractedTextSplitter import SUPP_DATA_TAG
+
+# doi status values
+CORRECT   = 'correct'
+WRONG     = 'wrong'
+NONE      = 'none found'
+EXCEPTION = 'exception'
+
+doiFinder = PdfParser.DoiFinder()
+removeSuppData = True   # remove MGI supp data from texts before DOI finding
+#-----------------------------------
+
+def setRemoveSuppData(remove):
+    """ Set whether to remove MGI supp data from texts (in this process)
+    """
+    global removeSuppData
+    removeSuppData = remove
+#-----------------------------------
+
+def getDoiPrefix(doiID):
+    """ Return the registrant prefix of a DOI ID, e.g., '10.1371'
+    """
+    return doiID.split('/', 1)[0]
+#-----------------------------------
+
+def cleanText(text):
+    """ Remove the MGI supplemental data tag and everything after it
+    """
+    i = text.find(SUPP_DATA_TAG)
+    if i == -1:
+        return text
+    return text[:i]
+#-----------------------------------
+
+def findDoi(entry, text):
+    """
+    Run the DoiFinder on one corpus text (in a worker process).
+    Return a result dict for the document.
+    """
+    if removeSuppData:
+        text = cleanText(text)
+    error = ''
+    startTime = time.perf_counter()
+    try:
+        foundDoiID = doiFinder.getDoiID(text)
+    except Exception as e:
+        foundDoiID = None
+        error = str(e)
+    seconds = time.perf_counter() - startTime
+
+    if error:
+        status = EXCEPTION
+    elif not foundDoiID:
+        status = NONE
+    elif foundDoiID.lower() != entry.doiID.lower():    # not case sensitive
+        status = WRONG
+    else:
+        status = CORRECT
+
+    return {'refs_key': entry.refsKey,
+            'mgiid'   : entry.mgiID,
+            'journal' : entry.journal,
+            'prefix'  : getDoiPrefix(entry.doiID),
+            'expected': entry.doiID,
+            'found'   : foundDoiID or '',
+            'status'  : status,
+            'seconds' : seconds,
+            'error'   : error,
+            }
+#-----------------------------------
+
+def runBenchmark(corpusPath,
+                workers=4,
+                journal=None,   # only texts from this journal
+                year=None,      # only texts from this year
+                limit=0,        # max number of texts, 0 for all
+                removeSupp=True,    # remove MGI supp data from the texts
+    ):
+    """
+    Return the benchmark results dict:
+        {'corpus': path, 'documents': [result dict per document],
+         'timing': CorpusBenchmark.getTimingSummary() dict}
+    Only corpus entries with a DOI ID are used.
+    """
+    with ExtractedTextCorpus.CorpusReader(corpusPath) as reader:
+        entries = [ e for e in reader.getEntries(journal=journal, year=year)
+                                                                if e.doiID ]
+    if limit:
+        entries = entries[:limit]
+
+    documents, wallTime = CorpusBenchmark.runOverCorpus(corpusPath, findDoi,
+                                            entries=entries, workers=workers,
+                                            initializer=setRemoveSuppData,
+                                            initargs=(removeSupp,))
+    timing = CorpusBenchmark.getTimingSummary(
+                                [ d['seconds'] for d in documents ], wallTime)
+    return {'corpus'   : corpusPath,
+            'documents': documents,
+            'timing'   : timing,
+            }
+#-----------------------------------
+
+def getAccuracy(documents, groupBy=None):
+    """
+    Return dict {group: {status: count, ..., 'total': n, 'accuracy': f}}
+        for the documents grouped by the groupBy field ('prefix', 'journal')
+        or one group 'all' if groupBy is None
+    """
+    groups = {}
+    for d in documents:
+        g = d[groupBy] if groupBy else 'all'
+        counts = groups.setdefault(g, {CORRECT: 0, WRONG: 0, NONE: 0,
+                                            EXCEPTION: 0, 'total': 0})
+        counts[d['status']] += 1
+        counts['total'] += 1
+    for counts in groups.values():
+        counts['accuracy'] = float(counts[CORRECT]) / counts['total']
+    return groups
+#-----------------------------------
+
+def formatAccuracy(groups, title):
+    """ Return report lines for a getAccuracy() dict, worst groups first
+    """
+    lines = [ '%-30s %6s %7s %6s %6s %6s %9s' % (title, 'total', 'correct',
+                                    'wrong', 'none', 'except', 'accuracy') ]
+    for g, c in sorted(groups.items(), key=lambda x:
+                                            (x[1]['accuracy'], -x[1]['total'])):
+        lines.append('%-30s %6d %7d %6d %6d %6d %8.2f%%' % (g[:30],
+                        c['total'], c[CORRECT], c[WRONG], c[NONE],
+                        c[EXCEPTION], 100 * c['accuracy']))
+    return lines
+#-----------------------------------
+
+def getReport(results):
+    """ Return report lines for benchmark results
+    """
+    documents = results['documents']
+    lines = [ 'DoiFinder benchmark: %s' % results['corpus'], '' ]
+    lines += CorpusBenchmark.formatTimingSummary(results['timing'])
+    lines += [ '' ]
+    lines += formatAccuracy(getAccuracy(documents), 'Overall')
+    lines += [ '' ]
+    lines += formatAccuracy(getAccuracy(documents, 'prefix'), 'DOI prefix')
+    lines += [ '' ]
+    lines += formatAccuracy(getAccuracy(documents, 'journal'), 'Journal')
+    return lines
+#-----------------------------------
+
+def getDiffReport(results, baseline):
+    """
+    Return report lines describing what changed between baseline results
+        and these results: accuracy, speed, and the documents whose status
+        changed (matched by _refs_key)
+    """
+    lines = [ 'Changes from baseline:' ]
+    acc  = getAccuracy(results['documents'])['all']['accuracy']
+    bAcc = getAccuracy(baseline['documents'])['all']['accuracy']
+    lines.append('Accuracy:     %6.2f%% -> %6.2f%% (%+.2f%%)' % \
+                                    (100 * bAcc, 100 * acc, 100 * (acc-bAcc)))
+    for key, label, scale, unit in [
+                    ('docs_per_second', 'Throughput:', 1, 'docs/sec'),
+                    ('p50_seconds',     'p50 per doc:', 1000, 'ms'),
+                    ('p99_seconds',     'p99 per doc:', 1000, 'ms'), ]:
+        new = scale * results['timing'][key]
+        old = scale * baseline['timing'][key]
+        change = 100.0 * (new - old) / old if old else 0.0
+        lines.append('%-13s %8.3f -> %8.3f %s (%+.1f%%)' % \
+                                            (label, old, new, unit, change))
+
+    baseDocs = dict([ (d['refs_key'], d) for d in baseline['documents'] ])
+    fixed, broken, changed = [], [], []
+    for d in results['documents']:
+        b = baseDocs.get(d['refs_key'])
+        if b is None or (b['status'] == d['status'] and
+                                                    b['found'] == d['found']):
+            continue
+        if d['status'] == CORRECT:
+            fixed.append((b, d))
+        elif b['status'] == CORRECT:
+            broken.append((b, d))
+        else:
+            changed.append((b, d))
+
+    for title, pairs in [ ('Fixed', fixed), ('Broken', broken),
+                                            ('Changed (still wrong)', changed) ]:
+        lines.append('')
+        lines.append('%s: %d' % (title, len(pairs)))
+        for b, d in pairs:
+            lines.append('\t'.join([ d['mgiid'], d['journal'], d['expected'],
+                                b['found'] or 'none', '->',
+                                d['found'] or d['error'] or 'none' ]))
+    return lines
+#-----------------------------------
+
+def getArgs():
+    parser = argparse.ArgumentParser( \
+        description='benchmark DoiFinder accuracy and speed over a corpus')
+
+    parser.add_argument('corpusPath', help="ExtractedTextCorpus path")
+
+    parser.add_argument('-w', '--workers', dest='workers', action='store',
+        required=False, default=4, type=int,
+        help='number of worker processes. Default 4')
+
+    parser.add_argument('--journal', dest='journal', action='store',
+        required=False, default=None, help='only this journal')
+
+    parser.add_argument('-y', '--year', dest='year', action='store',
+        required=False, default=None, type=int, help='publication year')
+
+    parser.add_argument('-l', '--limit', dest='limit', action='store',
+        required=False, default=0, type=int,
+        help='How many refs to test. Default 0 for no limit.')
+
+    parser.add_argument('--keepSupp', dest='keepSupp', action='store_true',
+        required=False, default=False,
+        help="don't remove MGI supplemental data from the texts")
+
+    parser.add_argument('--save', dest='saveFile', action='store',
+        required=False, default=None, help='save results to this json file')
+
+    parser.add_argument('--baseline', dest='baselineFile', action='store',
+        required=False, default=None,
+        help='compare results to baseline results in this json file')
+
+    return parser.parse_args()
+#-----------------------------------
+
+if __name__ == "__main__":
+    args = getArgs()
+
+    results = runBenchmark(args.corpusPath, workers=args.workers,
+                    journal=args.journal, year=args.year, limit=args.limit,
+                    removeSupp=not args.keepSupp)
+    print('\n'.join(getReport(results)))
+
+    if args.baselineFile:
+        baseline = CorpusBenchmark.loadResults(args.baselineFile)
+        print('')
+        print('\n'.join(getDiffReport(results, baseline)))
+
+    if args.saveFile:
+        CorpusBenchmark.saveResults(results, args.saveFile)
+        sys.stderr.write("Results saved to %s\n" % args.saveFile)
@@ -0,0 +1,434 @@
+"""
+Name:  ExtractedTextCorpus.py
+Purpose:
+    This module provides a local, file based store of extracted text for
+    offline bulk jobs (splitter reports, DOI finding tests, ...), so these
+    jobs don't have to hit the database or open one file per reference.
+
+    A corpus is two files:
+        <corpusPath>.dat - the texts, each one zlib compressed, appended one
+                            after the other
+        <corpusPath>.idx - a tab delimited index, one line per text, giving
+                            the reference IDs (_refs_key, PubMed ID, MGI ID,
+                            DOI ID), journal, year, the offset and length
+                            of the compressed text in the .dat file, and
+                            the text's page index (see PageIndex.py).
+                            The first line is a header naming the columns.
+
+    Both files are append only: adding texts to an existing corpus just
+    appends to them. If the same reference is added more than once, the
+    last one added wins when looking it up.
+
+    CorpusWriter - builds/appends to a corpus, e.g., from an ExtractedTextSet
+    CorpusReader - random access to texts by ID (via mmap of the .dat file)
+                    and sequential streaming of all the texts
+
+    Example:
+        import ExtractedTextCorpus
+        import extractedTextSplitter
+
+        reader = ExtractedTextCorpus.CorpusReader('/data/corpus/refs2020')
+        splitter = extractedTextSplitter.ExtTextSplitter()
+        for entry, text in reader.iterTexts(journal='Blood'):
+            sections = splitter.findSections(text)
+            ...
+        text = reader.getText(mgiID='MGI:6284584')
+
+    If run as a script, build a corpus from the database.
+    See ExtractedTextCorpus.py -h
+"""
+import os
+import sys
+import mmap
+import zlib
+import argparse
+import PageIndex
+
+DATA_SUFFIX = '.dat'
+INDEX_SUFFIX = '.idx'
+INDEX_FD = '\t'         # index field delimiter
+
+# index columns, in the order we write them
+INDEX_COLUMNS = [ 'refs_key', 'pubmed', 'mgiid', 'doi', 'journal', 'year',
+                    'offset', 'length', 'text_length', 'page_index', ]
+#-----------------------------------
+
+class CorpusEntry (object):
+    """
+    IS	an index entry describing one text in a corpus
+    HAS	reference IDs and metadata (all strings, '' if unknown),
+        offset and length of the compressed text in the .dat file,
+        the length of the (uncompressed) text, and its page index as a
+        PageIndex.toString() string ('' if not known)
+    """
+    def __init__(self,
+        refsKey='',
+        pubmedID='',
+        mgiID='',
+        doiID='',
+        journal='',
+        year='',
+        offset=0,
+        length=0,
+        textLength=0,
+        pageIndex='',
+        ):
+        self.refsKey    = _clean(refsKey)
+        self.pubmedID   = _clean(pubmedID)
+        self.mgiID      = _clean(mgiID)
+        self.doiID      = _clean(doiID)
+        self.journal    = _clean(journal)
+        self.year       = _clean(year)
+        self.offset     = int(offset)
+        self.length     = int(length)
+        self.textLength = int(textLength)
+        self.pageIndex  = pageIndex
+    #-----------------------------------
+
+    def toIndexLine(self):
+        return INDEX_FD.join([ self.refsKey, self.pubmedID, self.mgiID,
+                            self.doiID, self.journal, self.year,
+                            str(self.offset), str(self.length),
+                            str(self.textLength), self.pageIndex, ]) + '\n'
+    #-----------------------------------
+
+    @classmethod
+    def fromIndexLine(cls, columns, line):
+        """ Return a CorpusEntry for an index line, given the column names
+            from the index header line
+        """
+        values = dict(zip(columns, line.rstrip('\n').split(INDEX_FD)))
+        return cls(refsKey    = values.get('refs_key', ''),
+                   pubmedID   = values.get('pubmed', ''),
+                   mgiID      = values.get('mgiid', ''),
+                   doiID      = values.get('doi', ''),
+                   journal    = values.get('journal', ''),
+                   year       = values.get('year', ''),
+                   offset     = values.get('offset', 0),
+                   length     = values.get('length', 0),
+                   textLength = values.get('text_length', 0),
+                   pageIndex  = values.get('page_index', ''),
+                   )
+    #-----------------------------------
+
+    def __str__(self):
+        return "CorpusEntry: %s %s %s %s '%s' %s" % (self.refsKey,
+            self.pubmedID, self.mgiID, self.doiID, self.journal, self.year)
+# end class CorpusEntry -----------------------------------
+
+def _clean(value):
+    """ Return value as a string that is safe to write in the index
+    """
+    if value is None:
+        return ''
+    return str(value).replace(INDEX_FD, ' ').replace('\n', ' ').strip()
+#-----------------------------------
+
+class CorpusWriter (object):
+    """
+    IS	a writer that appends texts to a corpus
+    DOES addText(text, refsKey=..., pubmedID=..., ...) - append one text
+         addExtractedTextSet(ets, refRcds) - append the text for each
+            reference record from an ExtractedTextSet
+         close() - or use it as a context manager
+    """
+    def __init__(self,
+        corpusPath,		# path to corpus, w/o .dat/.idx suffix
+        compressLevel=6,	# zlib compression level
+        ):
+        self.corpusPath = corpusPath
+        self.compressLevel = compressLevel
+
+        indexPath = corpusPath + INDEX_SUFFIX
+        newIndex = not os.path.exists(indexPath) or \
+                                            os.path.getsize(indexPath) == 0
+
+        self.dataFp  = open(corpusPath + DATA_SUFFIX, 'ab')
+        self.indexFp = open(indexPath, 'a')
+        if newIndex:
+            self.indexFp.write(INDEX_FD.join(INDEX_COLUMNS) + '\n')
+        self.offset = self.dataFp.tell()
+        self.numWritten = 0
+    #-----------------------------------
+
+    def addText(self, text,
+        refsKey='',
+        pubmedID='',
+        mgiID='',
+        doiID='',
+        journal='',
+        year='',
+        ):
+        """ Append text to the corpus. Return its CorpusEntry.
+        """
+        data = zlib.compress(text.encode('utf-8'), self.compressLevel)
+        entry = CorpusEntry(refsKey=refsKey, pubmedID=pubmedID, mgiID=mgiID,
+                            doiID=doiID, journal=journal, year=year,
+                            offset=self.offset, length=len(data),
+                            textLength=len(text),
+                            pageIndex=PageIndex.fromText(text).toString())
+        self.dataFp.write(data)
+        self.indexFp.write(entry.toIndexLine())
+        self.offset += len(data)
+        self.numWritten += 1
+        return entry
+    #-----------------------------------
+
+    def addExtractedTextSet(self,
+        ets,			# an ExtractedTextSet
+        refRcds,		# list of reference records (dicts)
+        refKeyLabel='_refs_key',
+        pubmedLabel='pubmed',	# the other labels are optional fields
+        mgiLabel='mgiid',	#  in refRcds
+        doiLabel='doi',
+        journalLabel='journal',
+        yearLabel='year',
+        allowNoText=False,	# add refs w/ no extracted text as ''?
+        ):
+        """
+        For each reference record, append its extracted text from ets to
+            the corpus along with its IDs and metadata.
+        Return the number of texts added.
+        """
+        numAdded = 0
+        for r in refRcds:
+            refKey = r[refKeyLabel]
+            if not allowNoText and not ets.hasExtText(refKey):
+                continue
+            self.addText(ets.getExtText(refKey),
+                        refsKey  = refKey,
+                        pubmedID = r.get(pubmedLabel),
+                        mgiID    = r.get(mgiLabel),
+                        doiID    = r.get(doiLabel),
+                        journal  = r.get(journalLabel),
+                        year     = r.get(yearLabel),
+                        )
+            numAdded += 1
+        return numAdded
+    #-----------------------------------
+
+    def close(self):
+        self.dataFp.close()
+        self.indexFp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        self.close()
+        return False
+# end class CorpusWriter -----------------------------------
+
+class CorpusReader (object):
+    """
+    IS	a reader for a corpus
+    HAS	the index entries (in the order they were written) and dicts
+        mapping _refs_key, PubMed ID, MGI ID to entries
+    DOES getEntry(refsKey=, pubmedID=, mgiID=) - look up an entry
+         getText(...)  - get the text for an entry or an ID
+         getPageIndex(entry) - get the PageIndex for an entry's text
+         iterTexts()   - stream (entry, text) for all (or some) entries
+         Texts are read from an mmap of the .dat file, so random access does
+         not read the whole file and the OS page cache is shared by readers.
+    """
+    def __init__(self,
+        corpusPath,		# path to corpus, w/o .dat/.idx suffix
+        ):
+        self.corpusPath = corpusPath
+        self.entries = []
+        self.refsKey2Entry = {}
+        self.pubmed2Entry = {}
+        self.mgiID2Entry = {}
+        self._readIndex()
+
+        self.dataFp = open(corpusPath + DATA_SUFFIX, 'rb')
+        if os.path.getsize(corpusPath + DATA_SUFFIX) > 0:
+            self.data = mmap.mmap(self.dataFp.fileno(), 0,
+                                                    access=mmap.ACCESS_READ)
+        else:				# can't mmap an empty file
+            self.data = b''
+    #-----------------------------------
+
+    def _readIndex(self):
+        with open(self.corpusPath + INDEX_SUFFIX, 'r') as fp:
+            columns = fp.readline().rstrip('\n').split(INDEX_FD)
+            for line in fp:
+                entry = CorpusEntry.fromIndexLine(columns, line)
+                self.entries.append(entry)
+                if entry.refsKey:
+                    self.refsKey2Entry[entry.refsKey] = entry
+                if entry.pubmedID:
+                    self.pubmed2Entry[entry.pubmedID] = entry
+                if entry.mgiID:
+                    self.mgiID2Entry[entry.mgiID.upper()] = entry
+    #-----------------------------------
+
+    def getEntry(self, refsKey=None, pubmedID=None, mgiID=None):
+        """ Return the CorpusEntry for the specified ID or None
+        """
+        if refsKey is not None:
+            return self.refsKey2Entry.get(str(refsKey))
+        if pubmedID is not None:
+            return self.pubmed2Entry.get(str(pubmedID))
+        if mgiID is not None:
+            return self.mgiID2Entry.get(str(mgiID).upper())
+        return None
+    #-----------------------------------
+
+    def getText(self, entry=None, refsKey=None, pubmedID=None, mgiID=None):
+        """ Return the text for the entry or specified ID (or None if the
+            ID is not in the corpus)
+        """
+        if entry is None:
+            entry = self.getEntry(refsKey=refsKey, pubmedID=pubmedID,
+                                                                mgiID=mgiID)
+            if entry is None:
+                return None
+        data = self.data[entry.offset : entry.offset + entry.length]
+        return zlib.decompress(data).decode('utf-8')
+    #-----------------------------------
+
+    def getPageIndex(self, entry, text=None):
+        """ Return a PageIndex for the entry's text. Corpora written before
+            page indexes were stored compute it from the text (which is
+            read if not given).
+        """
+        if entry.pageIndex:
+            return PageIndex.PageIndex.fromString(entry.pageIndex)
+        if text is None:
+            text = self.getText(entry)
+        return PageIndex.fromText(text)
+    #-----------------------------------
+
+    def getEntries(self, journal=None, year=None):
+        """ Return the entries, optionally only for a journal and/or year,
+            in the order they are in the .dat file
+        """
+        entries = self.entries
+        if journal is not None:
+            entries = [ e for e in entries if e.journal == journal ]
+        if year is not None:
+            entries = [ e for e in entries if e.year == str(year) ]
+        return entries
+    #-----------------------------------
+
+    def iterTexts(self, journal=None, year=None):
+        """ Generate (entry, text) for the entries, optionally only for a
+            journal and/or year. Reads the .dat file sequentially.
+        """
+        for entry in self.getEntries(journal=journal, year=year):
+            yield entry, self.getText(entry)
+    #-----------------------------------
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def close(self):
+        if self.data:
+            self.data.close()
+        self.dataFp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        self.close()
+        return False
+# end class CorpusReader -----------------------------------
+
+
+#-----------------------------------
+# if run as a script, build a corpus from the database
+#-----------------------------------
+
+def getArgs():
+    parser = argparse.ArgumentParser( \
+        description='build an extracted text corpus from the database')
+
+    parser.add_argument('corpusPath',
+        help="corpus path (w/o suffix). Appends if the corpus exists")
+
+    parser.add_argument('-y', '--year', dest='year', action='store',
+        required=False, default=None, type=int, help='publication year')
+
+    parser.add_argument('--journal', dest='journal', action='store',
+        required=False, default=None, help='journal name')
+
+    parser.add_argument('-l', '--limit', dest='limit', action='store',
+        required=False, default=0, type=int,
+        help='How many refs to add. Default 0 for no limit.')
+
+    parser.add_argument('-t', '--types', dest='textTypes', action='store',
+        required=False, default=None,
+        help="comma separated text types to get, e.g., 'body'. Default: all")
+
+    parser.add_argument('-s', '--server', dest='server', action='store',
+        required=False, default='dev',
+        help='db server: prod, or dev (default)')
+
+    args =  parser.parse_args()
+
+    if args.server == 'prod':
+        args.host = 'bhmgidb01'
+        args.db = 'prod'
+    if args.server == 'dev':
+        args.host = 'bhmgidevdb01'
+        args.db = 'prod'
+
+    return args
+#-----------------------------------
+
+BUILD_REF_TMP_TABLE = '''
+    create temporary table tmp_corpus_refs
+    as
+    select r._refs_key, r.journal, r.year,
+        a.accid mgiid, a2.accid pubmed, a3.accid doi
+    from bib_refs r join acc_accession a on
+            (a._object_key = r._refs_key and a._logicaldb_key=1 -- mgi
+            and a._mgitype_key=1 and a.prefixpart='MGI:' )
+        left outer join acc_accession a2 on
+            (a2._object_key = r._refs_key and a2._logicaldb_key=29 -- pubmed
+            and a2._mgitype_key=1 )
+        left outer join acc_accession a3 on
+            (a3._object_key = r._refs_key and a3._logicaldb_key=65 -- doi
+            and a3._mgitype_key=1 )
+    where exists (select 1 from bib_workflow_data bd
+                    where bd._refs_key = r._refs_key
+                    and bd.extractedtext is not null)
+    '''
+
+if __name__ == "__main__":
+    import db as dbModule
+    import ExtractedTextSet
+
+    args = getArgs()
+    dbModule.set_sqlServer(args.host)
+    dbModule.set_sqlDatabase(args.db)
+    dbModule.set_sqlUser("mgd_public")
+    dbModule.set_sqlPassword("mgdpub")
+
+    query = BUILD_REF_TMP_TABLE
+    if args.year:
+        query += "and r.year = %d\n" % args.year
+    if args.journal:
+        query += "and r.journal = '%s'\n" % args.journal.replace("'", "''")
+    if args.limit:
+        query += "limit %d\n" % args.limit
+
+    textTypes = None
+    if args.textTypes:
+        textTypes = [ t.strip() for t in args.textTypes.split(',') ]
+
+    dbModule.sql([query,
+                'create index tmp_corpus_idx1 on tmp_corpus_refs(_refs_key)'],
+                'auto')
+    refRcds = dbModule.sql(['select * from tmp_corpus_refs'], 'auto')[-1]
+    ets = ExtractedTextSet.getExtractedTextSetForTable(dbModule,
+                                'tmp_corpus_refs', textTypes=textTypes)
+
+    with CorpusWriter(args.corpusPath) as writer:
+        numAdded = writer.addExtractedTextSet(ets, refRcds)
+    sys.stderr.write("%d texts added to %s\n" % (numAdded, args.corpusPath))
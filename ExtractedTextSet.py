@@ -18,13 +18,23 @@ Purpose:
     See ExtractedTextSet.py -h
 """
 import argparse
+from collections import OrderedDict
+import PageIndex
+
+# Lit Triage Extracted Text Section vocab
+EXTRACTED_TEXT_VOCAB_KEY = 142
 
 def getExtractedTextSet(db,             # an initialized db module
                         refKeyList,     # list of _ref_keys
+                        cacheMaxBytes=0,# see ExtractedTextSet
+                        textTypes=None, # list of text types to get,
+                                        #  None means all validTextTypes
     ):
     """
     Return an ExtractedTextSet for the references with the specified keys.
     Assumes refKeyList is small enough to format into a select statement.
+    If textTypes is given (e.g., ['body']), only those sections are pulled
+        from the database and assembled into the text.
     Example:
         import ExtractedTextSet
         import db
@@ -44,31 +54,59 @@ def getExtractedTextSet(db,             # an initialized db module
         from bib_workflow_data bd join voc_term t on
                             (bd._extractedtext_key = t._term_key)
         where bd._refs_key in ( %s )
-        ''' % ','.join([ str(r) for r in refKeyList ])
+        %s
+        ''' % (','.join([ str(r) for r in refKeyList ]),
+                _getTextTypeClause(textTypes, 'and'))
     results = db.sql([query], 'auto')
-    ets = ExtractedTextSet(results[-1])
+    ets = ExtractedTextSet(results[-1], cacheMaxBytes=cacheMaxBytes,
+                                                        textTypes=textTypes)
     return ets
 #-----------------------------------
 
 def getExtractedTextSetForTable(db,             # an initialized db module
                                 tmpTableName,   # (string) name of tmp table
+                                cacheMaxBytes=0,# see ExtractedTextSet
+                                textTypes=None, # list of text types to get,
+                                                #  None means all
     ):
     """
     Return an ExtractedTextSet for the references represented in a tmpTable
         in the database.
     The only requirement for the tmpTable is that it has a _refs_key field
     (ideally, it should have an index on this field too for efficiency)
+    If textTypes is given, only those sections are pulled from the database.
     """
     query = '''
         select r._refs_key, t.term "text_type", bd.extractedtext "text_part"
         from %s r join bib_workflow_data bd on (r._refs_key = bd._refs_key)
             join voc_term t on (bd._extractedtext_key = t._term_key)
-        ''' % tmpTableName
+        %s
+        ''' % (tmpTableName, _getTextTypeClause(textTypes, 'where'))
     results = db.sql([query], 'auto')
-    ets = ExtractedTextSet(results[-1])
+    ets = ExtractedTextSet(results[-1], cacheMaxBytes=cacheMaxBytes,
+                                                        textTypes=textTypes)
     return ets
 #-----------------------------------
 
+def _getTextTypeClause(textTypes,       # list of text types or None
+                        keyword,        # 'where' or 'and'
+    ):
+    """
+    Return the sql clause that restricts bib_workflow_data rows to the
+        specified text types, or '' if textTypes is None (all types).
+    The filter is on bd._extractedtext_key so the database never reads
+        the text of the sections we don't want.
+    """
+    if textTypes is None:
+        return ''
+    textTypes = ExtractedTextSet.checkTextTypes(textTypes)
+    return '''%s bd._extractedtext_key in
+            (select _term_key from voc_term
+            where _vocab_key = %d and term in (%s))
+        ''' % (keyword, EXTRACTED_TEXT_VOCAB_KEY,
+                    ','.join([ "'%s'" % t for t in textTypes ]))
+#-----------------------------------
+
 class ExtractedTextSet (object):
     """
     IS	a collection of extracted text records (from multiple references)
@@ -82,25 +120,58 @@ class ExtractedTextSet (object):
         full extracted text.
         (2) getExtText(refKey) - get the extracted text for a given _refs_key
         (3) join a set of basic reference records to their extracted text
+        (4) optionally caches assembled texts in a least recently used cache
+            bounded by the total size of the cached texts (cacheMaxBytes).
+            Size is measured in characters, which is close enough to bytes
+            for extracted text.
+        (5) optionally assembles only a subset of the text types (sections),
+            e.g., just 'body' (textTypes)
+        (6) getPageIndex(refKey) - PageIndex of the page breaks in the text,
+            built from the sections without assembling the text, and kept
+            with the text while it is in the cache
     """
     # from Vocab_key = 142 (Lit Triage Extracted Text Section vocab)
     # These are the expected values for the 'text_type' field.
+    # They are in the order the sections are concatenated into the full text
     validTextTypes = [ 'body', 'reference',
                         'author manuscript fig legends',
                         'star methods',
                         'supplemental', ]
     #-----------------------------------
 
+    @classmethod
+    def checkTextTypes(cls, textTypes):
+        """
+        Raise ValueError if any of textTypes is not a validTextType.
+        Return the textTypes in validTextTypes (concatenation) order.
+        """
+        for t in textTypes:
+            if t not in cls.validTextTypes:
+                raise ValueError("Invalid extracted text type: '%s'\n" % t)
+        return [ t for t in cls.validTextTypes if t in textTypes ]
+    #-----------------------------------
+
     def __init__(self,
         extTextRcds,		# list of rcds as above
         keyLabel='_refs_key',	# name of the reference key field
         typeLabel='text_type',	# name of the text type field
         textLabel='text_part',	# name of the text field
+        cacheMaxBytes=0,	# max total size of cached assembled texts,
+                                #  0 means no caching
+        textTypes=None,		# list of text types to assemble into the
+                                #  text, None means all validTextTypes.
+                                #  Rcds of other types are ignored.
         ):
         self.keyLabel  = keyLabel
         self.typeLabel = typeLabel
         self.textLabel = textLabel
         self.extTextRcds = extTextRcds
+        self.cacheMaxBytes = cacheMaxBytes
+        if textTypes is None:
+            self.textTypes = self.validTextTypes
+        else:
+            self.textTypes = self.checkTextTypes(textTypes)
+        self.clearCache()
         self._gatherExtText()
     #-----------------------------------
 
@@ -113,21 +184,100 @@ class ExtractedTextSet (object):
     def getExtText(self, refKey ):
         """ Return the text for refKey (or '' if there is no text)
         """
-        extTextDict = self.key2TextParts.get(str(refKey),{})
+        refKey = str(refKey)
+        if self.cacheMaxBytes:
+            text = self.textCache.get(refKey)
+            if text is not None:
+                self.textCache.move_to_end(refKey)	# most recently used
+                self.cacheHits += 1
+                return text
+            self.cacheMisses += 1
 
-        text =  extTextDict.get('body','') + \
-                extTextDict.get('reference', '') + \
-                extTextDict.get('author manuscript fig legends', '') + \
-                extTextDict.get('star methods', '') + \
-                extTextDict.get('supplemental', '')
+        extTextDict = self.key2TextParts.get(refKey,{})
+
+        text = ''.join([ extTextDict.get(t, '') for t in self.textTypes ])
+
+        if self.cacheMaxBytes:
+            self._cacheText(refKey, text)
         return text
     #-----------------------------------
 
+    def getExtTextLength(self, refKey ):
+        """ Return the length of the text for refKey without assembling it
+        """
+        extTextDict = self.key2TextParts.get(str(refKey),{})
+        return sum([ len(t) for t in extTextDict.values() ])
+    #-----------------------------------
+
+    def getExtTextHandle(self, refKey ):
+        """ Return an ExtTextHandle that assembles the text for refKey
+            only when it is asked for
+        """
+        return ExtTextHandle(self, refKey)
+    #-----------------------------------
+
+    def getPageIndex(self, refKey ):
+        """ Return a PageIndex for the text for refKey (see PageIndex.py)
+        """
+        refKey = str(refKey)
+        pageIndex = self.pageIndexCache.get(refKey)
+        if pageIndex is not None:
+            return pageIndex
+
+        pageIndex = PageIndex.PageIndex()
+        extTextDict = self.key2TextParts.get(refKey,{})
+        for t in self.textTypes:
+            pageIndex.addChunk(extTextDict.get(t, ''))
+
+        if refKey in self.textCache:	# keep it as long as the text
+            self.pageIndexCache[refKey] = pageIndex
+        return pageIndex
+    #-----------------------------------
+
+    def clearCache(self, ):
+        """ Empty the cache of assembled texts and reset its counters
+        """
+        self.textCache = OrderedDict()	# refKey -> text, oldest first
+        self.pageIndexCache = {}	# refKey -> PageIndex of cached texts
+        self.cacheBytes = 0		# total size of the cached texts
+        self.cacheHits = 0
+        self.cacheMisses = 0
+    #-----------------------------------
+
+    def getCacheStatistics(self, ):
+        """ Return a list of strings describing the cache performance so far
+        """
+        return [
+            'Cached texts:   %d' % len(self.textCache),
+            'Cached bytes:   %d (max %d)' % (self.cacheBytes,
+                                                        self.cacheMaxBytes),
+            'Cache hits:     %d' % self.cacheHits,
+            'Cache misses:   %d' % self.cacheMisses,
+            ]
+    #-----------------------------------
+
+    def _cacheText(self, refKey, text):
+        """
+        Add text to the cache, evicting the least recently used texts until
+        the cache fits in cacheMaxBytes.
+        A text bigger than the whole cache is not cached at all.
+        """
+        if len(text) > self.cacheMaxBytes:
+            return
+        self.textCache[refKey] = text
+        self.cacheBytes += len(text)
+        while self.cacheBytes > self.cacheMaxBytes:
+            oldKey, oldText = self.textCache.popitem(last=False)
+            self.pageIndexCache.pop(oldKey, None)
+            self.cacheBytes -= len(oldText)
+    #-----------------------------------
+
     def joinRefs2ExtText(self,
                         refRcds,
                         refKeyLabel='_refs_key',
                         extTextLabel='ext_text',
                         allowNoText=True,
+                        lazy=False,
         ):
         """
         Assume refRcds is a list of records { refKeyLabel : xxx, ...}
@@ -135,6 +285,9 @@ class ExtractedTextSet (object):
             so that the extracted text becomes part of the record.
         If allowNoText is False, then an exception is raised if a refRcd is
             found with no extracted text.
+        If lazy is True, the field is an ExtTextHandle instead of the text,
+            so the full text is only assembled when str(handle) or
+            handle.getText() is called (and is not kept in the record).
         """
         for r in refRcds:
             refKey = str(r[refKeyLabel])
@@ -142,7 +295,10 @@ class ExtractedTextSet (object):
             if not allowNoText and refKey not in self.key2TextParts:
                 raise ValueError("No extracted text found for '%s'\n" % \
                                                                     str(refKey))
-            r[extTextLabel] = self.getExtText(refKey)
+            if lazy:
+                r[extTextLabel] = self.getExtTextHandle(refKey)
+            else:
+                r[extTextLabel] = self.getExtText(refKey)
 
         return refRcds
     #-----------------------------------
@@ -166,6 +322,8 @@ class ExtractedTextSet (object):
             if textType not in self.validTextTypes:
                 raise ValueError("Invalid extracted text type: '%s'\n" % \
                                                                     textType)
+            if textType not in self.textTypes:	# section not wanted
+                continue
             if refKey not in resultDict:
                 resultDict[refKey] = {}
 
@@ -176,6 +334,29 @@ class ExtractedTextSet (object):
     #-----------------------------------
 # end class ExtractedTextSet -----------------------------------
 
+class ExtTextHandle (object):
+    """
+    IS	a lazy reference to the extracted text of one reference in an
+        ExtractedTextSet
+    DOES getText() (or str(handle)) - assemble and return the text.
+        The text is not held by the handle, so records joined with handles
+        only cost the memory of the section parts in the ExtractedTextSet
+        (plus whatever is in its cache).
+    """
+    def __init__(self, extTextSet, refKey):
+        self.extTextSet = extTextSet
+        self.refKey = str(refKey)
+
+    def getText(self):
+        return self.extTextSet.getExtText(self.refKey)
+
+    def __str__(self):
+        return self.getText()
+
+    def __len__(self):
+        return self.extTextSet.getExtTextLength(self.refKey)
+# end class ExtTextHandle -----------------------------------
+
 
 #-----------------------------------
 # if run as a script, write extracted text for a reference to stdout
@@ -188,6 +369,10 @@ def getArgs():
     parser.add_argument('ref_key', default=None,
         help="reference key to get extracted text for")
 
+    parser.add_argument('-t', '--types', dest='textTypes', action='store',
+        required=False, default=None,
+        help="comma separated text types to get, e.g., 'body'. Default: all")
+
     parser.add_argument('-s', '--server', dest='server', action='store',
         required=False, default='dev',
         help='db server: prod, or dev (default)')
@@ -214,6 +399,10 @@ if __name__ == "__main__":
     dbModule.set_sqlUser("mgd_public")
     dbModule.set_sqlPassword("mgdpub")
 
-    ets = getExtractedTextSet(dbModule, [args.ref_key])
+    textTypes = None
+    if args.textTypes:
+        textTypes = [ t.strip() for t in args.textTypes.split(',') ]
+
+    ets = getExtractedTextSet(dbModule, [args.ref_key], textTypes=textTypes)
     text = ets.getExtText(args.ref_key)
     print(text)
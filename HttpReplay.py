@@ -0,0 +1,248 @@
+"""
+Name:  HttpReplay.py
+Purpose:
+    A local stand-in for NCBI services (eutils, idconv, oa.fcgi) so the
+    agents (PubMedAgent, PubMedCentralAgent) can be tested and benchmarked
+    offline and repeatably.
+
+    Record: RecordingTransport makes the real requests (curl) and saves each
+    response in a cassette directory, one json file per request.
+    Replay: ReplayTransport serves the saved responses, with configurable
+    latency, a requests per second limit (answered with HTTP 429, like
+    eutils) and random 429 injection, so the governors' throughput and the
+    429 retry/backoff behavior can be measured.
+    ReplayServer serves the same responses over real HTTP on localhost,
+    for end to end runs through curl.
+
+    Cassette files are keyed on the URL (without its scheme or any api_key
+    parameter, which is never saved) and POST data.
+
+    Example:
+        # once, with network access
+        HttpRequestGovernor.setTransport(HttpReplay.RecordingTransport('cassettes'))
+        ... run the agents ...
+
+        # any time after, offline
+        replay = HttpReplay.ReplayTransport('cassettes', latency=0.2,
+                                            requestsPerSecond=3)
+        HttpRequestGovernor.setTransport(replay)
+        ... run the agents ...
+        print('\n'.join(replay.getStatistics()))
+"""
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+import http.server
+import HttpRequestGovernor
+
+# api_key parameter in a URL, not saved in cassettes
+API_KEY_RE = re.compile('([?&])api_key=[^&]*&?')
+
+RATE_LIMIT_BODY = '{"error":"API rate limit exceeded"}'
+#-----------------------------------
+
+def normalizeURL(url):
+    """ Return url without its scheme and api_key parameter
+    """
+    url = API_KEY_RE.sub(lambda m: m.group(1), url)
+    return HttpRequestGovernor.SCHEME_RE.sub('', url).rstrip('?&')
+#-----------------------------------
+
+def getCassetteKey(url, data=None):
+    """ Return the cassette file name (without .json) for a request
+    """
+    request = normalizeURL(url) + '\0' + (data or '')
+    return hashlib.sha1(request.encode('utf-8')).hexdigest()
+#-----------------------------------
+
+class Cassette (object):
+    """
+    IS	a directory of recorded responses
+    HAS	one json file per request: url, data, status, body
+    DOES get(url, data), put(url, data, status, body)
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _getPath(self, url, data):
+        return os.path.join(self.directory, getCassetteKey(url, data) + '.json')
+
+    def get(self, url, data=None):
+        """ Return (status, body) recorded for the request, or None
+        """
+        try:
+            with open(self._getPath(url, data), 'r') as fp:
+                rcd = json.load(fp)
+        except FileNotFoundError:
+            return None
+        return rcd['status'], rcd['body']
+
+    def put(self, url, data, status, body):
+        rcd = {'url': normalizeURL(url), 'data': data, 'status': status,
+                                                                'body': body}
+        with open(self._getPath(url, data), 'w') as fp:
+            json.dump(rcd, fp, indent=1)
+# end class Cassette -----------------------------------
+
+class RecordingTransport (object):
+    """
+    IS	a transport (see HttpRequestGovernor.setTransport()) that makes real
+        requests and records their responses in a Cassette
+    """
+    def __init__(self, directory,
+        transport=None,     # transport making the real requests,
+                            #  None = HttpRequestGovernor.curlTransport
+        ):
+        self.cassette = Cassette(directory)
+        self.transport = transport or HttpRequestGovernor.curlTransport
+        self.recorded = 0
+
+    def __call__(self, url, data=None):
+        status, body = self.transport(url, data)
+        if status == 200:       # don't record failures, rate limiting
+            self.cassette.put(url, data, status, body)
+            self.recorded += 1
+        return status, body
+# end class RecordingTransport -----------------------------------
+
+class ReplayTransport (object):
+    """
+    IS	a transport (see HttpRequestGovernor.setTransport()) that serves
+        recorded responses from a Cassette
+    HAS	latency, a requests per second limit and a 429 injection rate to
+        make it behave like the real service; statistics
+    DOES __call__(url, data) - return (status, body) for a request
+         getStatistics()
+    """
+    def __init__(self, directory,
+        latency=0.0,            # seconds each request takes
+        requestsPerSecond=0,    # more than this in any second gets HTTP 429,
+                                #  0 = no limit
+        inject429=0.0,          # fraction of other requests answered HTTP 429
+        seed=0,                 # for the 429 injection, for repeatable runs
+        ):
+        self.cassette = Cassette(directory)
+        self.latency = latency
+        self.requestsPerSecond = requestsPerSecond
+        self.inject429 = inject429
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.recentTimes = []   # times of the requests in the last second
+        self.requests = 0
+        self.served = 0
+        self.missing = 0        # requests with no recorded response
+        self.throttled = 0      # requests answered HTTP 429
+
+    def __call__(self, url, data=None):
+        with self.lock:
+            self.requests += 1
+            now = time.time()
+            self.recentTimes = [ t for t in self.recentTimes if t > now - 1.0 ]
+            self.recentTimes.append(now)
+            isThrottled = (self.requestsPerSecond and
+                            len(self.recentTimes) > self.requestsPerSecond) \
+                        or (self.inject429 and
+                            self.random.random() < self.inject429)
+            if isThrottled:
+                self.throttled += 1
+
+        if self.latency:
+            time.sleep(self.latency)
+        if isThrottled:
+            return 429, RATE_LIMIT_BODY
+
+        response = self.cassette.get(url, data)
+        with self.lock:
+            if response is None:
+                self.missing += 1
+            else:
+                self.served += 1
+        if response is None:
+            return 404, 'No recorded response for %s' % normalizeURL(url)
+        return response
+
+    def getStatistics(self):
+        """ Return list of strings describing the requests so far
+        """
+        return [
+            'Requests:         %d' % self.requests,
+            'Served:           %d' % self.served,
+            'Not recorded:     %d' % self.missing,
+            'Throttled (429):  %d' % self.throttled,
+            ]
+# end class ReplayTransport -----------------------------------
+
+class _ReplayHandler (http.server.BaseHTTPRequestHandler):
+    """ Serves requests for /<host/path?query of the original URL>
+    """
+    def _replay(self, data):
+        url = 'https://' + self.path.lstrip('/')
+        status, body = self.server.replay(url, data)
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._replay(None)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self._replay(self.rfile.read(length).decode('utf-8'))
+
+    def log_message(self, format, *args):
+        pass
+#-----------------------------------
+
+class ReplayServer (object):
+    """
+    IS	an HTTP server on localhost serving recorded responses (like
+        ReplayTransport, with the same options)
+    DOES start(), stop() (or use as a context manager)
+         getTransport() - a curl transport that sends requests for the real
+            URLs to this server instead
+    """
+    def __init__(self, directory, port=0, **replayOptions):
+        self.replay = ReplayTransport(directory, **replayOptions)
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', port),
+                                                            _ReplayHandler)
+        self.server.replay = self.replay
+        self.baseUrl = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread:
+            self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, excType, excValue, tb):
+        self.stop()
+        return False
+
+    def getURL(self, url):
+        """ Return the URL on this server for the real URL
+        """
+        return self.baseUrl + '/' + HttpRequestGovernor.SCHEME_RE.sub('', url)
+
+    def getTransport(self):
+        """ Return a transport that sends requests to this server (by curl)
+        """
+        return lambda url, data=None: \
+                    HttpRequestGovernor.curlTransport(self.getURL(url), data)
+# end class ReplayServer -----------------------------------
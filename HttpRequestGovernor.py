@@ -11,10 +11,46 @@
 #    then use the get() method to pass along the URL for the next request.  The governor keeps
 #    track of the various timings and will sleep until it's okay to issue another request.
 #    You can also ask the governor to report on its statistics so far.
+#    3. Requests have a priority (lane): INTERACTIVE requests (e.g., a curator waiting on a
+#    lookup) go ahead of any waiting BATCH requests, within the same rate limits. With
+#    interactiveReserve, a fraction of the per minute/hour/day limits is kept for INTERACTIVE
+#    requests, so bulk loads can never use up all of the capacity. The governor is thread
+#    safe; waiting requests are released one at a time, highest priority first.
+#    4. Different services (hosts/endpoints) have different limits.  Register a governor for
+#    each with registerGovernor(urlPrefix, governor), then make requests with governedGet(url):
+#    the governor with the longest matching prefix is used.  A governor can have a parent
+#    governor (e.g., one for the whole host) whose limits are shared by all of its children.
+#    5. fetchAll(urls, maxInFlight=N) makes requests from a pool of N threads, so the time
+#    spent waiting on the network overlaps, while the governors' limits still hold.
+#    6. governedGet() coalesces identical requests: if the same URL (and POST data) is already
+#    being requested by another thread at the same or a higher priority, it waits for and
+#    shares that response.  With the request memo on (setRequestMemo(), or a requestScope()
+#    block), responses are also remembered, so repeating a request during a run costs nothing.
+#    7. Requests are made by a transport, a function (url, data) -> (HTTP status, body).  The
+#    default, curlTransport(), uses curl; setTransport() swaps in another, e.g. the record and
+#    replay transports in HttpReplay.py for offline tests and benchmarks.  setRetryOn429()
+#    makes governors retry requests the server rate limits (HTTP 429), with backoff.
+#    8. simulate(requestCount) (or simulate(arrivals=[...])) works out, on a virtual clock,
+#    how long a number of requests would take under a governor's limits and which limit is
+#    the binding one, for planning backfills.  formatSimulation() reports the results.
+#    9. getStatistics() reports on the requests so far as text; getMetrics() gives the same and
+#    more as a dict (getMetricsJson(), dumpMetrics() as json): wait and response time
+#    percentiles and histograms, bytes transferred, HTTP status/error/429 counts, utilization
+#    of each limit, per lane stats, and a time series of snapshots taken every
+#    snapshotSeconds.
 
+import re
+import json
 import time
+import heapq
+import bisect
+import collections
+import threading
+import contextlib
+import concurrent.futures
 import urllib.request, urllib.error, urllib.parse
 import subprocess
+import Instrumentation
 
 # constants for convenience
 SECONDS_PER_MINUTE = 60.0
@@ -27,22 +63,379 @@ DEFAULT_PER_MINUTE = 8      # max requests per minute
 DEFAULT_PER_HOUR = 280      # max requests per hour
 DEFAULT_PER_DAY = 6700      # max requests per day
 
-def readURL (url):
-    # Purpose: given constraints on reading from https connections in python 2.7, we're just going
-    #    to shell out and use curl for this
-    # Returns: str.returned
+# names of the limits (see simulate())
+PER_REQUEST = 'per request'
+PER_MINUTE = 'per minute'
+PER_HOUR = 'per hour'
+PER_DAY = 'per day'
+
+# upper bounds (seconds) of the wait and response time histogram buckets (see getMetrics()),
+# the last bucket is everything longer
+HISTOGRAM_BUCKETS = [ 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0 ]
+
+# default seconds between time series snapshots, max number of snapshots kept
+DEFAULT_SNAPSHOT_SECONDS = 60
+MAX_SNAPSHOTS = 1440
+
+# number of the most recent wait/response times kept (per kind, per lane) for percentiles;
+# counts, means, maxes and histograms cover all of them
+MAX_TIMES_KEPT = 10000
+
+# request priorities (lanes), lower number = higher priority
+INTERACTIVE = 0
+BATCH = 1
+LANE_NAMES = { INTERACTIVE : 'interactive', BATCH : 'batch' }
+
+# retrying requests the server rate limits (HTTP 429), see setRetryOn429()
+RETRY_429_MAX = 0           # max retries per request, 0 = don't retry
+RETRY_429_BACKOFF = 1.0     # seconds to wait before the first retry, doubled for each retry
+
+def curlTransport (url, data = None):
+    # Purpose: the default transport: given constraints on reading from https connections in
+    #    python 2.7, we're just going to shell out and use curl for this
+    # Returns: (HTTP status code (int, 0 if there was no response), response body str)
+    # Notes: if 'data' (str) is given, it is sent as the body of a POST request (for requests
+    #    too long to fit in a URL, e.g., Entrez EPost of many IDs)
+
+    if data is None:
+        stdout = subprocess.run("curl -s --write-out '\\n%%{http_code}' '%s'" % url, shell=True,
+                                                text=True, capture_output=True).stdout
+    else:
+        stdout = subprocess.run("curl -s --data-binary @- --write-out '\\n%%{http_code}' '%s'" % url,
+                                shell=True, text=True, input=data, capture_output=True).stdout
+
+    body, sep, status = stdout.rpartition('\n')
+    try:
+        return int(status), body
+    except ValueError:
+        return 0, stdout
+
+_transport = curlTransport
+_lastStatus = threading.local()     # HTTP status of the last request made by this thread
+
+def setTransport (transport = None):
+    # Purpose: make all requests with 'transport', a function (url, data) -> (HTTP status,
+    #    body).  None = curlTransport()
+    global _transport
+    _transport = transport or curlTransport
+
+def getTransport ():
+    return _transport
+
+def setRetryOn429 (maxRetries = 3, backoff = 1.0):
+    # Purpose: have governors retry a request up to 'maxRetries' times if the server answers
+    #    HTTP 429 (too many requests), waiting 'backoff' seconds before the first retry and
+    #    twice as long before each one after that.  maxRetries = 0 turns retrying off.
+    global RETRY_429_MAX, RETRY_429_BACKOFF
+    RETRY_429_MAX = maxRetries
+    RETRY_429_BACKOFF = backoff
+
+def requestURL (url, data = None):
+    # Purpose: make a request using the transport
+    # Returns: (HTTP status code, response body str)
+    # Throws: Exception if the transport does
+    status, body = _transport(url, data)
+    _lastStatus.value = status
+    if status == 429:
+        Instrumentation.count('HttpRequestGovernor.http429')
+    return status, body
+
+def getLastStatus ():
+    # Returns: HTTP status of the last request this thread made, None if none
+    return getattr(_lastStatus, 'value', None)
+
+def readURL (url, data = None):
+    # Purpose: make a request using the transport (curl by default)
+    # Returns: str.returned (the response body, whatever the HTTP status)
     # Throws: Exception if we have problems reading from 'url'
+    # Notes: if 'data' (str) is given, it is sent as the body of a POST request
+
+    return requestURL(url, data)[1]
+
+# governors by URL prefix (host + path, no scheme); see registerGovernor()
+_registry = {}
+_registryLock = threading.Lock()
+
+# matches the scheme at the start of a URL
+SCHEME_RE = re.compile('^[a-zA-Z][a-zA-Z0-9+.-]*://')
+
+def registerGovernor (prefix, governor):
+    # Purpose: use 'governor' for requests (via governedGet()) whose URL starts with 'prefix'
+    #    (host and optionally path, without the scheme, e.g. 'eutils.ncbi.nlm.nih.gov/').
+    #    Replaces any governor already registered for 'prefix'.
+    with _registryLock:
+        _registry[SCHEME_RE.sub('', prefix)] = governor
+
+def unregisterGovernor (prefix):
+    # Purpose: stop using the governor registered for 'prefix'
+    with _registryLock:
+        _registry.pop(SCHEME_RE.sub('', prefix), None)
+
+def getGovernors ():
+    # Returns: dict {prefix : governor} of the registered governors
+    with _registryLock:
+        return dict(_registry)
+
+def getGovernor (url):
+    # Returns: the registered governor with the longest prefix matching 'url', or None
+    url = SCHEME_RE.sub('', url)
+    best = None
+    with _registryLock:
+        for prefix, governor in _registry.items():
+            if url.startswith(prefix) and (best is None or len(prefix) > len(best[0])):
+                best = (prefix, governor)
+    return best and best[1]
+
+# requests being made now, for coalescing: (url, data) -> {priority : _PendingRequest}
+_inFlight = {}
+_inFlightLock = threading.Lock()
+
+# remembered responses, (url, data) -> response string; None = memo is off
+_memo = None
+
+# per thread: .memo = the memo of the requestScope() the thread is in (not set = none)
+_scope = threading.local()
+
+class _PendingRequest:
+    # Is: (private) a request being made by one thread that other threads are waiting on
+    def __init__ (self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+        self.remembered = False     # True if the response can be remembered (a 200)
+
+def setRequestMemo (on = True):
+    # Purpose: turn the request memo on (remember governedGet() responses for the rest of the
+    #    run, or until clearRequestMemo()) or off (and forget them)
+    global _memo
+    with _inFlightLock:
+        if not on:
+            _memo = None
+        elif _memo is None:
+            _memo = {}
+
+def clearRequestMemo ():
+    # Purpose: forget the remembered responses (the memo stays on if it is on)
+    with _inFlightLock:
+        if _memo is not None:
+            _memo.clear()
+
+def _getMemo ():
+    # Purpose: (private) get the memo for this thread: its requestScope()'s, else the
+    #    process-wide one (None if the memo is off)
+    return getattr(_scope, 'memo', _memo)
+
+def _setScopeMemo (memo):
+    # Purpose: (private) set this thread's requestScope() memo (None = off, if 'memo' is
+    #    _memo's value, the thread just uses the process-wide memo)
+    if memo is _memo:
+        if hasattr(_scope, 'memo'):
+            del _scope.memo
+    else:
+        _scope.memo = memo
+
+@contextlib.contextmanager
+def requestScope ():
+    # Purpose: context manager: responses are remembered within the 'with' block and
+    #    forgotten at its end, e.g.
+    #        with HttpRequestGovernor.requestScope():
+    #            ... load a batch of references ...
+    # Notes: the scope is per thread: other threads (apart from fetchAll()'s, which share
+    #    their caller's scope) are not affected, so threads can each have their own scope.
+    hadScope = hasattr(_scope, 'memo')
+    saved = getattr(_scope, 'memo', None)
+    _scope.memo = {}
+    try:
+        yield
+    finally:
+        if hadScope:
+            _scope.memo = saved
+        else:
+            del _scope.memo
+
+def governedGet (url, data = None, priority = BATCH):
+    # Purpose: make a request through the governor registered for 'url' (see getGovernor()).
+    #    URLs with no governor are read right away.  An identical request already being made
+    #    at the same or a higher priority (or remembered, see setRequestMemo()) is shared
+    #    instead of being made again.  (An INTERACTIVE request doesn't wait on a BATCH
+    #    request's place in the queue.)
+    # Returns: response string
+    # Throws: Exception if there are problems reading from url
+    key = (url, data)
+    with _inFlightLock:
+        memo = _getMemo()
+        if memo is not None and key in memo:
+            Instrumentation.count('HttpRequestGovernor.memoHits')
+            return memo[key]
+        lanes = _inFlight.setdefault(key, {})
+        joinable = [ p for p in lanes if p <= priority ]
+        isOwner = not joinable
+        if isOwner:
+            pending = lanes[priority] = _PendingRequest()
+        else:
+            pending = lanes[min(joinable)]
+
+    if not isOwner:
+        Instrumentation.count('HttpRequestGovernor.coalesced')
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        with _inFlightLock:
+            if memo is not None and pending.remembered:
+                memo[key] = pending.response
+        return pending.response
+
+    try:
+        governor = getGovernor(url)
+        if governor is None:
+            Instrumentation.count('HttpRequestGovernor.ungoverned')
+            pending.response = readURL(url, data)
+        else:
+            pending.response = governor.get(url, data, priority)
+    except Exception as e:
+        pending.error = e
+        raise
+    finally:
+        with _inFlightLock:
+            del _inFlight[key][priority]
+            if not _inFlight[key]:
+                del _inFlight[key]
+            pending.remembered = bool(pending.response) and getLastStatus() in (None, 200)
+            if memo is not None and pending.remembered:
+                memo[key] = pending.response
+        pending.done.set()
+    return pending.response
+
+def fetchAll (urls,                 # list of URLs to request
+            maxInFlight = 4,        # max number of requests outstanding at once
+            priority = BATCH,       # governor lane for the requests
+            governor = None         # governor to use, None = the registered ones (governedGet())
+            ):
+    # Purpose: request all the URLs, up to 'maxInFlight' at a time (each in its own thread),
+    #    within the governors' limits
+    # Returns: list of (response string, None) or (None, Exception) for each URL, in the
+    #    same order as 'urls'
+    # Throws: nothing; errors are returned per URL
+
+    if governor is None:
+        fetch = lambda url: governedGet(url, priority = priority)
+    else:
+        fetch = lambda url: governor.get(url, priority = priority)
+
+    def fetchOne (url):
+        try:
+            return (fetch(url), None)
+        except Exception as e:
+            return (None, e)
+
+    if maxInFlight <= 1 or len(urls) <= 1:
+        return [ fetchOne(url) for url in urls ]
+
+    with concurrent.futures.ThreadPoolExecutor(min(maxInFlight, len(urls)),
+                        initializer = _setScopeMemo, initargs = (_getMemo(),)) as executor:
+        return list(executor.map(fetchOne, urls))
+
+class _TimeSummary:
+    # Is: (private) a running summary of times (seconds): the count, total, max and
+    #    histogram of all of them, and the last MAX_TIMES_KEPT for the percentiles, so
+    #    memory and the cost of summarizing stay bounded however many requests we make
+    def __init__ (self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.counts = [ 0 ] * (len(HISTOGRAM_BUCKETS) + 1)     # per histogram bucket
+        self.recent = collections.deque(maxlen = MAX_TIMES_KEPT)
+
+    def add (self, value):
+        self.count = self.count + 1
+        self.total = self.total + value
+        self.max = max(self.max, value)
+        i = bisect.bisect_left(HISTOGRAM_BUCKETS, value)
+        self.counts[i] = self.counts[i] + 1
+        self.recent.append(value)
+
+    def getSummary (self):
+        # Returns: dict, see summarizeTimes()
+        recent = sorted(self.recent)
+        return {
+            'count' : self.count,
+            'mean'  : self.total / self.count if self.count else 0.0,
+            'p50'   : Instrumentation.percentile(recent, 50),
+            'p95'   : Instrumentation.percentile(recent, 95),
+            'p99'   : Instrumentation.percentile(recent, 99),
+            'max'   : self.max,
+            'histogram' : [ { 'le' : bound, 'count' : k } for bound, k in
+                                        zip(HISTOGRAM_BUCKETS + [ None ], self.counts) ],
+            }
+
+def summarizeTimes (values):
+    # Purpose: summarize a list of times (seconds)
+    # Returns: dict {'count', 'mean', 'p50', 'p95', 'p99', 'max',
+    #    'histogram' : [ {'le' : bucket upper bound (None = no bound), 'count' : n}, ... ]}
+    #    (percentiles are of the last MAX_TIMES_KEPT values)
+    summary = _TimeSummary()
+    for value in values:
+        summary.add(value)
+    return summary.getSummary()
+
+def formatHistogram (summary):
+    # Purpose: get a summarizeTimes() histogram as one line of text (non-empty buckets only)
+    buckets = []
+    for bucket in summary['histogram']:
+        if bucket['count']:
+            if bucket['le'] is None:
+                buckets.append('>%gs: %d' % (HISTOGRAM_BUCKETS[-1], bucket['count']))
+            else:
+                buckets.append('<=%gs: %d' % (bucket['le'], bucket['count']))
+    return ', '.join(buckets)
+
+def getAllMetrics ():
+    # Returns: dict {prefix : getMetrics()} for the registered governors
+    return dict([ (prefix, governor.getMetrics()) for prefix, governor in getGovernors().items() ])
 
-    stdout = subprocess.run("curl '%s'" % url, shell=True, text=True,
-                                                    capture_output=True).stdout
-    return stdout
+def formatDuration (seconds):
+    # Returns: 'seconds' as a string: [<days>d ]hh:mm:ss
+    seconds = int(round(seconds))
+    days, seconds = divmod(seconds, int(SECONDS_PER_DAY))
+    text = '%02d:%02d:%02d' % (seconds // 3600, (seconds % 3600) // 60, seconds % 60)
+    if days:
+        text = '%dd %s' % (days, text)
+    return text
 
+def formatSimulation (result):
+    # Purpose: get report lines for the results of HttpRequestGovernor.simulate()
+    lines = [
+        'Requests:             %d' % result['requests'],
+        'Estimated completion: %s' % formatDuration(result['completion_seconds']),
+        'Requests per hour:    %.1f' % result['requests_per_hour'],
+        'Wait mean/p99/max:    %.3f / %.3f / %.3f sec' % (result['mean_wait_seconds'],
+                            result['p99_wait_seconds'], result['max_wait_seconds']),
+        'Binding constraint:   %s' % (', '.join(result['binding_constraints']) or
+                                        'none (requests arrive slower than the limits)'),
+        '%-20s %12s %15s' % ('Limit', 'utilization', 'time held back'),
+        ]
+    for name, u in sorted(result['utilization'].items(), key = lambda x: -x[1]):
+        lines.append('%-20s %11.1f%% %15s' % (name, 100.0 * u,
+                                    formatDuration(result['delay_seconds'].get(name, 0.0))))
+    lines.append('Binding constraint over time:')
+    for phase in result['phases']:
+        lines.append('    %12s - %12s: %-30s (%d requests)' % (
+                formatDuration(phase['start_seconds']), formatDuration(phase['end_seconds']),
+                phase['constraint'], phase['requests']))
+    return lines
 
 class HttpRequestGovernor:
     def __init__ (self, secPerRequest = DEFAULT_PER_REQUEST,   # min seconds since last request
             requestsPerMinute = DEFAULT_PER_REQUEST,           # max requests per minute
             requestsPerHour = DEFAULT_PER_HOUR,                # max requests per hour
-            requestsPerDay = DEFAULT_PER_DAY                   # max requests per day
+            requestsPerDay = DEFAULT_PER_DAY,                  # max requests per day
+            interactiveReserve = 0.0,                          # fraction of the per minute/hour/day
+                                                               #   limits only INTERACTIVE requests
+                                                               #   may use
+            parent = None,                                     # governor whose limits are shared
+                                                               #   with other governors (e.g., one
+                                                               #   per host), None for no parent
+            snapshotSeconds = DEFAULT_SNAPSHOT_SECONDS         # seconds between metrics snapshots
             ):
         # Purpose: constructor
         # Notes: If you don't need a limit for any of the parameters, set it to be 0.  The
@@ -52,100 +445,487 @@ class HttpRequestGovernor:
         self.requestsPerMinute = requestsPerMinute
         self.requestsPerHour = requestsPerHour
         self.requestsPerDay = requestsPerDay
+        self.interactiveReserve = interactiveReserve
+        self.parent = parent
 
         self.lastRequestTime = None             # time (in seconds) at which last request was made
-        self.requestsThisMinute = []            # times (in seconds) of requests in the last minute
-        self.requestsThisHour = []              # times (in seconds) of requests in the last hour
-        self.requestsThisDay = []               # times (in seconds) of requests in the last day
-        self.timesWaited = []                   # list of times slept (in seconds)
+        self.requestsThisMinute = collections.deque()   # times (in seconds) of requests in the last minute
+        self.requestsThisHour = collections.deque()     # times (in seconds) of requests in the last hour
+        self.requestsThisDay = collections.deque()      # times (in seconds) of requests in the last day
+        self.timesWaited = _TimeSummary()       # times slept (in seconds)
         self.requestCount = 0                   # number of requests so far
+
+        self.condition = threading.Condition()  # protects all of the above, wakes waiting requests
+        self.waiting = []                       # heap of (priority, sequence #) of waiting requests
+        self.sequence = 0                       # for first come first served within a priority
+        self.laneWaits = {}                     # priority -> _TimeSummary of seconds waited
+        self.laneLatencies = {}                 # priority -> _TimeSummary of seconds waited +
+                                                #   request time
+
+        # metrics (see getMetrics())
+        self.responseTimes = _TimeSummary()     # seconds each request took
+        self.bytesSent = 0
+        self.bytesReceived = 0
+        self.statusCounts = {}                  # HTTP status -> number of responses
+        self.errorCount = 0                     # requests failing or answered with an HTTP error
+        self.retryCount = 0                     # requests retried after HTTP 429
+        self.peakUtilization = {}               # limit name -> highest utilization seen
+        self.snapshotSeconds = snapshotSeconds
+        self.snapshots = collections.deque(maxlen = MAX_SNAPSHOTS)
+        self.lastSnapshot = { 'time' : time.time(), 'bytesSent' : 0, 'bytesReceived' : 0,
+                                'errors' : 0, 'http429' : 0 }
+        self.intervalWaits = _TimeSummary()     # times since the last snapshot
+        self.intervalResponses = _TimeSummary()
         return
     
     def _trimBefore (self, timeList, startTime):
-        # Purpose: (private) remove any items from timeList that occurred before 'startTime'
-        # Returns: sublist of 'timeList' that contains items no older than 'startTime', ordered
+        # Purpose: (private) remove any items from timeList (a deque) that occurred before
+        #    'startTime'
+        # Returns: 'timeList', now containing only items no older than 'startTime', ordered
         #    from oldest to newest
         # Assumes: 'timeList' is ordered from oldest to newest
         
-        listLength = len(timeList)
-        i = 0
-        while (i < listLength) and (timeList[i] < startTime):
-            i = i + 1
-        return timeList[i:]
+        while timeList and (timeList[0] < startTime):
+            timeList.popleft()
+        return timeList
 
-    def getWaitTime (self):
-        # Purpose: get the amount of time that we need to wait before making the next request
-        # Returns: float number of milliseconds
-        # Throws: nothing
-        # Notes: This method is needed internally, but is also made available externally in
-        #    case you'd like the information for some reason.  You don't need to do anything
-        #    with it, unless you'd like your script to do something in the meantime, rather
-        #    than just going to sleep with a call to get().
+    def _getLimit (self, limit, priority):
+        # Purpose: (private) the part of a per minute/hour/day 'limit' requests of 'priority'
+        #    may use (all of it for INTERACTIVE, less the reserve for lower priorities)
+        if priority <= INTERACTIVE or not limit:
+            return limit
+        return max(1, int(limit * (1.0 - self.interactiveReserve)))
+
+    def _computeWaitTimes (self, now, priority):
+        # Purpose: (private) get the time a request of 'priority' needs to wait from 'now' for
+        #    each limit
+        # Returns: dict {limit name : float number of seconds}, only limits that make us wait
         
-        waitTime = 0.0
-        now = time.time()
+        waitTimes = {}
         
-        if self.lastRequestTime:
+        if self.lastRequestTime is not None:
             if self.secondsPerRequest > 0.0:
                 if (now - self.lastRequestTime) < self.secondsPerRequest:
-                    waitTime = self.secondsPerRequest - (now - self.lastRequestTime)
+                    waitTimes[PER_REQUEST] = self.secondsPerRequest - (now - self.lastRequestTime)
             
-            if self.requestsPerMinute:
-                minuteAgo = now - SECONDS_PER_MINUTE
-                self.requestsThisMinute = self._trimBefore(self.requestsThisMinute, minuteAgo)
+            for name, maxRequests, timeList, seconds in [
+                    (PER_MINUTE, self.requestsPerMinute, self.requestsThisMinute, SECONDS_PER_MINUTE),
+                    (PER_HOUR, self.requestsPerHour, self.requestsThisHour, SECONDS_PER_HOUR),
+                    (PER_DAY, self.requestsPerDay, self.requestsThisDay, SECONDS_PER_DAY) ]:
+                if maxRequests:
+                    self._trimBefore(timeList, now - seconds)
+                    limit = self._getLimit(maxRequests, priority)
+
+                    if len(timeList) >= limit:
+                        waitTime = (timeList[-limit] + seconds) - now
+                        if waitTime > 0.0:
+                            waitTimes[name] = waitTime
+
+        return waitTimes
+
+    def _computeWaitTime (self, now, priority):
+        # Purpose: (private) get the time a request of 'priority' needs to wait from 'now'
+        # Returns: float number of seconds
+        return max(self._computeWaitTimes(now, priority).values(), default = 0.0)
 
-                if len(self.requestsThisMinute) > self.requestsPerMinute:
-                    waitTime = max(waitTime, (self.requestsThisMinute[0] + SECONDS_PER_MINUTE) - now)
+    def _recordRequest (self, requestTime):
+        # Purpose: (private) record that a request is made at 'requestTime'
+        self.lastRequestTime = requestTime
+        self.requestsThisMinute.append(requestTime)
+        self.requestsThisHour.append(requestTime)
+        self.requestsThisDay.append(requestTime)
 
-            if self.requestsPerHour:
-                hourAgo = now - SECONDS_PER_HOUR
-                self.requestsThisHour = self._trimBefore(self.requestsThisHour, hourAgo)
+        for name, maxRequests, timeList in self._getWindows():
+            utilization = len(timeList) / float(maxRequests)
+            if utilization > self.peakUtilization.get(name, 0.0):
+                self.peakUtilization[name] = utilization
 
-                if len(self.requestsThisHour) > self.requestsPerHour:
-                    waitTime = max(waitTime, (self.requestsThisHour[0] + SECONDS_PER_HOUR) - now)
+    def _getWindows (self):
+        # Purpose: (private) get the per minute/hour/day limits we have
+        # Returns: list of (limit name, max requests, deque of request times in the window)
+        return [ (name, maxRequests, timeList) for name, maxRequests, timeList in [
+                    (PER_MINUTE, self.requestsPerMinute, self.requestsThisMinute),
+                    (PER_HOUR, self.requestsPerHour, self.requestsThisHour),
+                    (PER_DAY, self.requestsPerDay, self.requestsThisDay) ] if maxRequests ]
 
-            if self.requestsPerDay:
-                dayAgo = now - SECONDS_PER_DAY
-                self.requestsThisDay = self._trimBefore(self.requestsThisDay, dayAgo)
+    def _getUtilization (self, now):
+        # Purpose: (private) get how much of each per minute/hour/day limit is used as of 'now'
+        # Returns: dict {limit name : fraction of the limit used}
+        utilization = {}
+        for name, maxRequests, timeList in self._getWindows():
+            seconds = { PER_MINUTE : SECONDS_PER_MINUTE, PER_HOUR : SECONDS_PER_HOUR,
+                        PER_DAY : SECONDS_PER_DAY }[name]
+            self._trimBefore(timeList, now - seconds)
+            utilization[name] = len(timeList) / float(maxRequests)
+        return utilization
 
-                if len(self.requestsThisDay) > self.requestsPerDay:
-                    waitTime = max(waitTime, (self.requestsThisDay[0] + SECONDS_PER_DAY) - now)
+    def _recordResponse (self, seconds, status, bytesSent, bytesReceived):
+        # Purpose: (private) record the metrics for a response ('status' None = the request failed)
+        self.responseTimes.add(seconds)
+        self.intervalResponses.add(seconds)
+        self.bytesSent = self.bytesSent + bytesSent
+        self.bytesReceived = self.bytesReceived + bytesReceived
+        if status is not None:
+            self.statusCounts[status] = self.statusCounts.get(status, 0) + 1
+        if status is None or status == 0 or (status >= 400 and status != 429):
+            self.errorCount = self.errorCount + 1
 
-        self.lastRequestTime = now + waitTime
-        self.requestsThisMinute.append(self.lastRequestTime)
-        self.requestsThisHour.append(self.lastRequestTime)
-        self.requestsThisDay.append(self.lastRequestTime)
+        now = time.time()
+        if now - self.lastSnapshot['time'] >= self.snapshotSeconds:
+            self._takeSnapshot(now)
+
+    def _takeSnapshot (self, now):
+        # Purpose: (private) add a time series snapshot of the metrics since the last one
+        last = self.lastSnapshot
+        current = { 'time' : now, 'bytesSent' : self.bytesSent,
+                    'bytesReceived' : self.bytesReceived, 'errors' : self.errorCount,
+                    'http429' : self.statusCounts.get(429, 0) }
+        waits = self.intervalWaits.getSummary()
+        responseTimes = self.intervalResponses.getSummary()
+        self.snapshots.append({
+            'time'           : now,
+            'seconds'        : now - last['time'],
+            'requests'       : waits['count'],
+            'wait_p50'       : waits['p50'],
+            'wait_p99'       : waits['p99'],
+            'response_p50'   : responseTimes['p50'],
+            'response_p99'   : responseTimes['p99'],
+            'bytes_sent'     : current['bytesSent'] - last['bytesSent'],
+            'bytes_received' : current['bytesReceived'] - last['bytesReceived'],
+            'errors'         : current['errors'] - last['errors'],
+            'http429'        : current['http429'] - last['http429'],
+            'utilization'    : self._getUtilization(now),
+            })
+        self.lastSnapshot = current
+        self.intervalWaits = _TimeSummary()
+        self.intervalResponses = _TimeSummary()
+
+    def takeSnapshot (self):
+        # Purpose: add a time series snapshot now (they are also taken every snapshotSeconds
+        #    as requests are made)
+        with self.condition:
+            self._takeSnapshot(time.time())
 
+    def getWaitTime (self, priority = BATCH):
+        # Purpose: get the amount of time that we need to wait before making the next request
+        # Returns: float number of seconds
+        # Throws: nothing
+        # Notes: This method is needed internally, but is also made available externally in
+        #    case you'd like the information for some reason.  You don't need to do anything
+        #    with it, unless you'd like your script to do something in the meantime, rather
+        #    than just going to sleep with a call to get().  The next request slot is counted
+        #    as used.
+        
+        with self.condition:
+            now = time.time()
+            waitTime = self._computeWaitTime(now, priority)
+            self._recordRequest(now + waitTime)
         return waitTime
-    
-    def get (self, url):
+
+    def _waitForTurn (self, priority):
+        # Purpose: (private) wait until it is the turn of a request of 'priority': there are
+        #    no waiting requests of higher priority (or of the same priority that came first)
+        #    and the rate limits allow it.  Then, still holding our turn, wait for our
+        #    parent's turn, and record the request when it can actually be made.
+        # Returns: float number of seconds waited (for us and our parent)
+        # Notes: the request is recorded after the parent's wait, so a parent kept busy by
+        #    other governors can't make our next request measure from a time before this
+        #    one was really made.  Holding our turn meanwhile keeps our other requests back,
+        #    and our own limits only ease as time passes.
+        
+        startTime = time.time()
+        with self.condition:
+            ticket = (priority, self.sequence)
+            self.sequence = self.sequence + 1
+            heapq.heappush(self.waiting, ticket)
+            self.condition.notify_all()     # a waiting lower priority request may be behind us now
+            try:
+                while True:
+                    if self.waiting[0] == ticket:
+                        waitTime = self._computeWaitTime(time.time(), priority)
+                        if waitTime <= 0.0:
+                            break
+                        self.condition.wait(waitTime)
+                    else:
+                        self.condition.wait()
+            except:
+                self._endTurn(ticket)
+                raise
+
+        try:
+            if self.parent is not None:
+                self.parent._waitForTurn(priority)
+        except:
+            with self.condition:
+                self._endTurn(ticket)
+            raise
+
+        with self.condition:
+            now = time.time()
+            self._recordRequest(now)
+            self._endTurn(ticket)
+
+            waited = now - startTime
+            self.timesWaited.add(waited)
+            self.intervalWaits.add(waited)
+            self.requestCount = self.requestCount + 1
+            self.laneWaits.setdefault(priority, _TimeSummary()).add(waited)
+        return waited
+
+    def _endTurn (self, ticket):
+        # Purpose: (private) take 'ticket' out of the waiting requests and wake the others
+        # Assumes: we hold self.condition
+        self.waiting.remove(ticket)
+        heapq.heapify(self.waiting)
+        self.condition.notify_all()
+
+    def get (self, url, data = None, priority = BATCH):
         # Purpose: wait until we can make a request of the given URL (within our throttling constraints)
-        #   then return the results.
+        #   then return the results. If 'data' is given, POST it (see curlTransport()).
+        #   Requests of higher 'priority' (INTERACTIVE) go ahead of waiting BATCH requests.
+        #   Requests answered with HTTP 429 are retried if setRetryOn429() is on.
         # Returns: response string
-        # Throws: Exception if there are problems reading from url
+        # Throws: Exception if there are problems reading from url, or if the request is still
+        #   rate limited (HTTP 429) after the retries
         
-        waitTime = self.getWaitTime()
-        if (waitTime > 0):
-            time.sleep(waitTime)
+        laneName = LANE_NAMES.get(priority, str(priority))
+        retries = 0
+        while True:
+            waitTime = self._waitForTurn(priority)      # and our parent's turn
+            Instrumentation.addTime('HttpRequestGovernor.sleep', waitTime)
+            Instrumentation.addTime('HttpRequestGovernor.wait.%s' % laneName, waitTime)
             
-        self.timesWaited.append(waitTime)
-        self.requestCount = self.requestCount + 1
-        
-        try:
-            response = readURL(url)
-        except Exception as e:
-            raise Exception('The server could not fulfill the request: %s' % str(e))
-        return response
+            startTime = time.time()
+            status = None
+            bytesReceived = 0
+            try:
+                with Instrumentation.timer('HttpRequestGovernor.http'):
+                    status, response = requestURL(url, data)
+                bytesReceived = len(response.encode('utf-8'))
+            except Exception as e:
+                raise Exception('The server could not fulfill the request: %s' % str(e))
+            finally:
+                seconds = time.time() - startTime
+                with self.condition:
+                    self.laneLatencies.setdefault(priority, _TimeSummary()).add(waitTime + seconds)
+                    self._recordResponse(seconds, status, len(url.encode('utf-8')) +
+                                            len((data or '').encode('utf-8')), bytesReceived)
+
+            if status != 429 or RETRY_429_MAX == 0:
+                return response
+            if retries == RETRY_429_MAX:
+                raise Exception('The server could not fulfill the request: rate limited (HTTP 429) after %d retries' % retries)
+            time.sleep(RETRY_429_BACKOFF * 2 ** retries)
+            retries = retries + 1
+            with self.condition:
+                self.retryCount = self.retryCount + 1
+            Instrumentation.count('HttpRequestGovernor.retries')
     
+    def _copyLimits (self):
+        # Purpose: (private) get a new governor with our limits (and a copy of our parent),
+        #    but none of our history
+        parent = self.parent and self.parent._copyLimits()
+        return HttpRequestGovernor(self.secondsPerRequest, self.requestsPerMinute,
+                self.requestsPerHour, self.requestsPerDay, self.interactiveReserve, parent)
+
+    def _getLimits (self, priority):
+        # Purpose: (private) get our limits, for requests of 'priority'
+        # Returns: list of (limit name, max requests, window seconds), for non-zero limits
+        limits = []
+        if self.secondsPerRequest > 0.0:
+            limits.append((PER_REQUEST, 1, self.secondsPerRequest))
+        for name, maxRequests, seconds in [ (PER_MINUTE, self.requestsPerMinute, SECONDS_PER_MINUTE),
+                (PER_HOUR, self.requestsPerHour, SECONDS_PER_HOUR),
+                (PER_DAY, self.requestsPerDay, SECONDS_PER_DAY) ]:
+            if maxRequests:
+                limits.append((name, self._getLimit(maxRequests, priority), seconds))
+        return limits
+
+    def simulate (self,
+            requestCount = 0,       # number of requests, all ready at the start
+            arrivals = None,        # or: list of times (seconds from the start) at which
+                                    #   each request is ready (an arrival trace)
+            priority = BATCH,       # lane of the requests
+            requestSeconds = 0.0,   # time each request takes, added to the completion time
+            phaseCount = 10         # number of equal time slices to report the binding limit of
+            ):
+        # Purpose: capacity planning: work out when each request would be made under our
+        #    limits (and our parent's), with the same logic get() uses but on a virtual clock
+        #    (no sleeping, no requests).  Our own state is not changed; the simulation starts
+        #    with no request history.
+        # Returns: dict with
+        #    'requests', 'completion_seconds' (when the last request is done),
+        #    'requests_per_hour', 'mean_wait_seconds', 'p99_wait_seconds', 'max_wait_seconds',
+        #    'utilization' : {limit name : requests made / most the limit allows in that time},
+        #    'binding_constraints' : the limits at (or within 1% of) the highest utilization,
+        #        i.e., the ones holding the run back, [] if the arrivals are the bottleneck
+        #    'binding_constraint' : the first of those, or 'none',
+        #    'delay_seconds' : {limit name : seconds the limit held requests back in all},
+        #    'phases' : list of {'start_seconds', 'end_seconds', 'requests', 'constraint'},
+        #        the binding limit in each time slice of the run
+        #    (limit names are PER_REQUEST, PER_MINUTE, ...; 'parent ' + name for the parent's)
+        # Example: how long would 50000 DOI lookups take?
+        #    print('\n'.join(formatSimulation(PubMedAgent.gov.simulate(50000))))
+
+        if arrivals is None:
+            arrivals = [ 0.0 ] * requestCount
+        sim = self._copyLimits()
+        governors = [ ('', sim) ]
+        if sim.parent is not None:
+            governors.append(('parent ', sim.parent))
+        limits = [ (prefix + name, maxRequests, seconds) for prefix, governor in governors
+                                for name, maxRequests, seconds in governor._getLimits(priority) ]
+
+        now = 0.0
+        waits = []
+        times = []          # time of each request
+        delays = {}         # limit name -> total seconds it held requests back
+        holds = []          # (start, end, limit name) of each hold of a second or more
+        for arrival in sorted(arrivals):
+            now = max(now, arrival)
+            while True:     # until no limit (ours or our parent's) makes us wait
+                waitTimes = {}
+                for prefix, governor in governors:
+                    for name, waitTime in governor._computeWaitTimes(now, priority).items():
+                        waitTimes[prefix + name] = waitTime
+                if not waitTimes or max(waitTimes.values()) <= 1e-9:
+                    break
+                name = max(waitTimes, key = waitTimes.get)
+                delays[name] = delays.get(name, 0.0) + waitTimes[name]
+                if waitTimes[name] >= 1.0:
+                    holds.append((now, now + waitTimes[name], name))
+                now = now + waitTimes[name]
+            for prefix, governor in governors:
+                governor._recordRequest(now)
+            waits.append(now - arrival)
+            times.append(now)
+
+        def getBinding (requests, seconds):
+            # utilization of each limit for 'requests' made over 'seconds', and the binding ones
+            utilization = dict([ (name, requests / float(maxRequests * (int(seconds / window) + 1)))
+                                            for name, maxRequests, window in limits ])
+            top = max(utilization.values(), default = 0.0)
+            if top < 0.95:
+                return utilization, []
+            return utilization, sorted([ name for name, u in utilization.items() if u >= 0.99 * top ],
+                                        key = lambda name: -utilization[name])
+
+        n = len(waits)
+        completion = (now + requestSeconds) if n else 0.0
+        utilization, binding = getBinding(n, now)
+
+        # the binding limit in each time slice (the one holding the clock if there are no requests)
+        phases = []
+        sliceSeconds = now / phaseCount
+        if n and sliceSeconds > 0.0:
+            counts = [ 0 ] * phaseCount
+            for t in times:
+                counts[min(int(t / sliceSeconds), phaseCount - 1)] += 1
+            for i in range(phaseCount):
+                start, end = i * sliceSeconds, (i + 1) * sliceSeconds
+                sliceBinding = getBinding(counts[i], sliceSeconds)[1]
+                if counts[i] == 0:
+                    held = [ name for (s, e, name) in holds if s < end and e > start ]
+                    sliceBinding = held[:1] or []
+                phases.append({ 'start_seconds' : start, 'end_seconds' : end,
+                                'requests' : counts[i],
+                                'constraint' : '/'.join(sliceBinding) or 'none' })
+
+        return {
+            'requests'            : n,
+            'completion_seconds'  : completion,
+            'requests_per_hour'   : n * SECONDS_PER_HOUR / completion if completion else 0.0,
+            'mean_wait_seconds'   : sum(waits) / n if n else 0.0,
+            'p99_wait_seconds'    : Instrumentation.percentile(waits, 99),
+            'max_wait_seconds'    : max(waits) if n else 0.0,
+            'utilization'         : utilization,
+            'binding_constraints' : binding,
+            'binding_constraint'  : binding[0] if binding else 'none',
+            'delay_seconds'       : delays,
+            'phases'              : phases,
+            }
+
+    def getMetrics (self):
+        # Purpose: get the metrics about governor performance so far
+        # Returns: dict (json-able) with
+        #    'requests', 'retries', 'errors', 'http429', 'http_status' : {status : count},
+        #    'bytes_sent', 'bytes_received',
+        #    'wait_seconds', 'response_seconds' : summarizeTimes() dicts (percentiles, histogram),
+        #    'lanes' : {lane name : {'wait_seconds', 'latency_seconds'}},
+        #    'utilization' : {limit name : {'limit', 'now', 'peak'}} for per minute/hour/day,
+        #    'limits' : our settings, 'snapshots' : the time series (see _takeSnapshot())
+        with self.condition:
+            now = time.time()
+            utilization = self._getUtilization(now)
+            return {
+                'requests'         : self.requestCount,
+                'retries'          : self.retryCount,
+                'errors'           : self.errorCount,
+                'http429'          : self.statusCounts.get(429, 0),
+                'http_status'      : dict([ (str(k), n) for k, n in self.statusCounts.items() ]),
+                'bytes_sent'       : self.bytesSent,
+                'bytes_received'   : self.bytesReceived,
+                'wait_seconds'     : self.timesWaited.getSummary(),
+                'response_seconds' : self.responseTimes.getSummary(),
+                'lanes'            : dict([ (LANE_NAMES.get(p, str(p)),
+                                        { 'wait_seconds' : self.laneWaits[p].getSummary(),
+                                          'latency_seconds' : self.laneLatencies.get(p,
+                                                                _TimeSummary()).getSummary() })
+                                        for p in sorted(self.laneWaits) ]),
+                'utilization'      : dict([ (name, { 'limit' : maxRequests, 'now' : utilization[name],
+                                                    'peak' : self.peakUtilization.get(name, 0.0) })
+                                        for name, maxRequests, timeList in self._getWindows() ]),
+                'limits'           : { 'seconds_per_request' : self.secondsPerRequest,
+                                        'per_minute' : self.requestsPerMinute,
+                                        'per_hour' : self.requestsPerHour,
+                                        'per_day' : self.requestsPerDay,
+                                        'interactive_reserve' : self.interactiveReserve },
+                'snapshots'        : list(self.snapshots),
+                }
+
+    def getMetricsJson (self):
+        # Returns: getMetrics() as a json string
+        return json.dumps(self.getMetrics(), indent = 1, sort_keys = True)
+
+    def dumpMetrics (self, filename):
+        # Purpose: write getMetrics() as json to 'filename'
+        with open(filename, 'w') as fp:
+            fp.write(self.getMetricsJson())
+
     def getStatistics (self):
         # Purpose: get a list of statitical data about governor performance so far
         
-        if self.requestCount == 0:
-            return [ 'No requests yet' ]
+        with self.condition:
+            if self.requestCount == 0:
+                return [ 'No requests yet' ]
 
-        stats = [
-            'Number of requests: %d' % self.requestCount,
-            'Average wait time:  %6.3f sec' % (sum(self.timesWaited) / self.requestCount),
-            'Maximum wait time:  %6.3f sec' % max(self.timesWaited),
+            stats = [
+                'Number of requests: %d' % self.requestCount,
+                'Average wait time:  %6.3f sec' % (self.timesWaited.total / self.requestCount),
+                'Maximum wait time:  %6.3f sec' % self.timesWaited.max,
+                ]
+        metrics = self.getMetrics()
+        waits = metrics['wait_seconds']
+        responses = metrics['response_seconds']
+        stats = stats + [
+            'Wait p50/p95/p99:   %6.3f/%6.3f/%6.3f sec' % (waits['p50'], waits['p95'], waits['p99']),
+            'Response avg/p50/p95/p99/max: %6.3f/%6.3f/%6.3f/%6.3f/%6.3f sec' % (responses['mean'],
+                responses['p50'], responses['p95'], responses['p99'], responses['max']),
+            'Bytes sent/received: %d/%d' % (metrics['bytes_sent'], metrics['bytes_received']),
+            'Errors: %d, HTTP 429: %d, retries: %d' % (metrics['errors'], metrics['http429'],
+                                                                metrics['retries']),
+            'HTTP status counts: %s' % ', '.join([ '%s: %d' % (k, n)
+                                        for k, n in sorted(metrics['http_status'].items()) ]),
+            'Wait histogram:     %s' % formatHistogram(waits),
+            'Response histogram: %s' % formatHistogram(responses),
             ]
+        for name, u in metrics['utilization'].items():
+            stats.append('Utilization %-10s now %5.1f%%, peak %5.1f%% (limit %d)' % (name,
+                                100.0 * u['now'], 100.0 * u['peak'], u['limit']))
+        if len(metrics['lanes']) > 1 or self.interactiveReserve:
+            for laneName, lane in metrics['lanes'].items():
+                laneWaits = lane['wait_seconds']
+                stats.append('%-12s requests: %d, wait avg/p99/max: %6.3f/%6.3f/%6.3f sec, latency p99: %6.3f sec' % \
+                    (laneName, laneWaits['count'], laneWaits['mean'], laneWaits['p99'],
+                    laneWaits['max'], lane['latency_seconds']['p99']))
         return stats
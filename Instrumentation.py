@@ -0,0 +1,267 @@
+"""
+Name:  Instrumentation.py
+Purpose:
+    Lightweight, opt-in timers and counters for the hot paths in this
+    library (litparser runs, DOI finding, governor sleeps, HTTP requests,
+    PubMed lookups, text splitting, ...), so we can see where load time goes.
+
+    Instrumentation is off until enable() is called. When it is off, timers
+    and counters cost a flag check and nothing is recorded.
+
+    Usage:
+        import Instrumentation
+        Instrumentation.enable(jsonFile='timings.json')  # report at exit
+        ... run the load ...
+
+    At process end, a summary is written to stderr (or reportFile) and, if
+    jsonFile is given, all the statistics are dumped there as json.
+
+    Each timer keeps its count, total, min and max, and a fixed size random
+    sample (reservoir) of its times for the percentiles, so memory does not
+    grow with the number of times recorded.
+
+    Code being instrumented uses:
+        with Instrumentation.timer('PdfParser.litparser'):
+            ...
+        @Instrumentation.timed('DoiFinder.getDoiID')
+        def getDoiID(...)
+        Instrumentation.addTime('HttpRequestGovernor.sleep', seconds)
+        Instrumentation.count('PdfParser.timeouts')
+"""
+import sys
+import time
+import json
+import random
+import atexit
+import threading
+import functools
+
+enabled = False         # are we recording?
+_lock = threading.Lock()
+_timers = {}            # timer name -> _TimerStats
+_counters = {}          # counter name -> count
+_atExitRegistered = False
+_reportFile = None      # where to write the summary at exit, None = stderr
+_jsonFile = None        # where to dump json at exit, None = don't
+
+RESERVOIR_SIZE = 1000   # times kept per timer for percentiles
+_random = random.Random(0)      # for reservoir sampling
+#-----------------------------------
+
+class _TimerStats (object):
+    """
+    IS	the statistics for one timer
+    HAS	count, total, min and max of the times recorded, and a reservoir:
+        a uniform random sample of at most RESERVOIR_SIZE of the times
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.reservoir = []
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+        if len(self.reservoir) < RESERVOIR_SIZE:
+            self.reservoir.append(seconds)
+        else:                           # keep each time with equal chance
+            i = _random.randrange(self.count)
+            if i < RESERVOIR_SIZE:
+                self.reservoir[i] = seconds
+
+    def getStatistics(self):
+        """ Return dict of the statistics, see getStatistics()
+        """
+        return {'count'        : self.count,
+                'total_seconds': self.total,
+                'mean_seconds' : self.total / self.count,
+                'min_seconds'  : self.min,
+                'p50_seconds'  : percentile(self.reservoir, 50),
+                'p99_seconds'  : percentile(self.reservoir, 99),
+                'max_seconds'  : self.max,
+                }
+# end class _TimerStats -----------------------------------
+
+def enable(reportFile=None,     # file name for the summary written at exit,
+                                #  None means stderr
+            jsonFile=None,      # file name for the json dump at exit,
+                                #  None means no json dump
+            reportAtExit=True,  # write summary (and json) at process end?
+    ):
+    """ Start recording timers and counters
+    """
+    global enabled, _reportFile, _jsonFile, _atExitRegistered
+    enabled = True
+    _reportFile = reportFile
+    _jsonFile = jsonFile
+    if reportAtExit and not _atExitRegistered:
+        atexit.register(_reportAtExit)
+        _atExitRegistered = True
+#-----------------------------------
+
+def disable():
+    """ Stop recording (what has been recorded is kept)
+    """
+    global enabled
+    enabled = False
+#-----------------------------------
+
+def isEnabled():
+    return enabled
+#-----------------------------------
+
+def reset():
+    """ Forget everything recorded so far
+    """
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+#-----------------------------------
+
+def addTime(name, seconds):
+    """ Record a time (in seconds) for timer 'name'
+    """
+    if not enabled:
+        return
+    with _lock:
+        stats = _timers.get(name)
+        if stats is None:
+            stats = _timers[name] = _TimerStats()
+        stats.add(seconds)
+#-----------------------------------
+
+def count(name, n=1):
+    """ Add n to counter 'name'
+    """
+    if not enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+#-----------------------------------
+
+class _Timer (object):
+    """ Context manager that records the time spent in its block
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.startTime = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        addTime(self.name, time.perf_counter() - self.startTime)
+        return False
+#-----------------------------------
+
+class _NoTimer (object):
+    """ Context manager that does nothing, used when we are not enabled
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        return False
+
+_noTimer = _NoTimer()
+#-----------------------------------
+
+def timer(name):
+    """ Return a context manager that records the time spent in its block
+        as timer 'name'
+    """
+    if not enabled:
+        return _noTimer
+    return _Timer(name)
+#-----------------------------------
+
+def timed(name):
+    """ Decorator: record the time spent in each call of the function
+        as timer 'name'
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with _Timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+#-----------------------------------
+
+def percentile(values,          # list of numbers
+                pct,            # percentile wanted, 0..100
+    ):
+    """
+    Return the pct percentile of values (nearest rank), or 0.0 if no values
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = int(round(pct / 100.0 * (len(ordered) - 1)))
+    return ordered[rank]
+#-----------------------------------
+
+def getStatistics():
+    """
+    Return dict of everything recorded so far:
+        {'timers': {name: {'count': n, 'total_seconds': s, 'mean_seconds': s,
+                            'min_seconds': s, 'p50_seconds': s,
+                            'p99_seconds': s, 'max_seconds': s}, ...},
+         'counters': {name: count, ...}}
+    Percentiles are from the timer's reservoir, so they are exact up to
+    RESERVOIR_SIZE times and estimates after that.
+    """
+    with _lock:
+        timerStats = dict([ (n, t.getStatistics()) for n, t in _timers.items() ])
+        counters = dict(_counters)
+    return {'timers': timerStats, 'counters': counters}
+#-----------------------------------
+
+def getSummary():
+    """ Return list of report lines summarizing what has been recorded,
+        timers with the most total time first
+    """
+    stats = getStatistics()
+    if not stats['timers'] and not stats['counters']:
+        return [ 'No instrumentation recorded' ]
+
+    lines = [ '%-40s %8s %10s %10s %10s %10s' % ('Timer', 'count',
+                            'total sec', 'mean ms', 'p99 ms', 'max ms') ]
+    for name, t in sorted(stats['timers'].items(),
+                                    key=lambda x: -x[1]['total_seconds']):
+        lines.append('%-40s %8d %10.3f %10.3f %10.3f %10.3f' % (name,
+                        t['count'], t['total_seconds'],
+                        1000 * t['mean_seconds'], 1000 * t['p99_seconds'],
+                        1000 * t['max_seconds']))
+    if stats['counters']:
+        lines.append('')
+        lines.append('%-40s %8s' % ('Counter', 'count'))
+        for name, n in sorted(stats['counters'].items()):
+            lines.append('%-40s %8d' % (name, n))
+    return lines
+#-----------------------------------
+
+def dump(filename):
+    """ Write getStatistics() as json to filename
+    """
+    with open(filename, 'w') as fp:
+        json.dump(getStatistics(), fp, indent=1, sort_keys=True)
+#-----------------------------------
+
+def _reportAtExit():
+    if _reportFile:
+        with open(_reportFile, 'w') as fp:
+            fp.write('\n'.join(getSummary()) + '\n')
+    else:
+        sys.stderr.write('\n'.join(getSummary()) + '\n')
+    if _jsonFile:
+        dump(_jsonFile)
+#-----------------------------------
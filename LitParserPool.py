@@ -0,0 +1,345 @@
+# Purpose: provides a pool of long-lived worker processes for extracting
+#	text from PDF files, so PdfParser does not have to launch litparser's
+#	pdfGetFullText.sh (a shell that reads its config and then starts
+#	pdftotext) for every PDF.
+# Notes:
+#	1. Each worker is a small python process (this module run with
+#	--worker) that reads requests from its stdin and writes responses to
+#	its stdout. It runs the extraction command for each PDF path it is
+#	sent and returns the command's exit code, stdout and stderr.
+#	2. Limitation: workers still start a new extraction process for each
+#	PDF (pdftotext takes one file per run, so it can't be kept resident).
+#	So the pool runs pdftotext itself, with the command line litparser
+#	uses (PdfParser.setPdfToText(), or 'command'): no shell or config
+#	read per PDF. Running the litparser script through the pool would
+#	still pay for those plus a pipe hop, so it is not the default.
+#	3. Workers that crash are respawned. Workers that have been idle a
+#	while are pinged before they are used (health check).
+#	4. extract() is thread safe: up to 'size' threads can extract at once.
+#	5. extract() takes the same time/output/memory limits as
+#	PdfParser.setExtractionLimits(); the worker enforces them with
+#	PdfParser.runLitParser().
+# Usage:
+#	PdfParser.setPdfToText(['/usr/bin/pdftotext', '-enc', 'ASCII7'])
+#	pool = LitParserPool.LitParserPool(size=4)
+#	PdfParser.setLitParserPool(pool)
+#	... use PdfParser objects as usual ...
+#	pool.close()
+#
+# Protocol: every message is a sequence of frames; a frame is a 4 byte
+#	big-endian length followed by that many bytes.
+#	request:  one frame, json {"op": "extract", "path": ..., "timeout": ...,
+#		"maxOutputBytes": ..., "maxMemoryBytes": ...} or {"op": "ping"}
+#	response: three frames, json {"returncode": n} (plus "error": "timeout"
+#		or "oversize" if a limit was breached), stdout bytes, stderr bytes
+
+import os
+import sys
+import json
+import time
+import queue
+import struct
+import locale
+import threading
+import subprocess
+import PdfParser
+
+###--- Globals ---###
+
+PATH_PLACEHOLDER = '%s'         # in a command, replaced by the PDF path
+DEFAULT_HEALTH_CHECK_INTERVAL = 60      # seconds idle before we ping a worker
+PING_TIMEOUT = 10               # seconds to wait for a ping response
+
+###--- Functions ---###
+
+def _writeFrame (fp, data):
+        # Purpose: (private) write one frame (bytes) to binary file 'fp'
+        fp.write(struct.pack('>I', len(data)))
+        fp.write(data)
+
+def _readExactly (fp, n):
+        # Purpose: (private) read exactly n bytes from binary file 'fp'
+        # Throws: EOFError if the file ends first
+        chunks = []
+        while n > 0:
+                chunk = fp.read(n)
+                if not chunk:
+                        raise EOFError('unexpected end of frame stream')
+                chunks.append(chunk)
+                n -= len(chunk)
+        return b''.join(chunks)
+
+def _readFrame (fp):
+        # Purpose: (private) read one frame from binary file 'fp'
+        # Returns: bytes
+        # Throws: EOFError if the stream ends
+        (length,) = struct.unpack('>I', _readExactly(fp, 4))
+        return _readExactly(fp, length)
+
+def _buildCommand (command, pdfPath):
+        # Purpose: (private) fill the PDF path into 'command' (list of
+        #	strings) in place of PATH_PLACEHOLDER, or append it
+        if PATH_PLACEHOLDER in command:
+                return [ (pdfPath if c == PATH_PLACEHOLDER else c)
+                                                        for c in command ]
+        return command + [ pdfPath ]
+
+def workerMain (command):
+        # Purpose: the main loop of a worker process: serve requests on
+        #	stdin until it is closed
+        stdin = sys.stdin.buffer
+        stdout = sys.stdout.buffer
+        while True:
+                try:
+                        request = json.loads(_readFrame(stdin).decode('utf-8'))
+                except EOFError:
+                        return
+
+                header = {}
+                if request['op'] == 'ping':
+                        returncode, out, err = 0, b'pong', b''
+                else:
+                        try:
+                                returncode, out, err = PdfParser.runLitParser(
+                                        _buildCommand(command, request['path']),
+                                        request.get('timeout'),
+                                        request.get('maxOutputBytes'),
+                                        request.get('maxMemoryBytes'))
+                        except PdfParser.ExtractionTimeoutError as e:
+                                returncode, out, err = -1, b'', e.stderr
+                                header = {'error': 'timeout', 'message': str(e)}
+                        except PdfParser.ExtractionOversizeError as e:
+                                returncode, out, err = -1, b'', e.stderr
+                                header = {'error': 'oversize', 'message': str(e)}
+                        except Exception as e:
+                                returncode, out = -1, b''
+                                err = ('Failed to execute: %s' % e).encode()
+
+                header['returncode'] = returncode
+                _writeFrame(stdout, json.dumps(header).encode('utf-8'))
+                _writeFrame(stdout, out)
+                _writeFrame(stdout, err)
+                stdout.flush()
+
+###--- Classes ---###
+
+class WorkerDiedError (Exception):
+        # Is: raised when a worker process goes away during a request
+        pass
+
+class _Worker:
+        # Is: (private) one worker process in a LitParserPool
+        # Has: the process, its pipes, when it was last used
+
+        def __init__ (self, command):
+                self.command = command
+                self.process = None
+                self.lastUsed = 0.0
+                self.start()
+
+        def start (self):
+                # Purpose: (re)start the worker process
+                self.stop()
+                cmd = [ sys.executable, os.path.abspath(__file__),
+                                                '--worker' ] + self.command
+                self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL)
+                self.lastUsed = time.time()
+
+        def stop (self):
+                # Purpose: stop the worker process, if there is one
+                if self.process is None:
+                        return
+                try:
+                        self.process.stdin.close()
+                        self.process.wait(timeout=5)
+                except Exception:
+                        self.process.kill()
+                        self.process.wait()
+                self.process.stdout.close()
+                self.process = None
+
+        def isAlive (self):
+                return self.process is not None and self.process.poll() is None
+
+        def request (self, message):
+                # Purpose: send a request (dict), return the response
+                # Returns: (header dict, stdout bytes, stderr bytes)
+                # Throws: WorkerDiedError if the worker goes away
+                try:
+                        _writeFrame(self.process.stdin,
+                                        json.dumps(message).encode('utf-8'))
+                        self.process.stdin.flush()
+                        header = json.loads(_readFrame(
+                                        self.process.stdout).decode('utf-8'))
+                        out = _readFrame(self.process.stdout)
+                        err = _readFrame(self.process.stdout)
+                except (EOFError, OSError, ValueError) as e:
+                        raise WorkerDiedError('litparser worker died: %s' % e)
+                self.lastUsed = time.time()
+                return header, out, err
+
+        def ping (self):
+                # Purpose: health check
+                # Returns: True if the worker answers a ping in time
+                if not self.isAlive():
+                        return False
+                result = []
+                def doPing():
+                        try:
+                                result.append(self.request({'op': 'ping'}))
+                        except WorkerDiedError:
+                                pass
+                t = threading.Thread(target=doPing)
+                t.daemon = True
+                t.start()
+                t.join(PING_TIMEOUT)
+                return bool(result) and result[0][1] == b'pong'
+
+class LitParserPool:
+        # Is: a pool of long-lived PDF text extraction worker processes
+        # Has: the extraction command, the idle workers, statistics
+        # Does: extract(pdfPath) - extract the text from a PDF using a worker
+
+        def __init__ (self,
+                size = 4,               # number of worker processes
+                command = None,         # extraction command (list of
+                                        #  strings), PATH_PLACEHOLDER is
+                                        #  replaced by the PDF path.
+                                        #  None means PdfParser.PDFTOTEXT
+                                        #  (see PdfParser.setPdfToText())
+                healthCheckInterval = DEFAULT_HEALTH_CHECK_INTERVAL
+                ):
+                # Purpose: constructor, starts the workers
+                # Throws: Exception if command is None and
+                #	PdfParser.setPdfToText() has not been called
+
+                if command is None:
+                        if not PdfParser.PDFTOTEXT:
+                                raise Exception('LitParserPool needs command= or PdfParser.setPdfToText() (the pdftotext command litparser uses)')
+                        command = PdfParser.PDFTOTEXT + [ PATH_PLACEHOLDER, '-' ]
+
+                self.command = list(command)
+                self.size = size
+                self.healthCheckInterval = healthCheckInterval
+                self.encoding = locale.getpreferredencoding(False)
+
+                self.workers = [ _Worker(self.command) for i in range(size) ]
+                self.idle = queue.Queue()
+                for w in self.workers:
+                        self.idle.put(w)
+
+                self.lock = threading.Lock()    # protects the counts
+                self.extractionCount = 0
+                self.respawnCount = 0
+                self.failedCount = 0
+                return
+
+        def _respawn (self, worker):
+                # Purpose: (private) restart a crashed/unhealthy worker
+                worker.start()
+                with self.lock:
+                        self.respawnCount += 1
+
+        def _getWorker (self):
+                # Purpose: (private) wait for an idle worker, make sure it
+                #	is alive (and healthy, if it has been idle a while)
+                worker = self.idle.get()
+                if not worker.isAlive():
+                        self._respawn(worker)
+                elif time.time() - worker.lastUsed > self.healthCheckInterval:
+                        if not worker.ping():
+                                self._respawn(worker)
+                return worker
+
+        def extract (self, pdfPath,
+                timeout = None,         # max wall clock seconds
+                maxOutputBytes = None,  # max bytes of text
+                maxMemoryBytes = None   # max bytes of memory
+                ):
+                # Purpose: extract the text from a PDF file using a worker,
+                #	within the given limits (None = no limit)
+                # Returns: (returncode, stdout, stderr) of the extraction
+                #	command, stdout & stderr as strings
+                # Throws: Exception if the worker dies twice on this PDF;
+                #	PdfParser.ExtractionTimeoutError,
+                #	PdfParser.ExtractionOversizeError if a limit is breached
+
+                message = {'op': 'extract', 'path': pdfPath,
+                                'timeout': timeout,
+                                'maxOutputBytes': maxOutputBytes,
+                                'maxMemoryBytes': maxMemoryBytes}
+                worker = self._getWorker()
+                try:
+                        try:
+                                header, out, err = worker.request(message)
+                        except WorkerDiedError:
+                                self._respawn(worker)   # try once more
+                                header, out, err = worker.request(message)
+                except WorkerDiedError as e:
+                        self._respawn(worker)
+                        with self.lock:
+                                self.failedCount += 1
+                        raise Exception('Failed to execute: %s %s: %s' % \
+                                        (' '.join(self.command), pdfPath, e))
+                finally:
+                        self.idle.put(worker)
+
+                with self.lock:
+                        self.extractionCount += 1
+                err = err.decode(self.encoding, 'replace')
+                if header.get('error') == 'timeout':
+                        raise PdfParser.ExtractionTimeoutError(
+                                                header['message'], err)
+                if header.get('error') == 'oversize':
+                        raise PdfParser.ExtractionOversizeError(
+                                                header['message'], err)
+                return header['returncode'], \
+                        PdfParser.decodeOutput(out, self.encoding), err
+
+        def checkHealth (self):
+                # Purpose: ping all idle workers, respawn any that don't answer
+                # Returns: number of workers respawned
+                respawned = 0
+                checked = []
+                while True:
+                        try:
+                                worker = self.idle.get_nowait()
+                        except queue.Empty:
+                                break
+                        if not worker.ping():
+                                self._respawn(worker)
+                                respawned += 1
+                        checked.append(worker)
+                for worker in checked:
+                        self.idle.put(worker)
+                return respawned
+
+        def close (self):
+                # Purpose: stop all the workers
+                for w in self.workers:
+                        w.stop()
+
+        def __enter__ (self):
+                return self
+
+        def __exit__ (self, excType, excValue, tb):
+                self.close()
+                return False
+
+        def getStatistics (self):
+                # Purpose: get a list of statistics about the pool so far
+                return [
+                        'Workers:           %d' % self.size,
+                        'Extractions:       %d' % self.extractionCount,
+                        'Worker respawns:   %d' % self.respawnCount,
+                        'Failed extractions: %d' % self.failedCount,
+                        ]
+
+if __name__ == '__main__':
+        if len(sys.argv) > 2 and sys.argv[1] == '--worker':
+                workerMain(sys.argv[2:])
+        else:
+                sys.stderr.write('Usage: %s --worker command...\n' % sys.argv[0])
+                sys.exit(1)
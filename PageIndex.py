@@ -0,0 +1,138 @@
+"""
+Name:  PageIndex.py
+Purpose:
+    pdftotext (and so litparser) ends each page of extracted text with a
+    form feed ('\f'). A PageIndex records where each page starts in a text
+    so code like DoiFinder and the splitter can ask for "page 1" or "the
+    last two pages" without rescanning the text.
+
+    A PageIndex can be built in the same pass as reading the text, a chunk
+    at a time (see PdfParser.iterText()), or from a whole text. It can be
+    written as a string of comma separated offsets and read back, so it
+    can be kept alongside stored text (see ExtractedTextCorpus.py).
+
+    Page numbers are 0-based and, like python list indexes, negative page
+    numbers count from the end (-1 is the last page). Each page includes
+    its form feed.
+
+    Example:
+        index = PageIndex.fromText(text)
+        firstPage = index.getPage(text, 0)
+        lastTwo   = index.getPages(text, -2)
+"""
+from array import array
+
+PAGE_BREAK = '\f'
+OFFSET_SEP = ','        # between offsets in toString()
+#-----------------------------------
+
+class PageIndex (object):
+    """
+    IS	an index of the page start offsets in a text
+    HAS	the offsets just after each page break seen so far, the length of
+        the text seen so far
+    DOES addChunk(chunk) - extend the index with the next chunk of the text
+         getPageCount(), getPageSpan(n) - page count and page boundaries
+         getPage(text, n), getPages(text, first, last) - slice pages from
+            the text the index was built from
+    """
+    def __init__(self,
+        breaks=None,    # offsets just after each page break, ascending
+        length=0,       # length of the text
+        ):
+        self.breaks = array('q', breaks or [])
+        self.length = length
+    #-----------------------------------
+
+    def addChunk(self, chunk):
+        """ Extend the index with the next chunk of the text
+        """
+        pos = chunk.find(PAGE_BREAK)
+        while pos != -1:
+            self.breaks.append(self.length + pos + 1)
+            pos = chunk.find(PAGE_BREAK, pos + 1)
+        self.length += len(chunk)
+    #-----------------------------------
+
+    def getPageCount(self):
+        if self.length == 0:
+            return 0
+        if self.breaks and self.breaks[-1] == self.length:
+            return len(self.breaks)     # text ends with a page break
+        return len(self.breaks) + 1
+    #-----------------------------------
+
+    def getPageOffsets(self):
+        """ Return list of the start offsets of the pages
+        """
+        return [ self._start(n) for n in range(self.getPageCount()) ]
+    #-----------------------------------
+
+    def _start(self, n):
+        """ Return the start offset of page n (0 <= n <= page count)
+        """
+        if n == 0:
+            return 0
+        if n <= len(self.breaks):
+            return self.breaks[n - 1]
+        return self.length
+    #-----------------------------------
+
+    def getPageSpan(self, n):
+        """ Return (start, end) offsets of page n (0-based, negative counts
+            from the end).
+            Raise IndexError if there is no such page.
+        """
+        count = self.getPageCount()
+        if n < 0:
+            n += count
+        if not 0 <= n < count:
+            raise IndexError('page %d out of range (%d pages)' % (n, count))
+        return self._start(n), self._start(n + 1)
+    #-----------------------------------
+
+    def getPage(self, text, n):
+        """ Return page n of text (the text this index was built from)
+        """
+        start, end = self.getPageSpan(n)
+        return text[start:end]
+    #-----------------------------------
+
+    def getPages(self, text, first=0, last=None):
+        """ Return the text of pages first through last-1 (like a slice:
+            negative numbers count from the end, None means to the end)
+        """
+        pages = range(self.getPageCount())[first:last]
+        if len(pages) == 0:
+            return ''
+        return text[self._start(pages[0]) : self._start(pages[-1] + 1)]
+    #-----------------------------------
+
+    def toString(self):
+        """ Return the index as a string, see fromString()
+        """
+        return OFFSET_SEP.join([ str(self.length) ] +
+                                            [ str(b) for b in self.breaks ])
+    #-----------------------------------
+
+    @classmethod
+    def fromString(cls, s):
+        """ Return a PageIndex from a toString() string
+        """
+        values = [ int(v) for v in s.split(OFFSET_SEP) if v ]
+        if not values:
+            return cls()
+        return cls(breaks=values[1:], length=values[0])
+    #-----------------------------------
+
+    def __len__(self):
+        return self.getPageCount()
+# end class PageIndex -----------------------------------
+
+def fromText(text):
+    """ Return a PageIndex for a whole text
+    """
+    index = PageIndex()
+    index.addChunk(text)
+    return index
+#-----------------------------------
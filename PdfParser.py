@@ -3,14 +3,92 @@
 # Notes: 
 #	1. relies on MGI's litparser product to do the actual pdf to text
 #	2. must be initialized with call to setLitParserDir()
-
+#	3. optionally, setLitParserPool() to extract text using a pool of
+#	long-lived worker processes (see LitParserPool.py)
+#	4. optionally, setExtractionLimits() to cap the time, output size and
+#	memory of each extraction, so one bad PDF can't stall a whole load
+#	5. optionally, setPdfToText() so getPagesText() can extract page
+#	ranges by running pdftotext directly, and setDoiFirstPages() so
+#	getFirstDoiID() looks in just the first few pages (front matter)
+#	first, only extracting the full text when the DOI needs it
+#	6. optionally, setPreflightCheck() to reject files that are not PDFs
+#	or are truncated without running litparser (see preflightPdf())
+
+import io
 import os
 import re
+import time
+import zlib
+import mmap
+import codecs
+import sys
+import signal
+import locale
+import threading
 import subprocess
+import multiprocessing
+import Instrumentation
+import PageIndex
 
 ###--- Globals ---###
 
 LITPARSER = None        # full path to parsing script in litparser product
+LITPARSER_POOL = None   # LitParserPool to extract text with, if any
+PDFTOTEXT = None        # pdftotext command (list of strings) for extracting
+                        #  page ranges, if any (see setPdfToText())
+DOI_FIRST_PAGES = 0     # pages getFirstDoiID() extracts before the full
+                        #  text, 0 = just use the full text (see
+                        #  setDoiFirstPages())
+
+# limits for each extraction, None means no limit (see setExtractionLimits())
+EXTRACTION_TIMEOUT = None       # max wall clock seconds
+EXTRACTION_MAX_OUTPUT = None    # max bytes of extracted text
+EXTRACTION_MAX_MEMORY = None    # max bytes of address space (memory)
+
+# counts of extraction outcomes so far (see getParserStatistics())
+parserStats = {
+        'extractions' : 0,      # extractions attempted
+        'failures'    : 0,      # litparser exited with an error
+        'timeouts'    : 0,      # killed for exceeding EXTRACTION_TIMEOUT
+        'oversize'    : 0,      # killed for exceeding EXTRACTION_MAX_OUTPUT
+        'pageRanges'  : 0,      # page range extractions (pdftotext)
+        'doiFrontMatter' : 0,   # DOIs found from the first pages alone
+        'doiFullText' : 0,      # DOI searches that needed the full text
+        'rejected'    : 0,      # PDFs rejected by the preflight check
+        }
+_statsLock = threading.Lock()   # parserStats is updated from pool threads
+
+# regex's for finding the page count in the PDF structure (see
+#  getPdfPageCount()): the /N entry of a linearized PDF's first dictionary,
+#  the /Count of page tree nodes, and object streams that may hold them
+LINEARIZED_N_RE = re.compile(rb'/Linearized\b[^>]*?/N\s+(\d+)')
+PAGES_COUNT_RE = re.compile(rb'/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|' +
+                                rb'/Count\s+(\d+)[^>]*?/Type\s*/Pages\b')
+OBJSTM_RE = re.compile(rb'/Type\s*/ObjStm\b[^>]*>>\s*stream\r?\n')
+
+# for preflightPdf(): where to look for the header and the trailer, and the
+#  regex's for the header and an encryption dictionary reference
+HEADER_WINDOW = 1024    # bytes at the start ('%PDF-' may follow some junk)
+TRAILER_WINDOW = 2048   # bytes at the end
+PDF_HEADER_RE = re.compile(rb'%PDF-(\d\.\d)')
+ENCRYPT_RE = re.compile(rb'/Encrypt\s*\d+\s+\d+\s+R')
+
+# regex's for reading the trailer and the objects it leads to (see
+#  _readTrailer()): the last xref section's offset, xref table subsection
+#  headers and entries, object headers, and the trailer/catalog entries
+STARTXREF_RE = re.compile(rb'startxref\s+(\d+)')
+XREF_SUBSECTION_RE = re.compile(rb'\s*(\d+)\s+(\d+)[ \t]*(?:\r\n|\r|\n)')
+XREF_ENTRY_RE = re.compile(rb'(\d{10}) \d{5} ([nf])')
+OBJECT_RE = re.compile(rb'\s*(\d+)\s+\d+\s+obj\b')
+ROOT_REF_RE = re.compile(rb'/Root\s+(\d+)\s+\d+\s+R')
+PAGES_REF_RE = re.compile(rb'/Pages\s+(\d+)\s+\d+\s+R')
+PREV_RE = re.compile(rb'/Prev\s+(\d+)')
+COUNT_RE = re.compile(rb'/Count\s+(\d+)')
+MAX_OBJECT_BYTES = 65536        # how far to look for an object's 'endobj'
+MAX_XREF_SECTIONS = 32          # how many /Prev xref sections to follow
+
+PREFLIGHT_CHECK = False # reject PDFs that fail preflightPdf() before
+                        #  extracting them? (see setPreflightCheck())
 
 ###--- Functions ---###
 
@@ -31,12 +109,586 @@ def setLitParserDir (
         if not os.path.exists(LITPARSER):
                 raise Exception('%s does not exist' % LITPARSER)
         return
+
+def setLitParserPool (
+        pool		# LitParserPool object, or None to stop using a pool
+        ):
+        # Purpose: have all PdfParser objects extract text using the given
+        #	pool of worker processes instead of running the litparser
+        #	script for each PDF
+
+        global LITPARSER_POOL
+
+        LITPARSER_POOL = pool
+        return
+
+def setPdfToText (
+        command,        # list of strings; the pdftotext command & options
+                        #  litparser uses, e.g., ['/usr/bin/pdftotext',
+                        #  '-enc', 'ASCII7'], or None to stop using it
+        doiFirstPages = None    # pages to look for DOIs in first (see
+                                #  setDoiFirstPages()), None = unchanged
+        ):
+        # Purpose: let PdfParser objects extract page ranges by running
+        #	pdftotext directly (litparser's script only does whole files).
+        #	The page options, PDF path and '-' (stdout) are appended.
+
+        global PDFTOTEXT
+
+        PDFTOTEXT = command and list(command)
+        if doiFirstPages is not None:
+                setDoiFirstPages(doiFirstPages)
+        return
+
+def setDoiFirstPages (
+        pages           # int; pages to look for DOIs in first, 0 = none
+        ):
+        # Purpose: have getFirstDoiID() look for the DOI in just the first
+        #	'pages' pages before extracting the full text (with pdftotext
+        #	if setPdfToText() has been called, else by stopping litparser
+        #	early). Off (0) by default.
+        # Notes: the DOI found can differ from the full text's when a
+        #	'marker' DoiRule's marker (e.g., PNAS's 'www.pnas.org') only
+        #	appears after those pages: the marker rule can't fire, so the
+        #	first DOI in the front matter is used. Only turn this on for
+        #	loads where that is acceptable.
+
+        global DOI_FIRST_PAGES
+
+        DOI_FIRST_PAGES = pages
+        return
+
+def getPdfPageCount (
+        pdfPath         # string; path to PDF file
+        ):
+        # Purpose: get the number of pages in a PDF file from its structure,
+        #	without extracting any text
+        # Returns: int, or None if the count can't be found cheaply
+
+        return preflightPdf(pdfPath).pageCount
+
+def _findPageCount (
+        data            # bytes or mmap of a PDF file
+        ):
+        # Purpose: (private) find the page count in PDF file data
+        # Returns: int, or None if the count can't be found cheaply
+        # Notes: looks for a linearized PDF's page count, then the largest
+        #	/Count in a /Pages node, then in compressed object streams
+
+        match = LINEARIZED_N_RE.search(data, 0, 4096)
+        if match:
+                return int(match.group(1))
+
+        counts = [ int(a or b) for a, b in PAGES_COUNT_RE.findall(data) ]
+        if counts:
+                return max(counts)
+
+        for match in OBJSTM_RE.finditer(data):
+                try:
+                        objects = zlib.decompressobj().decompress(
+                                        data[match.end():match.end() + 1000000])
+                except zlib.error:
+                        continue
+                counts = [ int(a or b) for a, b in
+                                        PAGES_COUNT_RE.findall(objects) ]
+                if counts:
+                        return max(counts)
+        return None
+
+def _readObject (
+        data,           # bytes or mmap of a PDF file
+        offset,         # int; where the object starts
+        objNum          # int; the object number expected there
+        ):
+        # Purpose: (private) get the text of an (uncompressed) object
+        # Returns: bytes between 'obj' and 'endobj', or None if that isn't
+        #	the object
+        match = OBJECT_RE.match(data, offset)
+        if not match or int(match.group(1)) != objNum:
+                return None
+        end = data.find(b'endobj', match.end(), match.end() + MAX_OBJECT_BYTES)
+        if end < 0:
+                return None
+        return data[match.end():end]
+
+def _readXrefTable (
+        data,           # bytes or mmap of a PDF file
+        offset          # int; where the xref table starts
+        ):
+        # Purpose: (private) find the subsections of an xref table section
+        #	and its trailer (the entries are only read when looked up,
+        #	see _lookupXref())
+        # Returns: (list of (first object number, count, position of the
+        #	first entry), trailer dictionary bytes), or None if there
+        #	isn't an xref table at 'offset' (e.g., it is an xref stream)
+        if data[offset:offset+4] != b'xref':
+                return None
+        subsections = []
+        pos = offset + 4
+        while True:
+                match = XREF_SUBSECTION_RE.match(data, pos)
+                if not match:
+                        break
+                first, count = int(match.group(1)), int(match.group(2))
+                subsections.append((first, count, match.end()))
+                pos = match.end() + 20 * count  # entries are 20 bytes each
+        trailer = data.find(b'trailer', pos, pos + 1024)
+        end = data.find(b'startxref', trailer)
+        if trailer < 0 or end < 0:
+                return None
+        return subsections, data[trailer:end]
+
+def _lookupXref (
+        data,           # bytes or mmap of a PDF file
+        subsections,    # from _readXrefTable()
+        objNum          # int; object number
+        ):
+        # Purpose: (private) look an object up in an xref table section
+        # Returns: the object's offset; 0 if it is free; None if the section
+        #	doesn't have it
+        # Throws: ValueError if the entry is not a valid xref entry
+        for first, count, pos in subsections:
+                if first <= objNum < first + count:
+                        entry = XREF_ENTRY_RE.match(data, pos + 20 * (objNum - first))
+                        if not entry:
+                                raise ValueError('bad xref entry')
+                        return int(entry.group(1)) if entry.group(2) == b'n' else 0
+        return None
+
+def _readTrailer (
+        data,           # bytes or mmap of a PDF file
+        fileSize        # int; size of the file
+        ):
+        # Purpose: (private) read whether the PDF is encrypted and its page
+        #	count from the trailer: the last xref section (and its /Prev
+        #	sections) lead to the /Root catalog and its /Pages node's /Count
+        # Returns: (isEncrypted, page count or None), or None if the
+        #	trailer can't be read (no startxref, a broken xref)
+        # Notes: xref streams (PDF 1.5+) are not decoded: their dictionary
+        #	says if the PDF is encrypted, but the page count is None
+
+        tail = data[max(0, fileSize - TRAILER_WINDOW):]
+        match = STARTXREF_RE.search(tail, max(0, tail.rfind(b'startxref')))
+        if not match or int(match.group(1)) >= fileSize:
+                return None
+        offset = int(match.group(1))
+
+        section = _readXrefTable(data, offset)
+        if section is None:             # an xref stream?
+                match = OBJECT_RE.match(data, offset)
+                if not match:
+                        return None
+                end = data.find(b'stream', match.end(),
+                                                match.end() + MAX_OBJECT_BYTES)
+                header = data[match.end():end]
+                if end < 0 or header.find(b'/XRef') < 0:
+                        return None
+                return header.find(b'/Encrypt') >= 0, None
+        isEncrypted = section[1].find(b'/Encrypt') >= 0
+
+        def findObject (objNum):
+                # text of object objNum, from the newest section that has it
+                subsections, trailer = section
+                for i in range(MAX_XREF_SECTIONS):
+                        objOffset = _lookupXref(data, subsections, objNum)
+                        if objOffset:
+                                return _readObject(data, objOffset, objNum)
+                        prev = PREV_RE.search(trailer)
+                        if objOffset == 0 or not prev:
+                                return None
+                        older = _readXrefTable(data, int(prev.group(1)))
+                        if older is None:
+                                return None
+                        subsections, trailer = older
+                return None
+
+        try:
+                match = ROOT_REF_RE.search(section[1])
+                catalog = match and findObject(int(match.group(1)))
+                match = catalog and PAGES_REF_RE.search(catalog)
+                pages = match and findObject(int(match.group(1)))
+        except ValueError:              # broken xref
+                return None
+        match = pages and COUNT_RE.search(pages)
+        return isEncrypted, match and int(match.group(1))
+
+def preflightPdf (
+        pdfPath         # string; path to PDF file
+        ):
+        # Purpose: cheaply check a PDF file's structure, in process, before
+        #	spending a litparser run on it. Encryption and the page count
+        #	come from the trailer (see _readTrailer()); the whole file is
+        #	only scanned if they can't be read from there.
+        # Returns: PdfPreflight object
+        # Throws: OSError if the file can't be read
+
+        with open(pdfPath, 'rb') as fp:
+                fileSize = os.fstat(fp.fileno()).st_size
+                if fileSize == 0:
+                        return PdfPreflight(pdfPath, 0, None, False, False,
+                                                                False, None)
+                with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                        match = PDF_HEADER_RE.search(data, 0, HEADER_WINDOW)
+                        version = match and match.group(1).decode('ascii')
+                        tail = data[max(0, fileSize - TRAILER_WINDOW):]
+                        hasEof = tail.find(b'%%EOF') >= 0 and \
+                                                tail.find(b'startxref') >= 0
+                        hasXref = hasEof or data.rfind(b'startxref') >= 0
+                        trailer = hasEof and _readTrailer(data, fileSize)
+                        pageCount = None
+                        if trailer:
+                                isEncrypted, pageCount = trailer
+                        else:   # scan the whole file
+                                isEncrypted = ENCRYPT_RE.search(data) is not None
+                        if version and pageCount is None:
+                                pageCount = _findPageCount(data)
+        return PdfPreflight(pdfPath, fileSize, version, hasEof, hasXref,
+                                                    isEncrypted, pageCount)
+
+_workerDoiFinder = None # the DoiFinder in a getDoiIDs() worker process
+
+def _initDoiWorker (doiFinder):
+        # Purpose: (private) remember the DoiFinder in a worker process
+        global _workerDoiFinder
+        _workerDoiFinder = doiFinder
+
+def _findDoiInWindow (
+        item            # (index, window text)
+        ):
+        # Purpose: (private) find the DOI ID in one text window
+        # Returns: (index, DOI ID or None, error message or '')
+        index, text = item
+        try:
+                return index, _workerDoiFinder.getDoiID(text), ''
+        except Exception as e:
+                return index, None, '%s: %s' % (type(e).__name__, e)
+
+def _iterChunks (
+        text,           # string
+        chunkSize = 65536
+        ):
+        # Purpose: (private) generate a loaded text in chunks
+        for i in range(0, len(text), chunkSize):
+                yield text[i:i+chunkSize]
+
+def _iterPages (
+        chunks          # generator of strings
+        ):
+        # Purpose: (private) generate the pages in a stream of text chunks.
+        #	Each page ends with its form feed (the last may not have one).
+        pieces = []     # of the page being read
+        try:
+                for chunk in chunks:
+                        parts = chunk.split('\f')
+                        for part in parts[:-1]:
+                                pieces.append(part)
+                                yield ''.join(pieces) + '\f'
+                                pieces = []
+                        pieces.append(parts[-1])
+        finally:
+                chunks.close()
+        lastPage = ''.join(pieces)
+        if lastPage:
+                yield lastPage
+
+def setPreflightCheck (
+        check = True    # boolean; check PDFs before extracting them?
+        ):
+        # Purpose: have PdfParser objects check their PDF file with
+        #	preflightPdf() before any text extraction, and raise
+        #	PdfInvalidError for files that are not PDFs or are truncated,
+        #	rather than spend a litparser run finding that out
+
+        global PREFLIGHT_CHECK
+
+        PREFLIGHT_CHECK = check
+        return
+
+def setExtractionLimits (
+        timeout = None,         # max wall clock seconds per extraction
+        maxOutputBytes = None,  # max bytes of text per extraction
+        maxMemoryBytes = None   # max bytes of memory (address space) for
+                                #  the extraction process
+        ):
+        # Purpose: set the limits for each text extraction. None means no
+        #	limit. When a limit is breached, the extraction's whole process
+        #	group is killed and ExtractionTimeoutError or
+        #	ExtractionOversizeError is raised (memory limit breaches
+        #	show up as litparser failures). The memory limit is set by a
+        #	small python shim that execs the command (a preexec_fn is not
+        #	safe with threads), which adds its startup time to each
+        #	extraction.
+
+        global EXTRACTION_TIMEOUT, EXTRACTION_MAX_OUTPUT, EXTRACTION_MAX_MEMORY
+
+        EXTRACTION_TIMEOUT = timeout
+        EXTRACTION_MAX_OUTPUT = maxOutputBytes
+        EXTRACTION_MAX_MEMORY = maxMemoryBytes
+        return
+
+def _addStat (
+        statName        # string; key in parserStats
+        ):
+        # Purpose: (private) add one to an extraction statistic (thread safe)
+        with _statsLock:
+                parserStats[statName] += 1
+
+def getParserStatistics ():
+        # Purpose: get a list of statistics about text extractions so far
+
+        with _statsLock:
+                stats = dict(parserStats)
+        return [
+                'Extractions:            %d' % stats['extractions'],
+                'Failed extractions:     %d' % stats['failures'],
+                'Timed out:              %d' % stats['timeouts'],
+                'Too much output:        %d' % stats['oversize'],
+                'Page range extractions: %d' % stats['pageRanges'],
+                'DOIs from first pages:  %d' % stats['doiFrontMatter'],
+                'DOIs needing full text: %d' % stats['doiFullText'],
+                'Rejected by preflight:  %d' % stats['rejected'],
+                ]
+
+def runLitParser (
+        cmd,                    # list of strings; extraction command
+        timeout = None,         # max wall clock seconds, None = no limit
+        maxOutputBytes = None,  # max bytes of stdout, None = no limit
+        maxMemoryBytes = None   # max bytes of address space, None = no limit
+        ):
+        # Purpose: run a text extraction command within the given limits
+        # Returns: (returncode, stdout, stderr), stdout/stderr as bytes
+        # Throws: ExtractionTimeoutError, ExtractionOversizeError if a limit
+        #	is breached; Exception if the command can't be executed
+
+        process = _LitParserProcess(cmd, timeout, maxOutputBytes,
+                                                                maxMemoryBytes)
+        stdout = b''.join(process.iterChunks())
+        return process.returncode, stdout, process.stderr
+
+def getTextDecoder (encoding):
+        # Purpose: get an incremental decoder for extraction output (bytes)
+        #	that also translates '\r\n' and '\r' to '\n', like reading
+        #	the output in text mode
+        return io.IncrementalNewlineDecoder(
+                        codecs.getincrementaldecoder(encoding)(), True)
+
+def decodeOutput (data, encoding):
+        # Purpose: decode extraction output (bytes) as text, translating
+        #	newlines (see getTextDecoder())
+        return getTextDecoder(encoding).decode(data, True)
         
+# runs a command (argv[2:]) with its address space limited to argv[1] bytes
+_RLIMIT_SHIM = '''
+import os, sys, resource
+limit = int(sys.argv[1])
+resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+try:
+    os.execvp(sys.argv[2], sys.argv[2:])
+except OSError as e:
+    sys.stderr.write('Failed to execute %s: %s\\n' % (sys.argv[2], e))
+    os._exit(127)
+'''
+
 ###--- Classes ---###
 
+class ExtractionTimeoutError (Exception):
+    # Is: raised when a text extraction takes longer than its time limit
+    # Has: stderr - stderr from the extraction before it was killed
+    def __init__ (self, message, stderr=''):
+        Exception.__init__(self, message)
+        self.stderr = stderr
+
+class ExtractionOversizeError (Exception):
+    # Is: raised when a text extraction produces more than its output limit
+    # Has: stderr - stderr from the extraction before it was killed
+    def __init__ (self, message, stderr=''):
+        Exception.__init__(self, message)
+        self.stderr = stderr
+
+class PdfInvalidError (Exception):
+    # Is: raised when a PDF file fails the preflight check
+    # Has: preflight - the PdfPreflight for the file
+    def __init__ (self, message, preflight):
+        Exception.__init__(self, message)
+        self.preflight = preflight
+
+class PdfPreflight:
+    # Is: the results of preflightPdf() for a PDF file
+    # Has: pdfPath, fileSize, version (e.g., '1.4', None if there is no
+    #	%PDF- header), hasEof (trailer: startxref and %%EOF at the end),
+    #	hasXref (startxref anywhere), isEncrypted, pageCount (None if
+    #	it can't be found cheaply)
+    # Does: isValid() - does the file look like a complete PDF?
+    #	getProblems() - what's wrong with it
+
+    def __init__ (self, pdfPath, fileSize, version, hasEof, hasXref,
+                                                isEncrypted, pageCount):
+        self.pdfPath = pdfPath
+        self.fileSize = fileSize
+        self.version = version
+        self.hasEof = hasEof
+        self.hasXref = hasXref
+        self.isEncrypted = isEncrypted
+        self.pageCount = pageCount
+
+    def getProblems (self):
+        # Purpose: return list of strings describing why the file is
+        #	not a valid PDF (empty if it looks fine)
+        problems = []
+        if self.fileSize == 0:
+            problems.append('empty file')
+        elif not self.version:
+            problems.append('no %PDF- header, not a PDF file')
+        elif not self.hasEof:
+            if self.hasXref:
+                problems.append('no startxref/%%EOF trailer at end of file')
+            else:
+                problems.append('no startxref/%%EOF trailer, truncated file')
+        return problems
+
+    def isValid (self):
+        return not self.getProblems()
+
+    def __str__ (self):
+        return 'PdfPreflight: %s version=%s size=%d pages=%s encrypted=%s %s' % \
+                (self.pdfPath, self.version, self.fileSize, self.pageCount,
+                self.isEncrypted, '; '.join(self.getProblems()) or 'valid')
+
+class _LitParserProcess:
+    # Is: (private) a running text extraction command
+    # Has: the process, limits, stderr collected so far
+    # Does: iterChunks() - generate the stdout of the process (bytes) as
+    #	it arrives, enforcing the limits. The process runs in its own
+    #	process group so a breach kills litparser and the pdftotext it
+    #	started.
+
+    def __init__ (self, cmd, timeout, maxOutputBytes, maxMemoryBytes):
+        self.cmdText = ' '.join(cmd)
+        self.timeout = timeout
+        self.maxOutputBytes = maxOutputBytes
+        self.timedOut = False
+        self.returncode = None
+        self.stderrChunks = []
+
+        if maxMemoryBytes:      # no preexec_fn, it's unsafe with threads
+            cmd = [ sys.executable, '-c', _RLIMIT_SHIM,
+                                                str(maxMemoryBytes) ] + cmd
+        try:
+            self.process = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, start_new_session=True)
+        except: # error in attempting to execute parsing script
+            raise Exception('Failed to execute: %s' % self.cmdText)
+
+        # read stderr in its own thread so a full stderr pipe can't block
+        self.stderrThread = threading.Thread(target=self._readStderr)
+        self.stderrThread.daemon = True
+        self.stderrThread.start()
+
+        self.timer = None
+        if timeout:
+            self.timer = threading.Timer(timeout, self._onTimeout)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def _readStderr (self):
+        for data in iter(lambda: self.process.stderr.read(4096), b''):
+            self.stderrChunks.append(data)
+
+    def _onTimeout (self):
+        # only a timeout if the process is still running: the timer may
+        #  fire after it finished, before _finish() cancels the timer
+        if self.process.poll() is not None:
+            return
+        self.timedOut = True
+        self.kill()
+
+    def kill (self):
+        # Purpose: kill the process and anything it started
+        try:
+            os.killpg(self.process.pid, signal.SIGKILL)
+        except ProcessLookupError:      # already gone
+            pass
+
+    def iterChunks (self, chunkSize = 65536):
+        # Purpose: generate stdout chunks (bytes) as they are read.
+        #	If the caller stops early (closes the generator), the process
+        #	is killed.
+        # Throws: ExtractionTimeoutError, ExtractionOversizeError when the
+        #	output ends because a limit was breached
+        outputBytes = 0
+        oversize = False
+        finished = False
+        try:
+            while True:
+                data = self.process.stdout.read1(chunkSize)
+                if not data:
+                    break
+                outputBytes += len(data)
+                if self.maxOutputBytes and outputBytes > self.maxOutputBytes:
+                    oversize = True
+                    break
+                yield data
+            finished = True
+        finally:
+            if not finished or oversize:
+                self.kill()
+            self._finish()
+
+        if self.timedOut:
+            raise ExtractionTimeoutError('Extraction timed out after %s seconds: %s' % \
+                                    (self.timeout, self.cmdText), self.stderr)
+        if oversize:
+            raise ExtractionOversizeError('Extraction output exceeded %d bytes: %s' % \
+                            (self.maxOutputBytes, self.cmdText), self.stderr)
+
+    def _finish (self):
+        # Purpose: (private) wait for the process & clean up
+        self.returncode = self.process.wait()
+        if self.timer:
+            self.timer.cancel()
+        self.stderrThread.join()
+        self.process.stdout.close()
+        self.process.stderr.close()
+        self.stderr = b''.join(self.stderrChunks)
+
+class DoiRule (object):
+    # Is: one publisher (journal) specific rule that DoiFinder.getDoiID()
+    #	applies to the DOI IDs it finds
+    # Has: name - for statistics
+    #	doiPrefixes - tuple of DOI ID prefixes the rule applies to, each
+    #	    starting with the registrant code, e.g., ('10.1126/science',)
+    #	phase - when the rule is applied:
+    #	    'marker' - before searching for a DOI ID, if 'marker' is in the
+    #		text. func(finder, text) finds the DOI ID itself.
+    #	    'raw' - to the first DOI ID match, before the generic newline
+    #		cleanup. All matching raw rules are applied, in order.
+    #	    'clean' - after the generic cleanup. Only the first matching
+    #		clean rule is applied.
+    #	    raw & clean rules: func(finder, doiID, text, match) returns the
+    #	    revised DOI ID
+    #	window - the part of the text the rule needs: 'head' (the start of
+    #	    the text is enough), 'tail' (the end), or 'full'
+    #	    (see DoiFinder.needsFullText())
+    #	marker - for 'marker' rules, the text that triggers the rule
+
+    def __init__ (self, name, doiPrefixes, phase, func, window='head',
+                                                            marker=None):
+        self.name = name
+        self.doiPrefixes = tuple(doiPrefixes)
+        self.registrants = set([ p.split('/')[0] for p in doiPrefixes ])
+        self.phase = phase
+        self.func = func
+        self.window = window
+        self.marker = marker
+
+    def matches (self, doiID):
+        return doiID.startswith(self.doiPrefixes)
+# end class DoiRule -------------------
+
 class DoiFinder (object):
     # Is: a parser that knows how find the DOI ID in the extracted text of a PDF
-    # Has:  journal specific reg ex's and logic
+    # Has:  journal specific reg ex's and logic, as DoiRules dispatched by
+    #	the registrant code of the DOI ID found (see registerRule())
     # Does: return the DOI ID in a text string
 
     # Define regex's as class variables so they are only compiled once,
@@ -52,15 +704,75 @@ class DoiFinder (object):
     # 10.1177 is Sage publisher: https://us.sagepub.com/en-us/nam/sage-journals
     SAGE_DOI_RE = re.compile('(10\.1177/[a-zA-Z0-9\-\.]+)Journal')
 
+    # publisher specific rules, see DoiRule and registerRule()
+    # A subclass that declares its own _markerRules and _registry gets
+    # its own ruleStatistics too.
+    _markerRules = []       # 'marker' phase rules, in registration order
+    _registry = {}          # registrant code (e.g., '10.1126') -> its rules
+    ruleStatistics = {}     # rule name -> {'hits': n, 'seconds': s}
+
+    @classmethod
+    def registerRule (cls, rule):
+        # Purpose: add a DoiRule to the rules getDoiID() applies.
+        #	Rules for the same DOI IDs are applied in registration order.
+        if '_registry' in cls.__dict__ and 'ruleStatistics' not in cls.__dict__:
+            cls.ruleStatistics = {}
+        if rule.phase == 'marker':
+            cls._markerRules.append(rule)
+        for registrant in rule.registrants:
+            cls._registry.setdefault(registrant, []).append(rule)
+        cls.ruleStatistics[rule.name] = {'hits': 0, 'seconds': 0.0}
+
+    @classmethod
+    def getRuleStatistics (cls):
+        # Purpose: return list of strings: how often each rule was applied
+        #	and the time spent in it
+        lines = [ '%-15s %8s %10s' % ('DOI rule', 'hits', 'total ms') ]
+        for name, stats in sorted(cls.ruleStatistics.items()):
+            lines.append('%-15s %8d %10.3f' % (name, stats['hits'],
+                                                    1000 * stats['seconds']))
+        return lines
+
+    def _getRules (self, doiID, phase):
+        # Purpose: (private) return the rules of the given phase for doiID,
+        #	looked up by its registrant code
+        registrant = doiID[:doiID.find('/')]
+        return [ r for r in self._registry.get(registrant, [])
+                                    if r.phase == phase and r.matches(doiID) ]
+
+    def _applyRule (self, rule, *args):
+        # Purpose: (private) apply a rule, recording its hit & time
+        startTime = time.perf_counter()
+        doiID = rule.func(self, *args)
+        seconds = time.perf_counter() - startTime
+        stats = self.ruleStatistics[rule.name]
+        stats['hits'] += 1
+        stats['seconds'] += seconds
+        Instrumentation.addTime('DoiFinder.rule.' + rule.name, seconds)
+        return doiID
+
+    def needsFullText (self, doiID):
+        # Purpose: return True if getDoiID() found doiID in partial text
+        #	(e.g., the first pages) but must be rerun on the full text to
+        #	be sure it's the right ID, i.e., a rule for doiID needs more
+        #	than the start of the text
+        registrant = doiID[:doiID.find('/')]
+        for rule in self._registry.get(registrant, []):
+            if rule.window != 'head' and \
+                            (rule.phase == 'marker' or rule.matches(doiID)):
+                return True
+        return False
+
+    @Instrumentation.timed('DoiFinder.getDoiID')
     def getDoiID (self, text):
         # Purpose: return the DOI ID from the text, where text is the
         #          extracted text from a PDF.
         # Returns: string DOI ID or None (if no ID can be found)
 
-        if text.find('www.pnas.org') >= 0:
-            return self._getPnasID(text)
+        for rule in self._markerRules:          # e.g., pnas
+            if text.find(rule.marker) >= 0:
+                return self._applyRule(rule, text)
 
-        # Everything except pnas
         text = text.replace(' journal.pone', 'journal.pone')
         text = text.replace(' j.isci', 'j.isci')
         match = self.DOI_RE.search(text)
@@ -70,56 +782,12 @@ class DoiFinder (object):
 
         # Got an ID match, lets see if it needs any special handling
         doiID = match.group(1)
+        for rule in self._getRules(doiID, 'raw'):       # e.g., PLoS, ASM
+            doiID = self._applyRule(rule, doiID, text, match)
+
         slash = doiID.find('/')         # where is the 1st '/'
         nl = doiID.find('\n')           # where is the 1st '\n'
 
-        # special case for PLoS journals, which often have a line break in ID.
-        # PLOS journals have 28-character DOI IDs 99.98% of the time.
-        # Out of 10,000+ # PLOS DOI IDs in MGI so far, the only others are
-        #   single IDs with 21 and 24 characters. 
-        # So if we encounter a newline within the first 21 characters,
-        #   we can just remove it.
-        # Also as of new pdftotext util we started using in Oct 2019, the 1st
-        #  or 2nd ID occurrance in the paper may be truncated when a space is
-        #  inserted instead of a line break.
-        #  So try looking for a couple ID instances.
-        if doiID.startswith('10.1371/'):        # PLoS
-            if (0 <= nl < 21):	# remove potential nl
-                doiID = doiID.replace('\n', '', 1)
-                slash = doiID.find('/')
-                nl = doiID.find('\n')
-            i = 0
-            while len(doiID) < 28:		# try another occurrance
-                if i == 3: break	# quit after 3 tries
-                i += 1
-
-                match = self.DOI_RE.search(text, match.end())
-                if not match: break	# odd, this shouldn't happen, bail
-                doiID = match.group(1)
-                slash = doiID.find('/')
-                nl = doiID.find('\n')
-
-                if (0 <= nl < 21):	# remove potential nl
-                    doiID = doiID.replace('\n', '', 1)
-                    slash = doiID.find('/')
-                    nl = doiID.find('\n')
-
-        # Special case for Journals from American Society for Microbiology (ASM)
-        # Includes Molecular and Cellular Biology (also J Virol, MBio (mBio?),
-        #  Infec Immun)
-        # These have DOI IDs from 20 to 32 characters
-        #   -- but which are often interrupted by line breaks
-        # in their new (circa late-2016) PDF format. As workaround for the most
-        # common case, remove any newlines within the first 20 chars of the ID.
-        if doiID.startswith('10.1128/'):
-            while 0 <= nl < 20:
-                doiID = doiID.replace('\n', '', 1)
-                nl = doiID.find('\n')
-        
-        # This code is not journal specific. It would be nice to refactor
-        #   and have all the non-journal specific code in one place, but
-        #   this is a little scary to move.
-
         # if there is a newline right after the slash, just remove it
         if (nl >= 0) and (nl == (slash+1)):
             doiID = doiID.replace('\n', '', 1)
@@ -132,37 +800,136 @@ class DoiFinder (object):
 
         doiID = self._cleanEnd(doiID)   # rm trailing ')', ']', '.', whitespace
 
-        # Now back to journal specific code...
+        # Now back to journal specific code, the first matching rule wins
+        for rule in self._getRules(doiID, 'clean'):
+            doiID = self._applyRule(rule, doiID, text, match)
+            break
 
-        # if this is a '10.1177/...Journal' DOI ID,  (Sage journals)
-        # then remove the trailing 'Journal' text
-        if self.SAGE_DOI_RE.match(doiID):
-            doiID = doiID.replace('Journal', '')
+        return doiID
+    # end getDoiID() --------------
 
-        elif (doiID.find('/eLife') > 0) and (doiID.endswith('.001')):
-            doiID = doiID[:-4]       # eLife IDs often errantly end with .001
+    # special case for PLoS journals, which often have a line break in ID.
+    # PLOS journals have 28-character DOI IDs 99.98% of the time.
+    # Out of 10,000+ # PLOS DOI IDs in MGI so far, the only others are
+    #   single IDs with 21 and 24 characters. 
+    # So if we encounter a newline within the first 21 characters,
+    #   we can just remove it.
+    # Also as of new pdftotext util we started using in Oct 2019, the 1st
+    #  or 2nd ID occurrance in the paper may be truncated when a space is
+    #  inserted instead of a line break.
+    #  So try looking for a couple ID instances.
+    def _fixPlosID (self, doiID, text, match):
+        nl = doiID.find('\n')
+        if (0 <= nl < 21):	# remove potential nl
+            doiID = doiID.replace('\n', '', 1)
+        i = 0
+        while len(doiID) < 28:		# try another occurrance
+            if i == 3: break	# quit after 3 tries
+            i += 1
+
+            match = self.DOI_RE.search(text, match.end())
+            if not match: break	# odd, this shouldn't happen, bail
+            doiID = match.group(1)
+            nl = doiID.find('\n')
 
-        elif doiID.startswith('10.1182/blood'):
-            doiID = self._getBloodID(text)
+            if (0 <= nl < 21):	# remove potential nl
+                doiID = doiID.replace('\n', '', 1)
+        return doiID
+    # end _fixPlosID() --------------
+
+    # Special case for Journals from American Society for Microbiology (ASM)
+    # Includes Molecular and Cellular Biology (also J Virol, MBio (mBio?),
+    #  Infec Immun)
+    # These have DOI IDs from 20 to 32 characters
+    #   -- but which are often interrupted by line breaks
+    # in their new (circa late-2016) PDF format. As workaround for the most
+    # common case, remove any newlines within the first 20 chars of the ID.
+    def _fixAsmID (self, doiID, text, match):
+        nl = doiID.find('\n')
+        while 0 <= nl < 20:
+            doiID = doiID.replace('\n', '', 1)
+            nl = doiID.find('\n')
+        return doiID
+    # end _fixAsmID() --------------
 
-        elif doiID.startswith('10.1172/jci'):
-            doiID = self._getJciInsightID(text)
+    # if this is a '10.1177/...Journal' DOI ID,  (Sage journals)
+    # then remove the trailing 'Journal' text
+    def _fixSageID (self, doiID, text, match):
+        if self.SAGE_DOI_RE.match(doiID):
+            doiID = doiID.replace('Journal', '')
+        return doiID
+    # end _fixSageID() --------------
 
-        elif doiID.startswith('10.1530/REP'):
-            doiID = self._getReproductionID(text)
+    def _fixElifeID (self, doiID, text, match):
+        if (doiID.find('/eLife') > 0) and (doiID.endswith('.001')):
+            doiID = doiID[:-4]       # eLife IDs often errantly end with .001
+        return doiID
+    # end _fixElifeID() --------------
 
-        # if this is a Science DOI ID, we instead need to find and return the
-        #   last DOI ID for the PDF file.
-        # scitranslmed is from the same publisher (like scisignal) but is not
-        #   handled here.
-        # I haven't found any examples in our db from scitranslmed or scisignal
-        #   where the 1st doi is the wrong one (haven't looked too hard either)
-        elif doiID.startswith('10.1126/science') or \
-            doiID.startswith('10.1126/scisignal'):
-            doiID =  self._getScienceID(text)
+    # getDoiIDs() only sends worker processes the start of each text when
+    #  that is all getDoiID() needs: the article's DOI is near the start,
+    #  unless a rule for it (or a marker in the text) declares it needs more
+    HEAD_CHARS = 200000
 
-        return doiID
-    # end getDoiID() --------------
+    def getDoiWindow (self, text,
+        headChars = HEAD_CHARS
+        ):
+        # Purpose: return the part of text that getDoiIDs() searches: its
+        #	first headChars characters if the first DOI ID is in them and
+        #	its rules only need the start of the text (window 'head'), or
+        #	there is no DOI ID at all; else the whole text, so getDoiID()
+        #	gives the same answer on the window as on the text
+        if len(text) <= headChars:
+            return text
+        for rule in self._markerRules:          # e.g., pnas
+            if text.find(rule.marker) >= 0:
+                return text
+
+        head = text[:headChars]
+        cleaned = head.replace(' journal.pone', 'journal.pone')
+        cleaned = cleaned.replace(' j.isci', 'j.isci')
+        match = self.DOI_RE.search(cleaned)
+        if match is None:
+            if self.DOI_RE.search(text) is None:
+                return head                     # no DOI ID anywhere
+            return text
+        if match.end() == len(cleaned) or self.needsFullText(match.group(1)):
+            return text                         # may be cut off, or a rule
+        return head                             #  needs more than the start
+
+    def getDoiIDs (self, texts,
+        workers = 1,            # number of processes, 1 means run in this
+                                #  process
+        chunksize = 20,         # texts sent to a worker at a time
+        ordered = True,         # generate results in input order? Else as
+                                #  they are completed
+        headChars = HEAD_CHARS  # size of the text windows, see getDoiWindow()
+        ):
+        # Purpose: find the DOI IDs in many texts, fanned out over a pool
+        #	of processes. Only each text's window is sent to the workers.
+        # Returns: generator of (index, DOI ID or None, error) tuples, where
+        #	index is the position of the text in 'texts' and error is ''
+        #	or a message if getDoiID() raised an exception for the text.
+        #	Exceptions are returned, not raised, so one bad text doesn't
+        #	stop a corpus-wide run.
+
+        windows = ( (i, self.getDoiWindow(text, headChars))
+                                        for i, text in enumerate(texts) )
+        if workers <= 1:
+            _initDoiWorker(self)
+            for item in windows:
+                yield _findDoiInWindow(item)
+            return
+
+        with multiprocessing.Pool(workers, _initDoiWorker, (self,)) as pool:
+            if ordered:
+                results = pool.imap(_findDoiInWindow, windows, chunksize)
+            else:
+                results = pool.imap_unordered(_findDoiInWindow, windows,
+                                                                    chunksize)
+            for result in results:
+                yield result
+    # end getDoiIDs() --------------
 
     END_CLEAN_RE = re.compile('[\)\.\]\s]+$')
     def _cleanEnd (self, text):
@@ -318,6 +1085,42 @@ class DoiFinder (object):
     # end _getScienceID() --------------
 # end class DoiFinder -------------------
 
+_BUILTIN_RULES = [
+        DoiRule('PNAS', ('10.1073',), 'marker',
+                lambda f, text: f._getPnasID(text),
+                window='full', marker='www.pnas.org'),
+        # PLoS may look for later occurrences of a truncated ID
+        DoiRule('PLoS', ('10.1371/',), 'raw', DoiFinder._fixPlosID,
+                window='full'),
+        DoiRule('ASM', ('10.1128/',), 'raw', DoiFinder._fixAsmID),
+        DoiRule('Sage', ('10.1177/',), 'clean', DoiFinder._fixSageID),
+        DoiRule('eLife', ('10.7554/',), 'clean', DoiFinder._fixElifeID),
+        DoiRule('Blood', ('10.1182/blood',), 'clean',
+                lambda f, doiID, text, match: f._getBloodID(text),
+                window='full'),
+        DoiRule('JCI', ('10.1172/jci',), 'clean',
+                lambda f, doiID, text, match: f._getJciInsightID(text)),
+        DoiRule('Reproduction', ('10.1530/REP',), 'clean',
+                lambda f, doiID, text, match: f._getReproductionID(text)),
+        # if this is a Science DOI ID, we instead need to find and return
+        #   the last DOI ID for the PDF file.
+        # scitranslmed is from the same publisher (like scisignal) but is
+        #   not handled here.
+        # I haven't found any examples in our db from scitranslmed or
+        #   scisignal where the 1st doi is the wrong one (haven't looked
+        #   too hard either)
+        DoiRule('Science', ('10.1126/science', '10.1126/scisignal'), 'clean',
+                lambda f, doiID, text, match: f._getScienceID(text),
+                window='tail'),
+        ]
+
+def _registerBuiltinRules ():
+        # Purpose: (private) register the publisher specific DoiRules
+        for rule in _BUILTIN_RULES:
+                DoiFinder.registerRule(rule)
+
+_registerBuiltinRules()
+
 class PdfParser:
         # Is: a parser that knows how to extract text from a PDF file
         # Has: path to a PDF file, text from a PDF file
@@ -339,6 +1142,9 @@ class PdfParser:
                 self.pdfPath = pdfPath	# string; path to the PDF file
                 self.fullText = None	# string; text from the PDF file
                 self.loaded = False	# boolean; did we read the file yet?
+                self.pageIndex = None   # PageIndex for fullText, once built
+                self.preflightResult = None     # PdfPreflight, once checked
+                self.stderr = ''
                 return
 
         def _loadFullText (self):
@@ -351,41 +1157,283 @@ class PdfParser:
                 if self.loaded:
                         return
 
-                if not LITPARSER:
+                if not LITPARSER and not LITPARSER_POOL:
                         raise Exception('Must initialize pdfParser library using setLitParserDir()')
 
-                self.stderr = ''
+                if not LITPARSER_POOL:         # index pages as we read
+                        pageIndex = PageIndex.PageIndex()
+                        chunks = []
+                        with Instrumentation.timer('PdfParser.litparser'):
+                                for chunk in self._iterExtraction():
+                                        pageIndex.addChunk(chunk)
+                                        chunks.append(chunk)
+                        self.fullText = ''.join(chunks)
+                        self.pageIndex = pageIndex
+                        self.loaded = True
+                        return
+
+                self._startExtraction()
+                try:
+                        with Instrumentation.timer('PdfParser.litparser'):
+                                returncode, stdout, self.stderr = \
+                                        LITPARSER_POOL.extract(self.pdfPath,
+                                                EXTRACTION_TIMEOUT,
+                                                EXTRACTION_MAX_OUTPUT,
+                                                EXTRACTION_MAX_MEMORY)
+                except ExtractionTimeoutError as e:
+                        self._noteLimitBreach('timeouts', e)
+                        raise
+                except ExtractionOversizeError as e:
+                        self._noteLimitBreach('oversize', e)
+                        raise
+                self._checkReturnCode(returncode, 'litparser pool')
+
+                # parsing was successful, so grab the text and note that we
+                # loaded the file
+                self.fullText = stdout
+                self.loaded = True
+                return
+
+        def _iterExtraction (self):
+                # Purpose: (private) run litparser on the PDF file and
+                #	generate its text (strings) as it is read. If the
+                #	caller stops early (closes the generator), litparser
+                #	is killed.
+                # Throws: Exception if there are errors in parsing the file
+                #	(after the text that was read has been generated)
+
+                self._startExtraction()
                 cmd = [ LITPARSER, self.pdfPath ]
-                cmdText = ' '.join(cmd)
+                encoding = locale.getpreferredencoding(False)
+                decoder = getTextDecoder(encoding)
+                process = _LitParserProcess(cmd, EXTRACTION_TIMEOUT,
+                                EXTRACTION_MAX_OUTPUT, EXTRACTION_MAX_MEMORY)
+                chunks = process.iterChunks()
                 try:
-                        completedProcess = subprocess.run(cmd, text=True,
-                                                            capture_output=True)
-                except: # error in attempting to execute parsing script
-                        raise Exception('Failed to execute: %s' % cmdText)
+                        for data in chunks:
+                                text = decoder.decode(data)
+                                if text:
+                                        yield text
+                except ExtractionTimeoutError as e:
+                        self._noteLimitBreach('timeouts', e)
+                        raise
+                except ExtractionOversizeError as e:
+                        self._noteLimitBreach('oversize', e)
+                        raise
+                finally:
+                        chunks.close()  # kills litparser if we stopped early
+
+                text = decoder.decode(b'', True)
+                if text:
+                        yield text
+                self.stderr = process.stderr.decode(encoding, 'replace')
+                self._checkReturnCode(process.returncode, process.cmdText)
+                return
+
+        def preflight (self):
+                # Purpose: return the PdfPreflight for the PDF file (only
+                #	checked once)
+                if self.preflightResult is None:
+                        self.preflightResult = preflightPdf(self.pdfPath)
+                return self.preflightResult
+
+        def _checkPreflight (self):
+                # Purpose: (private) if setPreflightCheck() is on, make sure
+                #	the PDF file passes the preflight check
+                # Throws: PdfInvalidError if it does not
+
+                if not PREFLIGHT_CHECK:
+                        return
+                problems = self.preflight().getProblems()
+                if problems:
+                        _addStat('rejected')
+                        Instrumentation.count('PdfParser.rejected')
+                        self.stderr = 'Preflight: %s\n' % '; '.join(problems)
+                        raise PdfInvalidError('Invalid PDF file %s: %s' % \
+                                (self.pdfPath, '; '.join(problems)),
+                                self.preflight())
+                return
+
+        def _startExtraction (self):
+                # Purpose: (private) note that we're starting an extraction
+                # Throws: PdfInvalidError if the PDF fails the preflight check
+                self._checkPreflight()
+                self.stderr = ''
+                _addStat('extractions')
+                Instrumentation.count('PdfParser.extractions')
 
-                self.stderr = completedProcess.stderr
+        def _checkReturnCode (self, returncode, cmdText):
+                # Purpose: (private) check the exit code of an extraction
+                # Throws: Exception if the parsing script finished with an
+                #	error code
 
-                # parsing script finished with an error code?
-                if (completedProcess.returncode != 0):
+                if (returncode != 0):
+                        _addStat('failures')
+                        Instrumentation.count('PdfParser.failures')
                         msg = 'Failed to parse %s\n' % self.pdfPath
                         msg += 'Stderr from %s:\n%s\n' % (cmdText, self.stderr)
                         raise Exception(msg)
-
-                # parsing was successful, so grab the text and note that we
-                # loaded the file
-                self.fullText = completedProcess.stdout
-                self.loaded = True
                 return
 
+        def _noteLimitBreach (self, statName, e):
+                # Purpose: (private) record an extraction that was killed
+                #	for breaching one of the extraction limits
+                _addStat(statName)
+                Instrumentation.count('PdfParser.' + statName)
+                stderr = e.stderr
+                if isinstance(stderr, bytes):
+                        stderr = stderr.decode(
+                                locale.getpreferredencoding(False), 'replace')
+                self.stderr = stderr
+
         def getStderr(self):
                 return self.stderr
 
+        def _runPdfToText (self, firstPage, lastPage):
+                # Purpose: (private) extract the text of pages firstPage
+                #	to lastPage (1-based, inclusive; None means to the
+                #	end) with pdftotext
+                # Returns: string, or None if pdftotext failed (its stderr
+                #	is in self.stderr)
+                # Throws: ExtractionTimeoutError, ExtractionOversizeError
+
+                cmd = PDFTOTEXT + [ '-f', str(firstPage) ]
+                if lastPage:
+                        cmd += [ '-l', str(lastPage) ]
+                cmd += [ self.pdfPath, '-' ]
+                self._checkPreflight()
+                _addStat('pageRanges')
+                try:
+                        with Instrumentation.timer('PdfParser.pdftotext'):
+                                returncode, stdout, stderr = runLitParser(cmd,
+                                                EXTRACTION_TIMEOUT,
+                                                EXTRACTION_MAX_OUTPUT,
+                                                EXTRACTION_MAX_MEMORY)
+                except ExtractionTimeoutError as e:
+                        self._noteLimitBreach('timeouts', e)
+                        raise
+                except ExtractionOversizeError as e:
+                        self._noteLimitBreach('oversize', e)
+                        raise
+
+                encoding = locale.getpreferredencoding(False)
+                self.stderr = stderr.decode(encoding, 'replace')
+                if returncode != 0:
+                        return None
+                return decodeOutput(stdout, encoding)
+
+        def getPagesText (self,
+                first = 0,      # int; number of pages from the start
+                last = 0        # int; number of pages from the end
+                ):
+                # Purpose: return the text of just the first 'first' pages
+                #	and/or the last 'last' pages of the PDF (each page
+                #	ends with a form feed, as in the full text)
+                # Returns: string, or None if the text can't be extracted
+                # Throws: Exception if setPdfToText() has not been called
+                # Notes: if the full text is already loaded, the pages are
+                #	sliced from it. Getting the last pages needs the page
+                #	count (getPdfPageCount()); if it can't be found, the
+                #	whole document is extracted.
+
+                if self.loaded:
+                        if not self.fullText:
+                                return None
+                        if first + last >= self.getPageCount():
+                                return self.fullText
+                        return self.getPages(0, first) + \
+                                self.getPages(self.getPageCount() - last)
+
+                if not PDFTOTEXT:
+                        raise Exception('Must initialize pdfParser library using setPdfToText()')
+
+                ranges = []
+                if first:
+                        ranges.append((1, first))
+                if last:
+                        pageCount = getPdfPageCount(self.pdfPath)
+                        if pageCount is None:
+                                ranges = [ (1, None) ]  # whole document
+                        elif first >= pageCount - last:
+                                ranges = [ (1, pageCount) ]
+                        else:
+                                ranges.append((pageCount - last + 1, pageCount))
+
+                texts = []
+                for firstPage, lastPage in ranges:
+                        text = self._runPdfToText(firstPage, lastPage)
+                        if text is None:
+                                return None
+                        texts.append(text)
+                return ''.join(texts)
+
+        def _findFrontMatterDoiID (self, text):
+                # Purpose: (private) look for a DOI ID in the text of just
+                #	the first pages of the PDF file
+                # Returns: string DOI ID if it can be trusted without the
+                #	full text, else None
+
+                if text:
+                        doiID = self.doiFinder.getDoiID(text)
+                        if doiID and not self.doiFinder.needsFullText(doiID):
+                                _addStat('doiFrontMatter')
+                                Instrumentation.count('PdfParser.doiFrontMatter')
+                                return doiID
+                _addStat('doiFullText')
+                Instrumentation.count('PdfParser.doiFullText')
+                return None
+
+        def _streamFrontMatterDoiID (self):
+                # Purpose: (private) look for a DOI ID in the first pages
+                #	of the text as litparser produces it, stopping
+                #	litparser as soon as we have one we can trust
+                # Returns: string DOI ID or None. If None, the full text
+                #	has been read and loaded.
+
+                pages = []
+                pageIndex = PageIndex.PageIndex()
+                stream = self.iterText(byPage=True)
+                for page in stream:
+                        pages.append(page)
+                        pageIndex.addChunk(page)
+                        if len(pages) == DOI_FIRST_PAGES:
+                                doiID = self._findFrontMatterDoiID(
+                                                                ''.join(pages))
+                                if doiID:
+                                        stream.close()  # stops litparser
+                                        return doiID
+                if len(pages) < DOI_FIRST_PAGES:        # never looked
+                        _addStat('doiFullText')
+                        Instrumentation.count('PdfParser.doiFullText')
+
+                self.fullText = ''.join(pages)
+                self.pageIndex = pageIndex
+                self.loaded = True
+                return None
+
         def getFirstDoiID (self):
                 # Purpose: return the first DOI ID from the PDF file
                 # Returns: string DOI ID or None (if no ID can be found)
                 # Throws: Exception if this library has not been properly
                 #	initialized or if there are errors in parsing the file
                 # Note: this would be more aptly named getDoiID()
+                # Note: if setDoiFirstPages() is on, we first look in just
+                #	the first DOI_FIRST_PAGES pages, extracted with
+                #	pdftotext if setPdfToText() has been called, else by
+                #	reading litparser's output as it comes and stopping it
+                #	once we have a DOI. We only use the full text if no DOI
+                #	is found there or the DoiFinder needs the full text for
+                #	the DOI found.
+
+                if DOI_FIRST_PAGES and not self.loaded:
+                        doiID = None
+                        if PDFTOTEXT:
+                                doiID = self._findFrontMatterDoiID(
+                                        self.getPagesText(first=DOI_FIRST_PAGES))
+                        elif LITPARSER and not LITPARSER_POOL:
+                                doiID = self._streamFrontMatterDoiID()
+                        if doiID:
+                                return doiID
 
                 self._loadFullText()
 
@@ -394,6 +1442,37 @@ class PdfParser:
                 else:
                         return None
 
+        def iterText (self,
+                byPage = False  # boolean; generate one page at a time?
+                ):
+                # Purpose: generate the text of the PDF file as it is
+                #	extracted: chunks of text or, if byPage, pages (each
+                #	ending with its form feed)
+                # Throws: Exception if this library has not been properly
+                #	initialized or if there are errors in parsing the file
+                #	(after the text read so far has been generated)
+                # Notes: stopping early (break, or closing the generator)
+                #	stops litparser, so callers only pay for the text they
+                #	use. The text is not kept; use getText() for that.
+                #	If the text is already loaded or a LitParserPool is in
+                #	use, the whole text is loaded and then generated.
+
+                if self.loaded or LITPARSER_POOL:
+                        self._loadFullText()
+                        chunks = _iterChunks(self.fullText or '')
+                elif LITPARSER:
+                        chunks = self._iterExtraction()
+                else:
+                        raise Exception('Must initialize pdfParser library using setLitParserDir()')
+
+                if byPage:
+                        chunks = _iterPages(chunks)
+                try:
+                        for text in chunks:
+                                yield text
+                finally:
+                        chunks.close()
+
         def getText (self):
                 # Purpose: return the full text extracted from the PDF file
                 # Returns: string (full text)
@@ -402,4 +1481,44 @@ class PdfParser:
                 if self.fullText:
                         return self.fullText
                 return None
+
+        def getPageIndex (self):
+                # Purpose: return the PageIndex of the full text (see
+                #	PageIndex.py), built as the text was read
+                # Returns: PageIndex object
+
+                self._loadFullText()
+                if self.pageIndex is None:
+                        self.pageIndex = PageIndex.fromText(self.fullText or '')
+                return self.pageIndex
+
+        def getPageCount (self):
+                # Purpose: return the number of pages in the full text
+                return self.getPageIndex().getPageCount()
+
+        def getPageOffsets (self):
+                # Purpose: return list of the start offsets of each page in
+                #	the full text
+                return self.getPageIndex().getPageOffsets()
+
+        def getPage (self,
+                n               # int; page number, 0-based, negative
+                                #  counts from the end (-1 is the last)
+                ):
+                # Purpose: return the text of one page (ending with its
+                #	form feed), sliced from the full text
+                # Throws: IndexError if there is no such page
+
+                return self.getPageIndex().getPage(self.fullText, n)
+
+        def getPages (self,
+                first = 0,      # int; first page number (as in getPage())
+                last = None     # int; page after the last one wanted,
+                                #  None for the end (like a slice)
+                ):
+                # Purpose: return the text of a range of pages, sliced from
+                #	the full text
+
+                return self.getPageIndex().getPages(self.fullText or '',
+                                                                first, last)
 # end class PdfParser  -------------------
@@ -3,16 +3,26 @@
 # Usage:
 # 1. call setToolName() and/or setEmailAddress() as desired to override
 #	default values
-# 2. instantiate a PubMedAgent, PubMedAgentJson, or PubMedAgentMedline
+# 2. instantiate a PubMedAgent, PubMedAgentJson, PubMedAgentMedline, or
+#	PubMedAgentSummary (metadata only)
 #	(depending on your desired return type)
 # 3. start passing DOI IDs (singly or in a list) to the agent and getting
 #	back data in your desired format using getReference(doiID) or getReferences(doiList)
+# 4. for very many PubMed IDs, PubMedAgentMedline.iterReferenceInfo(pubMedIDs)
+#	posts them once to the Entrez history server and yields PubMedReference
+#	objects a page at a time
+# 5. agents someone is waiting on (e.g., the Lit Triage UI) should be created
+#	with priority=HttpRequestGovernor.INTERACTIVE so their requests go ahead
+#	of bulk loads' requests waiting for the governor
 
 import csv
 import xml.dom.minidom 
 import os
 import re
+import json
+import hashlib
 import HttpRequestGovernor
+import Instrumentation
 
 ###--- Globals ---###
 
@@ -31,8 +41,8 @@ XML = 'xml'
 # return mode
 TEXT='text'
 
-# e-utilities key
-EUTILS_API_KEY =  os.environ['EUTILS_API_KEY']
+# e-utilities key (without one, eutils allows fewer requests per second)
+EUTILS_API_KEY =  os.environ.get('EUTILS_API_KEY', '')
 
 # URL for sending DOI IDs to PubMed to be converted to PubMed IDs;
 # need to fill in tool name, email address, and comma-delimited list of DOI IDs
@@ -44,13 +54,50 @@ PMCID_CONVERTER_URL = '''https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.f
 # tool name, and email address
 REFERENCE_FETCH_URL = '''https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=pubmed&id=%s&retmode=%s&rettype=%s&api_key=''' + EUTILS_API_KEY
 
+# URLs for fetching reference data for very many PubMed IDs via the Entrez
+# history server: POST the IDs once to EPOST_URL (body 'id=1,2,3...'), then
+# page through them with HISTORY_FETCH_URL; need to fill in query key, WebEnv,
+# retstart, retmax, return mode and return type
+EPOST_URL = '''https://eutils.ncbi.nlm.nih.gov/entrez/eutils/epost.fcgi?db=pubmed&api_key=''' + EUTILS_API_KEY
+HISTORY_FETCH_URL = '''https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi?db=pubmed&query_key=%s&WebEnv=%s&retstart=%d&retmax=%d&retmode=%s&rettype=%s&api_key=''' + EUTILS_API_KEY
+
+# number of references fetched per history server request (eutils max is 10000)
+HISTORY_PAGE_SIZE = 500
+
+# URL for getting summary (metadata only) data for PubMed IDs as json;
+# POST the comma-delimited list of PubMed IDs (body 'id=1,2,3...')
+SUMMARY_URL = '''https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi?db=pubmed&retmode=json&api_key=''' + EUTILS_API_KEY
+
+# number of PubMed IDs per esummary request
+SUMMARY_BATCH_SIZE = 500
+
+# separates Medline records in a multi-record response
+MEDLINE_SEP_RE = re.compile('\n\s*\n')
+
+# PubMedReference fields that go into its fingerprint (see computeFingerprint())
+FINGERPRINT_FIELDS = [ 'pubMedID', 'doiID', 'pmcID', 'title', 'authors',
+    'journal', 'date', 'year', 'issue', 'pages', 'abstract', 'volume',
+    'primaryAuthor', 'publicationType', 'elocator', ]
+
 # Governer is needed to ensure we don't issue too many requests of eutils and start getting 429 errors.
 # Eutils allows 3 per second, so max out at 2 just to be conservative.
-gov = HttpRequestGovernor.HttpRequestGovernor(0.5, 120, 7200, 172800)
+# 10% of the per minute/hour/day limits are kept for INTERACTIVE agents, so
+# curators' lookups are not starved by bulk loads.
+gov = HttpRequestGovernor.HttpRequestGovernor(0.5, 120, 7200, 172800,
+                                                interactiveReserve = 0.1)
+HttpRequestGovernor.registerGovernor('eutils.ncbi.nlm.nih.gov/', gov)
 
 # LID/ELOCATORE search
 ELOCATOR_RE = re.compile('(E[0-9]+)')
 
+# max number of eutils requests outstanding at once (in separate threads) when
+# looking up many IDs, see HttpRequestGovernor.fetchAll()
+MAX_IN_FLIGHT = 4
+
+# AccessionIndex of IDs we already know, consulted before NCBI.
+# None means always ask NCBI. See setAccessionIndex()
+ACCESSION_INDEX = None
+
 ###--- Functions ---###
 
 def setToolName(tool):
@@ -68,6 +115,29 @@ def setEmailAddress(email):
     EMAIL_ADDRESS = email
     return
 
+def setAccessionIndex(index):
+    # Purpose: set the AccessionIndex that getPubMedIDs() looks DOI IDs up
+    #     in before asking NCBI (None = always ask NCBI).
+    #     PubMed IDs found at NCBI are added to the index.
+    global ACCESSION_INDEX
+
+    ACCESSION_INDEX = index
+    return
+
+def _iterSummaryRecords(response):
+    # Purpose: (private) read the records out of an esummary json response
+    # Returns: generator of (uid, record dict), in the order of the response
+    #   (uids in the 'uids' list with no record are skipped)
+    # Throws: Exception if the response is not json or has no 'result'
+    #   (e.g., an error or a truncated body), before any records are returned
+    try:
+        records = [ (uid, record) for uid, record in
+                    json.loads(response)['result'].items() if uid != 'uids' ]
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise Exception('Error from esummary: %s' % response.strip())
+    for uid, record in records:
+        yield uid, record
+
 ###--- Classes ---###
 
 class PubMedReference:
@@ -94,6 +164,7 @@ class PubMedReference:
         self.primaryAuthor = None
         self.publicationType = None
         self.elocator = None
+        self.fingerprint = None
         # add other fields as needed
 
         self.errorMessage = errorMessage
@@ -167,6 +238,21 @@ class PubMedReference:
         self.elocator = elocator
     def getElocator(self):
         return self.elocator
+    def setFingerprint(self, fingerprint):
+        self.fingerprint = fingerprint
+    def getFingerprint(self):
+        return self.fingerprint
+
+    def computeFingerprint(self):
+        # Purpose: compute a fingerprint of the reference data (the fields
+        #   set from the Medline record), so we can tell if a reference has
+        #   changed in PubMed since we last saw it
+        # Returns: str. hex sha1 of the fields, each whitespace-normalized
+        values = []
+        for field in FINGERPRINT_FIELDS:
+            value = getattr(self, field)
+            values.append(' '.join(str(value).split()) if value else '')
+        return hashlib.sha1('\t'.join(values).encode('utf-8')).hexdigest()
     # add other accessors as needed
 
 class PubMedAgent:
@@ -175,8 +261,12 @@ class PubMedAgent:
         # Does: takes DOI IDs, queries PubMed, and returns PubMedReference
         #	objects for them
 
-        def __init__ (self):
+        def __init__ (self, priority = HttpRequestGovernor.BATCH):
             # Purpose: constructor
+            # Notes: priority is the governor lane for this agent's requests:
+            #   HttpRequestGovernor.INTERACTIVE for lookups someone is
+            #   waiting on (e.g., from the Lit Triage UI), BATCH for loads
+            self.priority = priority
             return
 
         def getPubMedID (self, doiID):
@@ -187,40 +277,51 @@ class PubMedAgent:
 
                 return self.getPubMedIDs([doiID])[doiID]
 
+        @Instrumentation.timed('PubMedAgent.getPubMedIDs')
         def getPubMedIDs (self, doiList):
             # Purpose: return a dictionary mapping from each DOI ID to its
             #     corresponding PubMed ID.  If no PubMed ID for a given DOI ID,
             #     then that one maps to None.
             # Throws: Exception if the URL returns an error
             mapping = {}  # {doiid: [pubMedId(s)], ...}
+            toLookUp = []  # [(doiid, url), ...] not in the accession index
             for doiID in doiList:
-                try:
-                    #print('### Getting PubMed IDs for (%s) ###\n' % (doiID))
-                    forUrl = doiID
-                    forUrl = doiID.replace('(', '*')
-                    forUrl = doiID.replace(')', '*')
-                    forUrl = doiID.replace(';', '*')
-                    forUrl = doiID.replace(':', '*')
-                    idUrl = PUBMEDID_CONVERTER_URL % (XML, forUrl)
-                    record = gov.get(idUrl.replace('[', '%5B').replace(']', '%5D'))
-                    xmldoc = xml.dom.minidom.parseString(record)
-                    pubmedIDs = xmldoc.getElementsByTagName("Id")
-                    if doiID not in mapping:
-                        mapping[doiID] = []
-                    if pubmedIDs == []:
-                        mapping[doiID].append(None)
-                    else:
-                        for pmID in pubmedIDs:
-                            mapping[doiID].append(pmID.firstChild.data)
-                except IOError as e:
-                        if hasattr(e, 'code'): # HTTPError
-                                print('HTTP error code: ', e.code)
-                                raise Exception('HTTP error code: %s' % e.code)
-                        elif hasattr(e, 'reason'): # URLError
-                                print("Can't connect, reason: ", e.reason)
-                                raise Exception("Can't connect, reason: %s" % e.reason)
-                        else:
-                                raise Exception('Unknown exception: %s' % e)
+                if doiID in mapping:    # duplicate, only look it up once
+                    continue
+                if ACCESSION_INDEX is not None:
+                    pmID = ACCESSION_INDEX.getPubMedID(doiID)
+                    if pmID:
+                        Instrumentation.count('PubMedAgent.indexHits')
+                        mapping[doiID] = [pmID]
+                        continue
+                #print('### Getting PubMed IDs for (%s) ###\n' % (doiID))
+                forUrl = doiID
+                forUrl = doiID.replace('(', '*')
+                forUrl = doiID.replace(')', '*')
+                forUrl = doiID.replace(';', '*')
+                forUrl = doiID.replace(':', '*')
+                idUrl = PUBMEDID_CONVERTER_URL % (XML, forUrl)
+                Instrumentation.count('PubMedAgent.doiLookups')
+                toLookUp.append((doiID, idUrl.replace('[', '%5B').replace(']', '%5D')))
+                mapping[doiID] = []
+
+            # overlap the requests, up to MAX_IN_FLIGHT at a time
+            results = HttpRequestGovernor.fetchAll([ url for (doiID, url) in toLookUp ],
+                                        MAX_IN_FLIGHT, priority = self.priority)
+
+            for (doiID, url), (record, error) in zip(toLookUp, results):
+                if error is not None:
+                    raise Exception('Error getting PubMed ID for %s: %s' % (doiID, error))
+                xmldoc = xml.dom.minidom.parseString(record)
+                pubmedIDs = xmldoc.getElementsByTagName("Id")
+                if pubmedIDs == []:
+                    mapping[doiID].append(None)
+                else:
+                    for pmID in pubmedIDs:
+                        mapping[doiID].append(pmID.firstChild.data)
+                    if ACCESSION_INDEX is not None and len(pubmedIDs) == 1:
+                        ACCESSION_INDEX.add(doiID=doiID,
+                                    pubmedID=mapping[doiID][-1])
 
             return mapping
 
@@ -251,6 +352,7 @@ class PubMedAgent:
             # call getReferenceInfo - which is implemented by the subclass.
 
             mapping = {}
+            refObjects = {} # {pubMedID: refObject} so each is only fetched once
             #print '### Getting PubMed References ###'
             for doiID in pubMedDict:
                 if doiID not in mapping:
@@ -262,7 +364,9 @@ class PubMedAgent:
                     if pubMedID == None:
                          mapping[doiID].append(refObject)
                     else:
-                         refObject = self.getReferenceInfo(pubMedID)
+                         if pubMedID not in refObjects:
+                             refObjects[pubMedID] = self.getReferenceInfo(pubMedID)
+                         refObject = refObjects[pubMedID]
                          mapping[doiID].append(refObject)
             return mapping
     
@@ -272,8 +376,9 @@ class PubMedAgentJson (PubMedAgent):
     # Does: takes DOI IDs, queries PubMed, and returns a JSON string
     #	for each reference
     # Note: Not implemented
-    def __init__ (self):
+    def __init__ (self, priority = HttpRequestGovernor.BATCH):
         # Purpose: constructor
+        PubMedAgent.__init__(self, priority)
         return
 
     # override method used to format each reference, reporting JSON
@@ -285,12 +390,85 @@ class PubMedAgentMedline (PubMedAgent):
     # Does: takes DOI IDs, queries PubMed, and returns a Medline-formatted
     #	str.for each reference
 
-    def __init__ (self):
+    def __init__ (self, priority = HttpRequestGovernor.BATCH):
+        PubMedAgent.__init__(self, priority)
         return
 
     # override method used to format each reference, reporting Medline
     # format for the PubMed request
 
+    def iterReferenceInfo(self, pubMedIDs, pageSize = HISTORY_PAGE_SIZE):
+        # Purpose: for large lists of PubMed IDs (too many for URLs): post
+        #   the IDs once to the Entrez history server, then fetch their
+        #   Medline records a page at a time
+        # Returns: generator of PubMedReference objects, yielded as each page
+        #   arrives. PubMed IDs that PubMed does not know are skipped, so use
+        #   getPubMedID() on each reference to match them up.
+        # Throws: Exception if EPost or a page fetch returns an error
+        pubMedIDs = [ str(x).strip() for x in pubMedIDs ]
+        if not pubMedIDs:
+            return
+
+        queryKey, webEnv = self._postPubMedIDs(pubMedIDs)
+
+        for retstart in range(0, len(pubMedIDs), pageSize):
+            Instrumentation.count('PubMedAgentMedline.historyPages')
+            page = HttpRequestGovernor.governedGet(HISTORY_FETCH_URL % \
+                                (queryKey, webEnv, retstart, pageSize, TEXT, MEDLINE),
+                                                priority = self.priority)
+            records = [ r.strip('\n') for r in MEDLINE_SEP_RE.split(page)
+                                        if r.strip().startswith('PMID') ]
+            if not records and page.strip():
+                raise Exception('Error fetching Medline records %d-%d: %s' % \
+                                (retstart, retstart + pageSize - 1, page.strip()))
+
+            for record in records:
+                yield self._parseMedlineRecord(record)
+
+    def iterChangedReferences(self, fingerprints, pageSize = HISTORY_PAGE_SIZE,
+                                                missing = None):
+        # Purpose: incremental refresh - fetch the Medline records for the
+        #   PubMed IDs in 'fingerprints' (dict {pubMedID: fingerprint we
+        #   stored last time, or None}), and return only the references
+        #   whose data has changed in PubMed
+        # Returns: generator of PubMedReference objects whose fingerprint
+        #   differs from the stored one (store getFingerprint() for next time).
+        #   After the last page, missing(list of PubMed IDs), if given, is
+        #   called with the PubMed IDs PubMed did not return (e.g., deleted
+        #   or merged references); they are neither changed nor unchanged.
+        # Throws: Exception if EPost or a page fetch returns an error
+        stored = dict([ (str(k).strip(), v) for k, v in fingerprints.items() ])
+        seen = set()
+        for pubMedRef in self.iterReferenceInfo(list(stored.keys()), pageSize):
+            seen.add(pubMedRef.getPubMedID())
+            if pubMedRef.getFingerprint() == stored.get(pubMedRef.getPubMedID()):
+                Instrumentation.count('PubMedAgentMedline.unchanged')
+            else:
+                Instrumentation.count('PubMedAgentMedline.changed')
+                yield pubMedRef
+
+        missingIDs = [ p for p in stored if p not in seen ]
+        Instrumentation.count('PubMedAgentMedline.missing', len(missingIDs))
+        if missing is not None:
+            missing(missingIDs)
+
+    def _postPubMedIDs(self, pubMedIDs):
+        # Purpose: (private) EPost the PubMed IDs to the Entrez history server
+        # Returns: (query key, WebEnv) to fetch them with
+        # Throws: Exception if EPost returns an error
+        Instrumentation.count('PubMedAgentMedline.epost')
+        response = HttpRequestGovernor.governedGet(EPOST_URL, data = 'id=' + ','.join(pubMedIDs),
+                                                priority = self.priority)
+        try:
+            xmldoc = xml.dom.minidom.parseString(response)
+            queryKey = xmldoc.getElementsByTagName('QueryKey')[0].firstChild.data
+            webEnv = xmldoc.getElementsByTagName('WebEnv')[0].firstChild.data
+        except Exception:
+            raise Exception('EPost of %d PubMed IDs failed: %s' % \
+                                            (len(pubMedIDs), response.strip()))
+        return queryKey, webEnv
+
+    @Instrumentation.timed('PubMedAgentMedline.getReferenceInfo')
     def getReferenceInfo(self, pubMedID):
         # Purpose: Implementation of the superclass stub. Given a pubMedID, get a
         #   MedLine record, parse, create and return a PubMedReference object
@@ -298,7 +476,8 @@ class PubMedAgentMedline (PubMedAgent):
         # Init the reference we will return
         pubMedRef = None
         try:
-            medLineRecord = gov.get(REFERENCE_FETCH_URL % (pubMedID, TEXT, MEDLINE))
+            medLineRecord = HttpRequestGovernor.governedGet(REFERENCE_FETCH_URL % (pubMedID, TEXT, MEDLINE),
+                                                priority = self.priority)
         except IOError as e:
             if hasattr(e, 'code'): # HTTPError
                 print('http error code: ', e.code)
@@ -309,7 +488,14 @@ class PubMedAgentMedline (PubMedAgent):
             else:
                 raise Exception('Unknown exception: %s' % e)
 
-        # if this pubMedID returns an error, create reference object with
+        return self._parseMedlineRecord(medLineRecord)
+
+    def _parseMedlineRecord(self, medLineRecord):
+        # Purpose: (private) parse one Medline format record (str)
+        # Returns: PubMedReference object (not valid, with the error message,
+        #   if the record is an error message)
+
+        # if the record is an error, create reference object with
         # that error message, otherwise parse the record
         if medLineRecord.find('Error occurred:') !=  -1:
             pubMedRef = PubMedReference(errorMessage = medLineRecord)
@@ -479,5 +665,72 @@ class PubMedAgentMedline (PubMedAgent):
             newTitle = newTitle.replace("dagger.", ".")
             newTitle = newTitle.replace("dagger..", ".")
             pubMedRef.setTitle(newTitle)
+            pubMedRef.setFingerprint(pubMedRef.computeFingerprint())
+
+        return pubMedRef
+
+class PubMedAgentSummary (PubMedAgent):
+    # Is: an agent that interacts with PubMed to get just the metadata of
+    #	references: PubMed ID, DOI ID, PMC ID, journal, date/year and
+    #	publication type
+    # Does: gets esummary json for PubMed IDs in large batches and returns
+    #	PubMedReference objects with only those fields set (no title,
+    #	authors, abstract), far less to transfer and parse than Medline
+
+    def __init__ (self, priority = HttpRequestGovernor.BATCH):
+        PubMedAgent.__init__(self, priority)
+        return
+
+    def getReferenceInfo(self, pubMedID):
+        # Purpose: Implementation of the superclass stub. Given a pubMedID,
+        #   return a PubMedReference object with its metadata
+        # Throws: Exception if the URL returns an error
+        for pubMedRef in self.iterReferenceInfo([pubMedID]):
+            return pubMedRef
+        return PubMedReference(errorMessage = 'No esummary for %s' % pubMedID)
+
+    def iterReferenceInfo(self, pubMedIDs, batchSize = SUMMARY_BATCH_SIZE):
+        # Purpose: get the metadata for PubMed IDs, 'batchSize' at a time
+        # Returns: generator of PubMedReference objects, in the order PubMed
+        #   returns them. PubMed IDs PubMed does not know give references
+        #   that are not valid (see isValid(), getErrorMessage()).
+        # Throws: Exception if the URL returns an error
+        pubMedIDs = [ str(x).strip() for x in pubMedIDs ]
+        for i in range(0, len(pubMedIDs), batchSize):
+            batch = pubMedIDs[i:i + batchSize]
+            Instrumentation.count('PubMedAgentSummary.requests')
+            response = HttpRequestGovernor.governedGet(SUMMARY_URL, data = 'id=' + ','.join(batch),
+                                                priority = self.priority)
+            for uid, record in _iterSummaryRecords(response):
+                yield self._parseSummaryRecord(uid, record)
+
+    def _parseSummaryRecord(self, uid, record):
+        # Purpose: (private) build a PubMedReference from one esummary record
+        # Returns: PubMedReference object
+        if 'error' in record:
+            return PubMedReference(errorMessage = '%s: %s' % (uid, record['error']))
+
+        pubMedRef = PubMedReference()
+        pubMedRef.setPubMedID(uid)
+        for articleID in record.get('articleids', []):
+            if articleID.get('idtype') == 'doi':
+                pubMedRef.setDoiID(articleID.get('value'))
+            elif articleID.get('idtype') == 'pmc':
+                pubMedRef.setPmcID(articleID.get('value'))
+
+        pubMedRef.setJournal(record.get('source'))
+        date = record.get('pubdate', '')
+        pubMedRef.setDate(date)
+        pubMedRef.setYear(str.split(date, ' ', 1)[0])
+
+        # same choice as Medline: Review/Editorial/Comment, else the last type
+        pubTypes = record.get('pubtype', [])
+        for pubType in pubTypes:
+            if pubType in ('Review', 'Editorial', 'Comment'):
+                pubMedRef.setPublicationType(pubType)
+                break
+        else:
+            if pubTypes:
+                pubMedRef.setPublicationType(pubTypes[-1])
 
         return pubMedRef
@@ -9,6 +9,7 @@
 import urllib.request, urllib.error, urllib.parse
 import xml.dom.minidom 
 import HttpRequestGovernor
+import Instrumentation
 
 ###--- Globals ---###
 
@@ -26,6 +27,24 @@ ID_CONVERTER_URL = '''https://www.ncbi.nlm.nih.gov/pmc/utils/idconv/v1.0/?tool=%
 # need to fill in a single PMC ID
 PDF_LOOKUP_URL = '''https://www.ncbi.nlm.nih.gov/pmc/utils/oa/oa.fcgi?id=%s'''
 
+# Governors for PubMed Central's services (see HttpRequestGovernor.registerGovernor()).
+# The ID converter and OA service each have their own governor, and share the limits of
+# the www.ncbi.nlm.nih.gov governor (NCBI asks for no more than 3 requests per second).
+ncbiGov = HttpRequestGovernor.HttpRequestGovernor(0.34, 180, 0, 0, interactiveReserve = 0.1)
+idConverterGov = HttpRequestGovernor.HttpRequestGovernor(0.5, 120, 0, 0, parent = ncbiGov)
+pdfLookupGov = HttpRequestGovernor.HttpRequestGovernor(0.5, 120, 0, 0, parent = ncbiGov)
+HttpRequestGovernor.registerGovernor('www.ncbi.nlm.nih.gov/', ncbiGov)
+HttpRequestGovernor.registerGovernor('www.ncbi.nlm.nih.gov/pmc/utils/idconv/', idConverterGov)
+HttpRequestGovernor.registerGovernor('www.ncbi.nlm.nih.gov/pmc/utils/oa/', pdfLookupGov)
+
+# max number of PDF lookup requests outstanding at once (in separate threads),
+# see HttpRequestGovernor.fetchAll()
+MAX_IN_FLIGHT = 4
+
+# AccessionIndex of IDs we already know, consulted before PubMed Central.
+# None means always ask PubMed Central. See setAccessionIndex()
+ACCESSION_INDEX = None
+
 ###--- Functions ---###
 
 def setToolName(tool):
@@ -43,6 +62,14 @@ def setEmailAddress(email):
     EMAIL_ADDRESS = email
     return
 
+def setAccessionIndex(index):
+    # Purpose: set the AccessionIndex that IDConverterAgent.getPMCIDs() looks
+    #     DOI IDs up in before asking PubMed Central (None = always ask)
+    global ACCESSION_INDEX
+
+    ACCESSION_INDEX = index
+    return
+
 def _splitList (
     items,   # the list of items to split
     n        # the maximum number of items per sublist
@@ -62,7 +89,10 @@ def _splitList (
 class IDConverterAgent:
     # Is: an agent that communicates with PubMed Central to convert DOI IDs to PMC IDs
     
-    def __init__ (self):
+    def __init__ (self, priority = HttpRequestGovernor.BATCH):
+        # Purpose: constructor
+        # Notes: priority is the governor lane for this agent's requests
+        self.priority = priority
         return
     
     def getPMCID (self, doiID):
@@ -82,11 +112,31 @@ class IDConverterAgent:
         if not doiIDs:
             return pmcIDs
 
-        # strip leading & trailing spaces from IDs and split the list into chunks
-        sublists = _splitList([x.strip() for x in doiIDs], 20)
+        # strip leading & trailing spaces from IDs, only ask PubMed Central
+        #  about the ones not in the accession index
+        toLookUp = []
+        seen = set()
+        for doiID in [x.strip() for x in doiIDs]:
+            if doiID in seen:       # duplicate, only look it up once
+                continue
+            seen.add(doiID)
+            pmcID = None
+            if ACCESSION_INDEX is not None:
+                pmcID = ACCESSION_INDEX.getPmcID(doiID)
+            if pmcID:
+                Instrumentation.count('PubMedCentralAgent.indexHits')
+                pmcIDs[doiID] = pmcID
+            else:
+                toLookUp.append(doiID)
+        if not toLookUp:
+            return pmcIDs
+
+        # split the list into chunks
+        sublists = _splitList(toLookUp, 20)
 
         for sublist in sublists:
-            lines = HttpRequestGovernor.readURL(ID_CONVERTER_URL % (TOOL_NAME, EMAIL_ADDRESS, ','.join(sublist)))
+            lines = HttpRequestGovernor.governedGet(ID_CONVERTER_URL % (TOOL_NAME, EMAIL_ADDRESS, ','.join(sublist)),
+                                                    priority = self.priority)
             
             # Lines have comma-delimited columns.  String values are in double-quotes.
             # Standardize lines by stripping out the double-quotes, then splitting on commas.
@@ -113,7 +163,10 @@ class IDConverterAgent:
         return pmcIDs 
     
 class PDFLookupAgent:
-    def __init__ (self):
+    def __init__ (self, priority = HttpRequestGovernor.BATCH):
+        # Purpose: constructor
+        # Notes: priority is the governor lane for this agent's requests
+        self.priority = priority
         return
     
     def getUrl (self, pmcID):
@@ -135,8 +188,14 @@ class PDFLookupAgent:
         if not pmcIDs:
             return urls
 
-        for pmcID in [x.strip() for x in pmcIDs]:
-            lines = HttpRequestGovernor.readURL(PDF_LOOKUP_URL % pmcID)
+        # overlap the requests, up to MAX_IN_FLIGHT at a time
+        pmcIDs = list(dict.fromkeys([x.strip() for x in pmcIDs]))     # no duplicates
+        results = HttpRequestGovernor.fetchAll([ PDF_LOOKUP_URL % pmcID for pmcID in pmcIDs ],
+                                                    MAX_IN_FLIGHT, priority = self.priority)
+
+        for pmcID, (lines, error) in zip(pmcIDs, results):
+            if error is not None:
+                raise Exception('Error looking up download URL for %s: %s' % (pmcID, error))
             xmldoc = xml.dom.minidom.parseString(lines)
 
             links = {}      # maps from format to url for this pmcID
@@ -0,0 +1,305 @@
+"""
+Name:  SplitterBenchmark.py
+Purpose:
+    Compare two configurations of extractedTextSplitter.ExtTextSplitter
+    (different minFraction/maxFraction and/or section start regex's)
+    over the texts in an ExtractedTextCorpus, in parallel.
+
+    For each text, both configurations split the text and we compare the
+    predicted boundaries (start and end positions) of each section.
+    The report gives
+        - per section: how often the two configurations agree and, when
+          they don't, how often config B's section starts (or, if the starts
+          agree, ends) earlier/later than A's
+        - the same agreement numbers per journal
+        - per document split time (p50/p99, ...) for each configuration
+    so the splitter can be tuned for both speed and accuracy in one pass.
+    Optionally, write one line per document that disagrees (--details).
+
+    This replaces extractedTextTest/compareRefPredictions.py, which compared
+    two files of reference section predictions.
+
+    A configuration is given as 'minFraction=0.05,maxFraction=0.4' plus an
+    optional json file of section start regex's
+        {"refSection1": ["regex pattern", ...], ...}
+    that replace the splitter's regex's for those match types
+    (see ExtTextSplitter.regexDict).
+
+    Example:
+        SplitterBenchmark.py /data/corpus/refs2020 --b maxFraction=0.5
+
+    See SplitterBenchmark.py -h
+"""
+import sys
+import time
+import json
+import argparse
+import CorpusBenchmark
+import ExtractedTextCorpus
+import extractedTextSplitter as sp
+
+SECTIONS = [ sp.SECTION_BODY, sp.SECTION_REFS, sp.SECTION_MFIGS,
+                                        sp.SECTION_STAR, sp.SECTION_SUPP, ]
+
+DEFAULT_CONFIG = {'minFraction': 0.05, 'maxFraction': 0.4, 'regexDict': None}
+
+_splitters = {}         # config json -> ExtTextSplitter, in a worker process
+#-----------------------------------
+
+def parseConfig(configStr,      # 'minFraction=n,maxFraction=n' or ''
+                regexFile=None, # json file of section start regex's
+    ):
+    """ Return a splitter configuration dict
+    """
+    config = dict(DEFAULT_CONFIG)
+    for part in [ p.strip() for p in configStr.split(',') if p.strip() ]:
+        name, value = [ x.strip() for x in part.split('=', 1) ]
+        if name not in ('minFraction', 'maxFraction'):
+            raise ValueError("Invalid splitter config setting: '%s'" % name)
+        config[name] = float(value)
+    if regexFile:
+        with open(regexFile, 'r') as fp:
+            config['regexDict'] = json.load(fp)
+    return config
+#-----------------------------------
+
+def getSplitter(config):
+    """ Return an ExtTextSplitter for a config, only built once per process
+    """
+    key = json.dumps(config, sort_keys=True)
+    if key not in _splitters:
+        _splitters[key] = sp.ExtTextSplitter(
+                                        minFraction=config['minFraction'],
+                                        maxFraction=config['maxFraction'],
+                                        regexDict=config['regexDict'])
+    return _splitters[key]
+#-----------------------------------
+
+def splitText(splitter, text):
+    """ Split text,
+        return ({section: [sPos, ePos]}, {section: reason}, seconds)
+    """
+    startTime = time.perf_counter()
+    sections = splitter.findSections(text)
+    seconds = time.perf_counter() - startTime
+    spans   = dict([ (s.secType, [s.sPos, s.ePos]) for s in sections ])
+    reasons = dict([ (s.secType, s.reason.replace('\n', ' ').strip())
+                                                        for s in sections ])
+    return spans, reasons, seconds
+#-----------------------------------
+
+def compareSplits(configA, configB, entry, text):
+    """
+    Split one corpus text with both configs (in a worker process).
+    Return a result dict for the document.
+    """
+    spansA, reasonsA, secondsA = splitText(getSplitter(configA), text)
+    spansB, reasonsB, secondsB = splitText(getSplitter(configB), text)
+    return {'id'      : entry.pubmedID or entry.mgiID or entry.refsKey,
+            'journal' : entry.journal,
+            'length'  : len(text),
+            'spansA'  : spansA,
+            'spansB'  : spansB,
+            'reasonsA': reasonsA,
+            'reasonsB': reasonsB,
+            'secondsA': secondsA,
+            'secondsB': secondsB,
+            }
+#-----------------------------------
+
+class _Comparer (object):
+    """ Picklable callable that compares two configs on a corpus text
+    """
+    def __init__(self, configA, configB):
+        self.configA = configA
+        self.configB = configB
+
+    def __call__(self, entry, text):
+        return compareSplits(self.configA, self.configB, entry, text)
+#-----------------------------------
+
+def runBenchmark(corpusPath,
+                configA,        # splitter config dicts, see parseConfig()
+                configB,
+                workers=4,
+                journal=None,   # only texts from this journal
+                year=None,      # only texts from this year
+                limit=0,        # max number of texts, 0 for all
+    ):
+    """
+    Return the benchmark results dict:
+        {'corpus': path, 'configA': configA, 'configB': configB,
+         'documents': [result dict per document],
+         'wall_seconds': elapsed time}
+    """
+    with ExtractedTextCorpus.CorpusReader(corpusPath) as reader:
+        entries = reader.getEntries(journal=journal, year=year)
+    if limit:
+        entries = entries[:limit]
+
+    documents, wallTime = CorpusBenchmark.runOverCorpus(corpusPath,
+                                _Comparer(configA, configB), entries=entries,
+                                workers=workers)
+    return {'corpus'      : corpusPath,
+            'configA'     : configA,
+            'configB'     : configB,
+            'documents'   : documents,
+            'wall_seconds': wallTime,
+            }
+#-----------------------------------
+
+def compareSpans(spanA, spanB, slop):
+    """ Return how B's section [sPos, ePos] compares to A's:
+        'same' if both boundaries are within slop chars, else 'earlier' or
+        'later' by start position (or by end position if the starts agree)
+    """
+    for posA, posB in zip(spanA, spanB):
+        if abs(posA - posB) > slop:
+            if posB < posA:
+                return 'earlier'
+            return 'later'
+    return 'same'
+#-----------------------------------
+
+def getAgreement(documents, slop=0, groupBy=None):
+    """
+    Return {group: {section: {'same': n, 'earlier': n, 'later': n}}, ...}
+        for the documents grouped by the groupBy field (e.g., 'journal')
+        or one group 'all' if groupBy is None
+    """
+    groups = {}
+    for d in documents:
+        g = d[groupBy] if groupBy else 'all'
+        counts = groups.setdefault(g, dict([ (s, {'same': 0, 'earlier': 0,
+                                            'later': 0}) for s in SECTIONS ]))
+        for s in SECTIONS:
+            counts[s][compareSpans(d['spansA'][s], d['spansB'][s], slop)] += 1
+    return groups
+#-----------------------------------
+
+def formatAgreement(groups, title):
+    """ Return report lines for a getAgreement() dict: for each group and
+        section, percent of docs where A & B agree, B earlier, B later
+    """
+    lines = [ '%-30s %-20s %7s %7s %7s' % (title, 'Section', 'same',
+                                                        'earlier', 'later') ]
+    for g in sorted(groups.keys()):
+        for s in SECTIONS:
+            c = groups[g][s]
+            n = float(c['same'] + c['earlier'] + c['later'])
+            lines.append('%-30s %-20s %6.1f%% %6.1f%% %6.1f%%' % (g[:30], s,
+                                        100 * c['same'] / n,
+                                        100 * c['earlier'] / n,
+                                        100 * c['later'] / n))
+    return lines
+#-----------------------------------
+
+def getReport(results, slop=0, byJournal=True):
+    """ Return report lines for benchmark results
+    """
+    documents = results['documents']
+    lines = [ 'Splitter benchmark: %s' % results['corpus'],
+              'Config A: %s' % json.dumps(results['configA'], sort_keys=True),
+              'Config B: %s' % json.dumps(results['configB'], sort_keys=True),
+              'Boundaries within %d chars count as the same' % slop,
+              '', ]
+    for c in ('A', 'B'):
+        timing = CorpusBenchmark.getTimingSummary(
+                                [ d['seconds' + c] for d in documents ],
+                                results['wall_seconds'])
+        lines.append('Config %s split times:' % c)
+        # wall time & throughput cover both configs, so just report per doc
+        lines += CorpusBenchmark.formatTimingSummary(timing)[3:]
+        lines.append('')
+
+    lines += formatAgreement(getAgreement(documents, slop), 'All')
+    if byJournal:
+        lines.append('')
+        lines += formatAgreement(getAgreement(documents, slop, 'journal'),
+                                                                    'Journal')
+    return lines
+#-----------------------------------
+
+def getDetails(results, slop=0):
+    """
+    Return tab delimited lines, one per section where the configs disagree:
+        ID, journal, doc length, section, A start, A end, A reason,
+        comparison, B start, B end, B reason
+    """
+    lines = [ '\t'.join([ 'ID', 'Journal', 'Doc length', 'Section',
+                        'A start', 'A end', 'A reason', 'Comparison',
+                        'B start', 'B end', 'B reason' ]) ]
+    for d in results['documents']:
+        for s in SECTIONS:
+            spanA, spanB = d['spansA'][s], d['spansB'][s]
+            comp = compareSpans(spanA, spanB, slop)
+            if comp == 'same':
+                continue
+            lines.append('\t'.join([ d['id'], d['journal'], str(d['length']),
+                        s, str(spanA[0]), str(spanA[1]), d['reasonsA'][s],
+                        comp,
+                        str(spanB[0]), str(spanB[1]), d['reasonsB'][s] ]))
+    return lines
+#-----------------------------------
+
+def getArgs():
+    parser = argparse.ArgumentParser( \
+        description='compare two ExtTextSplitter configurations over a corpus')
+
+    parser.add_argument('corpusPath', help="ExtractedTextCorpus path")
+
+    parser.add_argument('--a', dest='configA', action='store',
+        required=False, default='',
+        help="config A, e.g., 'minFraction=0.05,maxFraction=0.4'. " + \
+                                                "Default: splitter defaults")
+
+    parser.add_argument('--aRegex', dest='regexA', action='store',
+        required=False, default=None,
+        help="json file of section start regex's for config A")
+
+    parser.add_argument('--b', dest='configB', action='store',
+        required=False, default='', help="config B, like --a")
+
+    parser.add_argument('--bRegex', dest='regexB', action='store',
+        required=False, default=None,
+        help="json file of section start regex's for config B")
+
+    parser.add_argument('--slop', dest='slop', action='store',
+        required=False, default=0, type=int,
+        help='boundaries this many chars apart are the same. Default 0')
+
+    parser.add_argument('-w', '--workers', dest='workers', action='store',
+        required=False, default=4, type=int,
+        help='number of worker processes. Default 4')
+
+    parser.add_argument('--journal', dest='journal', action='store',
+        required=False, default=None, help='only this journal')
+
+    parser.add_argument('-y', '--year', dest='year', action='store',
+        required=False, default=None, type=int, help='publication year')
+
+    parser.add_argument('-l', '--limit', dest='limit', action='store',
+        required=False, default=0, type=int,
+        help='How many texts to split. Default 0 for no limit.')
+
+    parser.add_argument('--details', dest='detailsFile', action='store',
+        required=False, default=None,
+        help='write the disagreeing sections to this tab delimited file')
+
+    return parser.parse_args()
+#-----------------------------------
+
+if __name__ == "__main__":
+    args = getArgs()
+    configA = parseConfig(args.configA, args.regexA)
+    configB = parseConfig(args.configB, args.regexB)
+
+    results = runBenchmark(args.corpusPath, configA, configB,
+                    workers=args.workers, journal=args.journal,
+                    year=args.year, limit=args.limit)
+    print('\n'.join(getReport(results, args.slop)))
+
+    if args.detailsFile:
+        with open(args.detailsFile, 'w') as fp:
+            fp.write('\n'.join(getDetails(results, args.slop)) + '\n')
+        sys.stderr.write("Details written to %s\n" % args.detailsFile)
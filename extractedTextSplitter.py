@@ -99,6 +99,7 @@ class TypedMatch	- describes a match from TypedRegexMatcher
 """
 
 import re
+import Instrumentation
 
 # ----------------------------------
 #  Regex building functions
@@ -213,9 +214,17 @@ class ExtTextSplitter (object): #{
                 minFraction=0.05, # min fraction predicted for ref section
                 maxFraction=0.4,  # max fraction of whole doc that the
                                   #  predicted ref section is allowed to be
+                regexDict=None,   # dict of section start regex's to use
+                                  #  instead of self.regexDict. Any match
+                                  #  types not in it are taken from
+                                  #  self.regexDict
         ):
         self.minFraction = minFraction
         self.maxFraction = maxFraction
+        if regexDict is not None:
+            merged = dict(self.regexDict)
+            merged.update(regexDict)
+            self.regexDict = merged
         self.matcher = TypedRegexMatcher(self.regexDict, startPattern='\n')
         self.initSections('')
     # ----------------------------------
@@ -262,6 +271,7 @@ class ExtTextSplitter (object): #{
                 )
     # ----------------------------------
 
+    @Instrumentation.timed('ExtTextSplitter.findSections')
     def findSections(self, extText):
         """
         #### if you want details of the sections, call this ####
@@ -0,0 +1,89 @@
+import os
+import unittest
+import tempfile
+import AccessionIndex
+import PubMedCentralAgent
+
+"""
+These are tests for AccessionIndex.py (no database or network needed).
+
+Usage:   test_accessionIndex.py [-v]
+"""
+
+###########################
+class TestAccessionIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = AccessionIndex.AccessionIndex()
+        self.index.add(doiID='10.1016/J.CELL.2017.01.001', pubmedID='28111111',
+                                                        mgiID='mgi:5900001')
+        self.index.add(doiID='10.7554/eLife.12345', pmcID='4900001')
+
+    def test_lookups(self):
+        index = self.index
+        self.assertEqual(index.getPubMedID('10.1016/j.cell.2017.01.001'),
+                                                                '28111111')
+        self.assertEqual(index.getByMgiID('MGI:5900001').pubmedID, '28111111')
+        self.assertEqual(index.getPmcID('10.7554/ELIFE.12345'), 'PMC4900001')
+        self.assertEqual(index.getByPmcID('PMC4900001').doiID,
+                                                        '10.7554/eLife.12345')
+        self.assertEqual(index.getPubMedID('10.7554/eLife.12345'), None)
+        self.assertEqual(index.getPubMedID('10.1000/unknown'), None)
+        self.assertEqual(index.getByPubMedID('1'), None)
+
+    def test_merge(self):
+        index = self.index
+        rcd = index.add(doiID='10.7554/elife.12345', pubmedID='27000001')
+        self.assertEqual(rcd.pmcID, 'PMC4900001')
+        self.assertEqual(index.getByPubMedID('27000001').pmcID, 'PMC4900001')
+        self.assertEqual(len(index), 2)
+
+    def test_changed_id(self):
+        # re-adding a DOI with a different PubMed ID drops the old one
+        index = self.index
+        index.add(doiID='10.1016/j.cell.2017.01.001', pubmedID='28222222')
+        self.assertEqual(index.getByPubMedID('28111111'), None)
+        self.assertEqual(index.getPubMedID('10.1016/j.cell.2017.01.001'),
+                                                                '28222222')
+        self.assertEqual(index.getByMgiID('MGI:5900001').pubmedID, '28222222')
+        self.assertEqual(len(index), 2)
+
+    def test_link_records(self):
+        # one add() linking the two records merges them into one
+        index = self.index
+        rcd = index.add(pubmedID='28111111', pmcID='PMC4900001')
+        self.assertEqual(len(index), 1)
+        self.assertIs(index.getByPmcID('PMC4900001'), rcd)
+        self.assertIs(index.getByMgiID('MGI:5900001'), rcd)
+        self.assertEqual(rcd.doiID, '10.1016/J.CELL.2017.01.001')
+        self.assertIs(index.getByDoiID('10.1016/J.CELL.2017.01.001'), rcd)
+        self.assertEqual(index.getByDoiID('10.7554/eLife.12345'), None)
+
+    def test_save_load(self):
+        fd, filename = tempfile.mkstemp(suffix='.tsv')
+        os.close(fd)
+        try:
+            self.index.save(filename)
+            index = AccessionIndex.AccessionIndex()
+            self.assertEqual(index.load(filename), 2)
+        finally:
+            os.remove(filename)
+        self.assertEqual(index.getPubMedID('10.1016/j.cell.2017.01.001'),
+                                                                '28111111')
+        self.assertEqual(index.getByMgiID('MGI:5900001').doiID,
+                                                '10.1016/J.CELL.2017.01.001')
+        self.assertEqual(index.getPmcID('10.7554/elife.12345'), 'PMC4900001')
+
+    def test_pmc_agent_uses_index(self):
+        # all the DOI IDs are in the index, so no network request is made
+        PubMedCentralAgent.setAccessionIndex(self.index)
+        try:
+            agent = PubMedCentralAgent.IDConverterAgent()
+            self.assertEqual(agent.getPMCIDs([' 10.7554/eLife.12345 ']),
+                                    {'10.7554/eLife.12345': 'PMC4900001'})
+        finally:
+            PubMedCentralAgent.setAccessionIndex(None)
+# end class TestAccessionIndex -------------------
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+import ExtractedTextCorpus
+import CorpusBenchmark
+import DoiBenchmark
+from extractedTextSplitter import SUPP_DATA_TAG
+
+"""
+These are tests for DoiBenchmark.py and CorpusBenchmark.py over a small
+corpus written by the tests (no database or litparser needed).
+
+Usage:   test_doiBenchmark.py [-v]
+"""
+
+###########################
+class TestDoiBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.corpusPath = os.path.join(self.tmpDir, 'corpus')
+        with ExtractedTextCorpus.CorpusWriter(self.corpusPath) as w:
+            w.addText('Article doi: 10.1038/NCB1234. More text', refsKey=1,
+                        mgiID='MGI:1', doiID='10.1038/ncb1234', journal='J A')
+            w.addText('doi: 10.1000/other text', refsKey=2, mgiID='MGI:2',
+                        doiID='10.1000/right', journal='J B')
+            w.addText('no DOI\n' + SUPP_DATA_TAG + '\ndoi: 10.1000/supp',
+                        refsKey=3, mgiID='MGI:3', doiID='10.1000/supp',
+                        journal='J B')
+            w.addText('text without a DOI ID in the corpus', refsKey=4)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def getStatuses(self, results):
+        return dict([ (d['refs_key'], d['status'])
+                                            for d in results['documents'] ])
+
+    def test_statuses(self):
+        results = DoiBenchmark.runBenchmark(self.corpusPath, workers=1)
+        self.assertEqual(self.getStatuses(results),
+                            {'1': DoiBenchmark.CORRECT,  # case insensitive
+                             '2': DoiBenchmark.WRONG,
+                             '3': DoiBenchmark.NONE})
+        self.assertEqual(results['timing']['documents'], 3)
+        accuracy = DoiBenchmark.getAccuracy(results['documents'], 'journal')
+        self.assertEqual(accuracy['J A']['accuracy'], 1.0)
+        self.assertEqual(accuracy['J B'][DoiBenchmark.WRONG], 1)
+        self.assertTrue(DoiBenchmark.getReport(results))
+
+    def test_keepSupp_spawn(self):
+        # options reach the workers by the initializer, not by fork
+        ctx = multiprocessing.get_start_method()
+        multiprocessing.set_start_method('spawn', force=True)
+        try:
+            results = DoiBenchmark.runBenchmark(self.corpusPath, workers=2,
+                                                            removeSupp=False)
+        finally:
+            multiprocessing.set_start_method(ctx, force=True)
+        self.assertEqual(self.getStatuses(results)['3'],
+                                                    DoiBenchmark.CORRECT)
+
+    def test_baseline_diff(self):
+        baseline = DoiBenchmark.runBenchmark(self.corpusPath, workers=1)
+        filename = os.path.join(self.tmpDir, 'baseline.json')
+        CorpusBenchmark.saveResults(baseline, filename)
+        results = DoiBenchmark.runBenchmark(self.corpusPath, workers=1,
+                                                            removeSupp=False)
+        lines = DoiBenchmark.getDiffReport(results,
+                                        CorpusBenchmark.loadResults(filename))
+        self.assertIn('Fixed: 1', lines)
+        self.assertIn('Broken: 0', lines)
+# end class TestDoiBenchmark -------------------
+
+###########################
+class TestCorpusBenchmark(unittest.TestCase):
+
+    def test_timing_summary(self):
+        timing = CorpusBenchmark.getTimingSummary([ 0.1, 0.2, 0.3, 0.4 ], 2.0)
+        self.assertEqual(timing['documents'], 4)
+        self.assertAlmostEqual(timing['docs_per_second'], 2.0)
+        self.assertAlmostEqual(timing['mean_seconds'], 0.25)
+        self.assertAlmostEqual(timing['max_seconds'], 0.4)
+        self.assertEqual(CorpusBenchmark.getTimingSummary([], 0)['mean_seconds'],
+                                                                        0.0)
+# end class TestCorpusBenchmark -------------------
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+import PdfParser
+
+"""
+These are tests for PdfParser.DoiFinder on extracted text (no PDFs, so
+    litparser is not needed). See test_doiExtraction.py for tests on PDFs.
+
+Usage:   test_doiFinder.py [-v]
+"""
+
+TEXTS = [
+    'Article doi: 10.1038/ncb1234. More text',
+    'no DOI here',
+    'x' * 300 + ' end 10.1000/tail',
+    'www.pnas.org but no PNAS DOI',     # makes getDoiID() raise
+    ]
+EXPECTED = [
+    (0, '10.1038/ncb1234', ''),
+    (1, None, ''),
+    (2, '10.1000/tail', ''),
+    ]
+
+###########################
+class TestGetDoiIDs(unittest.TestCase):
+
+    def setUp(self):
+        self.doiFinder = PdfParser.DoiFinder()
+
+    def test_in_process(self):
+        results = list(self.doiFinder.getDoiIDs(TEXTS, headChars=100))
+        self.assertEqual(results[:3], EXPECTED)
+        index, doiID, error = results[3]
+        self.assertEqual((index, doiID), (3, None))
+        self.assertTrue(error.startswith('AttributeError'))
+
+    def test_workers(self):
+        results = list(self.doiFinder.getDoiIDs(TEXTS, workers=2, chunksize=1))
+        self.assertEqual(results[:3], EXPECTED)
+        results = sorted(self.doiFinder.getDoiIDs(TEXTS, workers=2,
+                                                ordered=False, chunksize=1))
+        self.assertEqual(results[:3], EXPECTED)
+
+    def test_window(self):
+        getWindow = self.doiFinder.getDoiWindow
+        text = 'doi 10.1038/ncb1234 ' + 'b' * 20
+        self.assertEqual(getWindow(text, 25), text[:25])
+        self.assertEqual(getWindow(text, 100), text)
+        self.assertEqual(getWindow(text, 15), text)     # DOI ID may be cut
+        self.assertEqual(getWindow('a' * 40, 10), 'a' * 10)
+        text = 'doi 10.1126/science.aaa1111 ' + 'b' * 20  # rule needs tail
+        self.assertEqual(getWindow(text, 30), text)
+
+    def test_long_science(self):
+        # the prior article's DOI at the start, the article's after
+        #  'Accepted' past the head, then supplemental data
+        text = 'end of prior article doi:10.1126/science.aaa1111\n' + \
+            'x ' * 125000 + 'Accepted 5 May 2020\n' + \
+            'doi:10.1126/science.abc9999\n' + 'supplement ' * 17500
+        self.assertGreater(len(text), 440000)
+        self.assertEqual(self.doiFinder.getDoiID(text),
+                                                '10.1126/science.abc9999')
+        self.assertEqual(list(self.doiFinder.getDoiIDs([ text ])),
+                                    [ (0, '10.1126/science.abc9999', '') ])
+
+    def test_long_pnas(self):
+        # the PNAS marker and DOI ID come after another DOI ID in the head
+        text = 'cites doi 10.1038/ncb1234\n' + 'x ' * 125000 + \
+            'www.pnas.org/cgi/doi/10.1073pnas.0123456\n' + 'y ' * 100000
+        self.assertEqual(self.doiFinder.getDoiID(text), '10.1073/pnas.0123456')
+        self.assertEqual(list(self.doiFinder.getDoiIDs([ text ], workers=2)),
+                                        [ (0, '10.1073/pnas.0123456', '') ])
+# end class TestGetDoiIDs -------------------
+
+class TestDoiRules(unittest.TestCase):
+
+    def setUp(self):
+        self.doiFinder = PdfParser.DoiFinder()
+
+    def test_builtin_rules(self):
+        self.assertEqual(self.doiFinder.getDoiID(
+                        'doi 10.1371/journal.\npone.0123456 more'),
+                        '10.1371/journal.pone.0123456')        # PLoS
+        self.assertEqual(self.doiFinder.getDoiID(
+                        'doi 10.1177/0963689717Journal text'),
+                        '10.1177/0963689717')                  # Sage
+        hits = PdfParser.DoiFinder.ruleStatistics['Sage']['hits']
+        self.doiFinder.getDoiID('doi 10.1177/0963689717 text')
+        self.assertEqual(PdfParser.DoiFinder.ruleStatistics['Sage']['hits'],
+                                                                    hits + 1)
+
+    def test_needsFullText(self):
+        self.assertTrue(self.doiFinder.needsFullText('10.1126/science.aaa'))
+        self.assertTrue(self.doiFinder.needsFullText('10.1073/pnas.12'))
+        self.assertFalse(self.doiFinder.needsFullText('10.1126/scitranslmed'))
+        self.assertTrue(self.doiFinder.needsFullText('10.1371/journal'))
+        self.assertFalse(self.doiFinder.needsFullText('10.1038/s41598'))
+
+    def test_registerRule(self):
+        class MyDoiFinder (PdfParser.DoiFinder):
+            _markerRules = []
+            _registry = {}
+        MyDoiFinder.registerRule(PdfParser.DoiRule('Test', ('10.9999/',),
+                        'clean', lambda f, doiID, text, match: doiID.upper()))
+        doiFinder = MyDoiFinder()
+        self.assertEqual(doiFinder.getDoiID('doi 10.9999/abc'), '10.9999/ABC')
+        self.assertEqual(self.doiFinder.getDoiID('doi 10.9999/abc'),
+                                                                '10.9999/abc')
+        self.assertEqual(MyDoiFinder.ruleStatistics['Test']['hits'], 1)
+        self.assertNotIn('Test', PdfParser.DoiFinder.ruleStatistics)
+# end class TestDoiRules -------------------
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import unittest
+import ExtractedTextSet
+import ExtractedTextCorpus
+
+"""
+These are tests for ExtractedTextCorpus.py. They do not need a database.
+
+Usage:   test_extractedTextCorpus.py [-v]
+"""
+
+###########################
+class TestExtractedTextCorpus(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.corpusPath = os.path.join(self.tmpDir, 'corpus')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def test_write_read(self):
+        with ExtractedTextCorpus.CorpusWriter(self.corpusPath) as w:
+            w.addText('text one\f', refsKey=1, pubmedID='111', mgiID='MGI:1',
+                    doiID='10.1/one', journal='J Foo', year=2020)
+            w.addText('text two é', refsKey=2, journal='J\tBar')
+
+        with ExtractedTextCorpus.CorpusReader(self.corpusPath) as r:
+            self.assertEqual(len(r), 2)
+            self.assertEqual(r.getText(refsKey=1), 'text one\f')
+            self.assertEqual(r.getText(pubmedID='111'), 'text one\f')
+            self.assertEqual(r.getText(mgiID='mgi:1'), 'text one\f')
+            self.assertEqual(r.getText(refsKey='2'), 'text two é')
+            self.assertEqual(r.getText(refsKey=3), None)
+
+            entry = r.getEntry(refsKey=1)
+            self.assertEqual(entry.doiID, '10.1/one')
+            self.assertEqual(entry.year, '2020')
+            self.assertEqual(entry.textLength, len('text one\f'))
+            self.assertEqual(r.getEntry(refsKey=2).journal, 'J Bar')
+
+            texts = [ t for e, t in r.iterTexts() ]
+            self.assertEqual(texts, ['text one\f', 'text two é'])
+            texts = [ t for e, t in r.iterTexts(journal='J Foo', year=2020) ]
+            self.assertEqual(texts, ['text one\f'])
+
+    def test_append(self):
+        with ExtractedTextCorpus.CorpusWriter(self.corpusPath) as w:
+            w.addText('first', refsKey=1)
+        with ExtractedTextCorpus.CorpusWriter(self.corpusPath) as w:
+            w.addText('second', refsKey=2)
+            w.addText('first again', refsKey=1)
+
+        with ExtractedTextCorpus.CorpusReader(self.corpusPath) as r:
+            self.assertEqual(len(r), 3)
+            self.assertEqual(r.getText(refsKey=2), 'second')
+            self.assertEqual(r.getText(refsKey=1), 'first again')
+
+    def test_empty(self):
+        ExtractedTextCorpus.CorpusWriter(self.corpusPath).close()
+        with ExtractedTextCorpus.CorpusReader(self.corpusPath) as r:
+            self.assertEqual(len(r), 0)
+            self.assertEqual(list(r.iterTexts()), [])
+
+    def test_page_index(self):
+        with ExtractedTextCorpus.CorpusWriter(self.corpusPath) as w:
+            w.addText('page 1\fpage 2\f', refsKey=1)
+
+        with ExtractedTextCorpus.CorpusReader(self.corpusPath) as r:
+            entry = r.getEntry(refsKey=1)
+            self.assertEqual(entry.pageIndex, '14,7,14')
+            pageIndex = r.getPageIndex(entry)
+            self.assertEqual(pageIndex.getPageCount(), 2)
+            self.assertEqual(pageIndex.getPage(r.getText(entry), -1),
+                                                                'page 2\f')
+            entry.pageIndex = ''        # computed from the text instead
+            self.assertEqual(r.getPageIndex(entry).getPageOffsets(), [0, 7])
+
+    def test_from_ExtractedTextSet(self):
+        ets = ExtractedTextSet.ExtractedTextSet([
+            {'_refs_key': 1, 'text_type': 'body', 'text_part': 'body1 '},
+            {'_refs_key': 1, 'text_type': 'reference', 'text_part': 'refs1'},
+            ])
+        refRcds = [ {'_refs_key': 1, 'mgiid': 'MGI:1', 'journal': 'J Foo'},
+                    {'_refs_key': 2, 'mgiid': 'MGI:2', 'journal': 'J Foo'}, ]
+        with ExtractedTextCorpus.CorpusWriter(self.corpusPath) as w:
+            self.assertEqual(w.addExtractedTextSet(ets, refRcds), 1)
+
+        with ExtractedTextCorpus.CorpusReader(self.corpusPath) as r:
+            self.assertEqual(r.getText(mgiID='MGI:1'), 'body1 refs1')
+            self.assertEqual(r.getEntry(mgiID='MGI:2'), None)
+# end class TestExtractedTextCorpus -------------------
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import unittest
+import ExtractedTextSet
+
+"""
+These are tests for ExtractedTextSet.py. They do not need a database.
+
+Usage:   test_extractedTextSet.py [-v]
+
+Be careful of PYTHONPATH: most likely, you want .:.. at the start of it so
+    you test ExtractedTextSet.py in this product and not /usr/local/mgi/live
+"""
+
+RCDS = [
+    {'_refs_key': 1, 'text_type': 'reference',    'text_part': 'refs1 '},
+    {'_refs_key': 1, 'text_type': 'body',         'text_part': 'body1 '},
+    {'_refs_key': 1, 'text_type': 'supplemental', 'text_part': 'supp1'},
+    {'_refs_key': 2, 'text_type': 'body',         'text_part': 'body2 '},
+    {'_refs_key': 2, 'text_type': 'star methods', 'text_part': 'star2'},
+    {'_refs_key': 3, 'text_type': 'body',         'text_part': 'x' * 40},
+    ]
+
+class FakeDb (object):
+    """ stands in for the db module, remembers the sql it is asked to run
+    """
+    def __init__(self, rcds):
+        self.rcds = rcds
+        self.queries = []
+
+    def sql(self, queries, mode):
+        self.queries += queries
+        return [ self.rcds ]
+
+###########################
+class TestExtractedTextSet(unittest.TestCase):
+
+    def test_getExtText(self):
+        ets = ExtractedTextSet.ExtractedTextSet(RCDS)
+        self.assertEqual(ets.getExtText(1), 'body1 refs1 supp1')
+        self.assertEqual(ets.getExtText('2'), 'body2 star2')
+        self.assertEqual(ets.getExtText(99), '')
+        self.assertTrue(ets.hasExtText(1))
+        self.assertFalse(ets.hasExtText(99))
+
+    def test_invalid_text_type(self):
+        rcds = [ {'_refs_key': 1, 'text_type': 'junk', 'text_part': 'x'} ]
+        self.assertRaises(ValueError, ExtractedTextSet.ExtractedTextSet, rcds)
+
+    def test_cache_hits(self):
+        ets = ExtractedTextSet.ExtractedTextSet(RCDS, cacheMaxBytes=100)
+        ets.getExtText(1)
+        ets.getExtText(1)
+        self.assertEqual(ets.cacheHits, 1)
+        self.assertEqual(ets.cacheMisses, 1)
+        self.assertEqual(ets.getExtText(1), 'body1 refs1 supp1')
+
+    def test_cache_lru_eviction(self):
+        # 17 + 11 chars fit in 30, adding a 3rd text evicts the oldest
+        ets = ExtractedTextSet.ExtractedTextSet(RCDS, cacheMaxBytes=30)
+        ets.getExtText(1)
+        ets.getExtText(2)
+        ets.getExtText(1)               # 1 is now most recently used
+        self.assertEqual(list(ets.textCache.keys()), ['2', '1'])
+        ets.getExtText(3)               # 40 chars, bigger than whole cache
+        self.assertEqual(list(ets.textCache.keys()), ['2', '1'])
+        rcds = RCDS + [ {'_refs_key': 4, 'text_type': 'body',
+                                                'text_part': 'body4'} ]
+        ets = ExtractedTextSet.ExtractedTextSet(rcds, cacheMaxBytes=30)
+        ets.getExtText(1)
+        ets.getExtText(2)
+        ets.getExtText(4)
+        self.assertEqual(list(ets.textCache.keys()), ['2', '4'])
+        self.assertTrue(ets.cacheBytes <= 30)
+
+    def test_page_index(self):
+        rcds = [
+            {'_refs_key': 1, 'text_type': 'body',      'text_part': 'p1\fp2\f'},
+            {'_refs_key': 1, 'text_type': 'reference', 'text_part': 'refs\f'},
+            ]
+        ets = ExtractedTextSet.ExtractedTextSet(rcds, cacheMaxBytes=100)
+        pageIndex = ets.getPageIndex(1)
+        self.assertEqual(pageIndex.getPageOffsets(), [0, 3, 6])
+        self.assertEqual(pageIndex.getPage(ets.getExtText(1), -1), 'refs\f')
+        self.assertEqual(len(ets.pageIndexCache), 0)    # text wasn't cached
+        self.assertTrue(ets.getPageIndex(1) is ets.pageIndexCache['1'])
+        ets.clearCache()
+        self.assertEqual(len(ets.pageIndexCache), 0)
+
+    def test_no_cache_by_default(self):
+        ets = ExtractedTextSet.ExtractedTextSet(RCDS)
+        ets.getExtText(1)
+        self.assertEqual(len(ets.textCache), 0)
+
+    def test_join_eager(self):
+        ets = ExtractedTextSet.ExtractedTextSet(RCDS)
+        refs = ets.joinRefs2ExtText([ {'_refs_key': 2} ])
+        self.assertEqual(refs[0]['ext_text'], 'body2 star2')
+
+    def test_join_lazy(self):
+        ets = ExtractedTextSet.ExtractedTextSet(RCDS)
+        refs = ets.joinRefs2ExtText([ {'_refs_key': 1}, {'_refs_key': 99} ],
+                                                                    lazy=True)
+        handle = refs[0]['ext_text']
+        self.assertTrue(isinstance(handle, ExtractedTextSet.ExtTextHandle))
+        self.assertEqual(len(handle), len('body1 refs1 supp1'))
+        self.assertEqual(str(handle), 'body1 refs1 supp1')
+        self.assertEqual(refs[1]['ext_text'].getText(), '')
+
+    def test_join_no_text(self):
+        ets = ExtractedTextSet.ExtractedTextSet(RCDS)
+        self.assertRaises(ValueError, ets.joinRefs2ExtText,
+                                    [ {'_refs_key': 99} ], allowNoText=False)
+
+    def test_textTypes(self):
+        ets = ExtractedTextSet.ExtractedTextSet(RCDS,
+                                    textTypes=['supplemental', 'body'])
+        self.assertEqual(ets.textTypes, ['body', 'supplemental'])
+        self.assertEqual(ets.getExtText(1), 'body1 supp1')
+        self.assertEqual(ets.getExtText(2), 'body2 ')
+        self.assertEqual(ets.getExtTextLength(2), len('body2 '))
+
+    def test_invalid_textTypes(self):
+        self.assertRaises(ValueError, ExtractedTextSet.ExtractedTextSet,
+                                                    RCDS, textTypes=['junk'])
+
+    def test_textTypes_sql(self):
+        db = FakeDb([ r for r in RCDS if r['text_type'] == 'body' ])
+        ets = ExtractedTextSet.getExtractedTextSet(db, [1, 2],
+                                                        textTypes=['body'])
+        self.assertTrue(db.queries[0].find("_extractedtext_key in") > 0)
+        self.assertTrue(db.queries[0].find("term in ('body')") > 0)
+        self.assertEqual(ets.getExtText(1), 'body1 ')
+
+        db = FakeDb(RCDS)
+        ets = ExtractedTextSet.getExtractedTextSetForTable(db, 'tmp_refs')
+        self.assertEqual(db.queries[0].find("_extractedtext_key in"), -1)
+        self.assertEqual(ets.getExtText(1), 'body1 refs1 supp1')
+
+        db = FakeDb(RCDS)
+        ExtractedTextSet.getExtractedTextSetForTable(db, 'tmp_refs',
+                                                        textTypes=['body'])
+        self.assertTrue(db.queries[0].find("where bd._extractedtext_key") > 0)
+# end class TestExtractedTextSet -------------------
+
+if __name__ == '__main__':
+    unittest.main()
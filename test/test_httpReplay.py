@@ -0,0 +1,98 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import HttpReplay
+import HttpRequestGovernor
+import PubMedAgent
+
+"""
+These are tests for HttpReplay.py, and of PubMedAgent and the governors
+running against recorded responses (no network needed).
+
+Usage:   test_httpReplay.py [-v]
+"""
+
+ESEARCH_RESPONSE = '<eSearchResult><Count>1</Count><IdList><Id>%s</Id></IdList></eSearchResult>'
+
+def fakeNcbi(url, data=None):
+    """ Transport standing in for the real eutils while recording
+    """
+    if '10.1000/one' in url:
+        return 200, ESEARCH_RESPONSE % '11111111'
+    if '10.1000/two' in url:
+        return 200, ESEARCH_RESPONSE % '22222222'
+    return 500, 'server error'
+
+###########################
+class TestHttpReplay(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.realGov = HttpRequestGovernor.getGovernor(PubMedAgent.SUMMARY_URL)
+        self.gov = HttpRequestGovernor.HttpRequestGovernor(0, 0, 0, 0)
+        HttpRequestGovernor.registerGovernor('eutils.ncbi.nlm.nih.gov/',
+                                                                    self.gov)
+        # record the responses
+        HttpRequestGovernor.setTransport(
+                        HttpReplay.RecordingTransport(self.directory, fakeNcbi))
+        self.agent = PubMedAgent.PubMedAgentMedline()
+        self.agent.getPubMedIDs(['10.1000/one', '10.1000/two'])
+
+    def tearDown(self):
+        HttpRequestGovernor.setTransport(None)
+        HttpRequestGovernor.setRetryOn429(0)
+        HttpRequestGovernor.registerGovernor('eutils.ncbi.nlm.nih.gov/',
+                                                                self.realGov)
+        shutil.rmtree(self.directory)
+
+    def test_cassette(self):
+        files = os.listdir(self.directory)
+        self.assertEqual(len(files), 2)
+        with open(os.path.join(self.directory, files[0])) as fp:
+            rcd = json.load(fp)
+        self.assertEqual(rcd['status'], 200)
+        self.assertNotIn('api_key', rcd['url'])
+        self.assertTrue(rcd['url'].startswith('eutils.ncbi.nlm.nih.gov/'))
+
+    def test_replay(self):
+        replay = HttpReplay.ReplayTransport(self.directory)
+        HttpRequestGovernor.setTransport(replay)
+        self.assertEqual(self.agent.getPubMedIDs(['10.1000/two', '10.1000/one']),
+                    {'10.1000/two': ['22222222'], '10.1000/one': ['11111111']})
+        self.assertEqual(replay.served, 2)
+        self.assertEqual(replay.missing, 0)
+
+    def test_429_retries(self):
+        replay = HttpReplay.ReplayTransport(self.directory, inject429=0.5,
+                                                                    seed=1)
+        HttpRequestGovernor.setTransport(replay)
+        HttpRequestGovernor.setRetryOn429(maxRetries=10, backoff=0.001)
+        requestCount = self.gov.requestCount
+        for i in range(5):
+            self.assertEqual(self.agent.getPubMedIDs(['10.1000/one']),
+                                            {'10.1000/one': ['11111111']})
+        self.assertGreater(replay.throttled, 0)
+        self.assertEqual(replay.served, 5)
+        self.assertEqual(self.gov.requestCount - requestCount,
+                                                    5 + replay.throttled)
+
+        HttpRequestGovernor.setTransport(
+                    HttpReplay.ReplayTransport(self.directory, inject429=1.0))
+        HttpRequestGovernor.setRetryOn429(maxRetries=2, backoff=0.001)
+        self.assertRaises(Exception, self.agent.getPubMedIDs, ['10.1000/one'])
+
+    def test_replay_server(self):
+        with HttpReplay.ReplayServer(self.directory) as server:
+            HttpRequestGovernor.setTransport(server.getTransport())
+            self.assertEqual(self.agent.getPubMedIDs(['10.1000/one']),
+                                            {'10.1000/one': ['11111111']})
+            status, body = HttpRequestGovernor.requestURL(
+                            'https://eutils.ncbi.nlm.nih.gov/not/recorded')
+            self.assertEqual(status, 404)
+            self.assertEqual(server.replay.served, 1)
+# end class TestHttpReplay -------------------
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,397 @@
+import time
+import threading
+import unittest
+import Instrumentation
+import HttpRequestGovernor
+
+"""
+These are tests for HttpRequestGovernor.py (no network needed: the
+transport is replaced by a function that just records the URLs requested).
+
+Usage:   test_httpRequestGovernor.py [-v]
+"""
+
+###########################
+class TestPriorityLanes(unittest.TestCase):
+
+    def setUp(self):
+        self.requested = []
+        HttpRequestGovernor.setTransport(lambda url, data=None:
+                                    (200, self.requested.append(url) or url))
+
+    def tearDown(self):
+        HttpRequestGovernor.setTransport(None)
+
+    def test_interactive_jumps_queue(self):
+        gov = HttpRequestGovernor.HttpRequestGovernor(0.05, 0, 0, 0)
+        batch = [ threading.Thread(target=gov.get, args=('batch%d' % i,))
+                                                        for i in range(6) ]
+        for t in batch:
+            t.start()
+        with gov.condition:     # 1 batch request made, the rest queued up
+            self.assertTrue(gov.condition.wait_for(
+                                    lambda: len(gov.waiting) == 5, 5))
+        gov.get('interactive', priority=HttpRequestGovernor.INTERACTIVE)
+        for t in batch:
+            t.join()
+        # only the batch requests already released can go before it
+        self.assertLess(self.requested.index('interactive'), 3)
+        self.assertEqual(len(self.requested), 7)
+        self.assertEqual(gov.requestCount, 7)
+
+    def test_interactive_reserve(self):
+        # batch may use 2 of the 4 requests per minute, interactive all
+        gov = HttpRequestGovernor.HttpRequestGovernor(0, 4, 0, 0,
+                                                    interactiveReserve=0.5)
+        for i in range(2):
+            gov.get('batch%d' % i)
+        self.assertGreater(gov.getWaitTime(), 50)
+        gov = HttpRequestGovernor.HttpRequestGovernor(0, 4, 0, 0,
+                                                    interactiveReserve=0.5)
+        for i in range(2):
+            gov.get('batch%d' % i)
+        for i in range(2):
+            self.assertEqual(
+                    gov.getWaitTime(HttpRequestGovernor.INTERACTIVE), 0)
+        self.assertGreater(gov.getWaitTime(HttpRequestGovernor.INTERACTIVE),
+                                                                        50)
+
+    def test_lane_statistics(self):
+        gov = HttpRequestGovernor.HttpRequestGovernor(0, 0, 0, 0)
+        gov.get('a')
+        gov.get('b', priority=HttpRequestGovernor.INTERACTIVE)
+        stats = '\n'.join(gov.getStatistics())
+        self.assertIn('interactive  requests: 1', stats)
+        self.assertIn('batch        requests: 1', stats)
+# end class TestPriorityLanes -------------------
+
+###########################
+class TestRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.requested = []
+        HttpRequestGovernor.setTransport(lambda url, data=None:
+                                    (200, self.requested.append(url) or url))
+        self.host = HttpRequestGovernor.HttpRequestGovernor(0, 0, 0, 0)
+        self.api = HttpRequestGovernor.HttpRequestGovernor(0, 0, 0, 0,
+                                                        parent=self.host)
+        HttpRequestGovernor.registerGovernor('https://test.org/', self.host)
+        HttpRequestGovernor.registerGovernor('test.org/api/', self.api)
+
+    def tearDown(self):
+        HttpRequestGovernor.setTransport(None)
+        HttpRequestGovernor.unregisterGovernor('test.org/')
+        HttpRequestGovernor.unregisterGovernor('test.org/api/')
+
+    def test_longest_prefix(self):
+        getGovernor = HttpRequestGovernor.getGovernor
+        self.assertIs(getGovernor('https://test.org/api/x?id=1'), self.api)
+        self.assertIs(getGovernor('http://test.org/other'), self.host)
+        self.assertIs(getGovernor('https://other.org/api/'), None)
+
+    def test_parent_shares_limits(self):
+        HttpRequestGovernor.governedGet('https://test.org/api/x')
+        HttpRequestGovernor.governedGet('https://test.org/y')
+        HttpRequestGovernor.governedGet('https://other.org/z')
+        self.assertEqual(self.api.requestCount, 1)
+        self.assertEqual(self.host.requestCount, 2)
+        self.assertEqual(len(self.requested), 3)
+
+    def test_busy_parent_keeps_child_spacing(self):
+        sent = []
+        HttpRequestGovernor.setTransport(lambda url, data=None:
+                                    (200, sent.append((url, time.time())) or url))
+        host = HttpRequestGovernor.HttpRequestGovernor(0.05, 0, 0, 0)
+        child = HttpRequestGovernor.HttpRequestGovernor(0.2, 0, 0, 0,
+                                                                parent=host)
+        sibling = HttpRequestGovernor.HttpRequestGovernor(0, 0, 0, 0,
+                                                                parent=host)
+        threads = [ threading.Thread(target=sibling.get, args=('sib%d' % i,))
+                                                        for i in range(10) ]
+        for t in threads:
+            t.start()
+        for i in range(500):            # the sibling keeps the host busy
+            if len(host.waiting) + len(sibling.waiting) >= 5:
+                break
+            time.sleep(0.01)
+        child.get('child1')
+        child.get('child2')
+        for t in threads:
+            t.join()
+        times = dict(sent)
+        self.assertGreaterEqual(times['child2'] - times['child1'], 0.19)
+        self.assertEqual((child.requestCount, host.requestCount), (2, 12))
+# end class TestRegistry -------------------
+
+###########################
+class TestFetchAll(unittest.TestCase):
+
+    def setUp(self):
+        self.inFlight = 0
+        self.maxInFlight = 0
+        self.lock = threading.Lock()
+        def transport(url, data=None):
+            with self.lock:
+                self.inFlight += 1
+                self.maxInFlight = max(self.maxInFlight, self.inFlight)
+            time.sleep(0.05)
+            with self.lock:
+                self.inFlight -= 1
+            if url == 'bad':
+                raise IOError('no such host')
+            return 200, url.upper()
+        HttpRequestGovernor.setTransport(transport)
+
+    def tearDown(self):
+        HttpRequestGovernor.setTransport(None)
+
+    def test_order_and_errors(self):
+        gov = HttpRequestGovernor.HttpRequestGovernor(0, 0, 0, 0)
+        urls = [ 'u%d' % i for i in range(8) ] + [ 'bad' ]
+        results = HttpRequestGovernor.fetchAll(urls, maxInFlight=4,
+                                                            governor=gov)
+        self.assertEqual([ r for (r, e) in results[:8] ],
+                                            [ u.upper() for u in urls[:8] ])
+        self.assertIsNone(results[0][1])
+        self.assertIsNone(results[8][0])
+        self.assertIn('no such host', str(results[8][1]))
+        self.assertEqual(gov.requestCount, 9)
+        self.assertGreater(self.maxInFlight, 1)
+        self.assertLessEqual(self.maxInFlight, 4)
+# end class TestFetchAll -------------------
+
+###########################
+class TestCoalescing(unittest.TestCase):
+
+    def setUp(self):
+        self.requested = []
+        def transport(url, data=None):
+            self.requested.append(url)
+            time.sleep(0.05)
+            return 200, url.upper()
+        HttpRequestGovernor.setTransport(transport)
+
+    def tearDown(self):
+        HttpRequestGovernor.setTransport(None)
+        HttpRequestGovernor.setRequestMemo(False)
+
+    def test_concurrent_requests_share_fetch(self):
+        results = HttpRequestGovernor.fetchAll([ 'same' ] * 4 + [ 'other' ],
+                                                            maxInFlight=5)
+        self.assertEqual([ r for (r, e) in results ], [ 'SAME' ] * 4 + [ 'OTHER' ])
+        self.assertEqual(sorted(self.requested), [ 'other', 'same' ])
+
+    def test_memo_scope(self):
+        with HttpRequestGovernor.requestScope():
+            HttpRequestGovernor.governedGet('a')
+            HttpRequestGovernor.governedGet('a')
+        HttpRequestGovernor.governedGet('a')    # scope over, not remembered
+        self.assertEqual(self.requested, [ 'a', 'a' ])
+
+        HttpRequestGovernor.setRequestMemo()
+        HttpRequestGovernor.governedGet('b')
+        HttpRequestGovernor.governedGet('b')
+        HttpRequestGovernor.clearRequestMemo()
+        HttpRequestGovernor.governedGet('b')
+        self.assertEqual(self.requested, [ 'a', 'a', 'b', 'b' ])
+
+    def test_memo_scope_per_thread(self):
+        inScope = threading.Event()
+        scopeOver = threading.Event()
+        def other():
+            with HttpRequestGovernor.requestScope():
+                HttpRequestGovernor.governedGet('c')
+                inScope.set()
+                scopeOver.wait(5)
+                HttpRequestGovernor.governedGet('c')    # still remembered
+        thread = threading.Thread(target=other)
+        thread.start()
+        with HttpRequestGovernor.requestScope():
+            self.assertTrue(inScope.wait(5))
+            HttpRequestGovernor.governedGet('c')    # not in this scope
+            HttpRequestGovernor.governedGet('c')
+        HttpRequestGovernor.governedGet('c')        # no scope in this thread
+        scopeOver.set()
+        thread.join()
+        self.assertEqual(self.requested, [ 'c', 'c', 'c' ])
+
+        # fetchAll()'s threads share the caller's scope
+        with HttpRequestGovernor.requestScope():
+            HttpRequestGovernor.governedGet('d')
+            HttpRequestGovernor.fetchAll([ 'd', 'e' ], maxInFlight=2)
+            HttpRequestGovernor.governedGet('e')
+        self.assertEqual(self.requested[3:], [ 'd', 'e' ])
+
+    def test_priority_coalescing(self):
+        started = threading.Event()
+        release = threading.Event()
+        def transport(url, data=None):
+            self.requested.append(url)
+            if len(self.requested) == 1:
+                started.set()
+                release.wait(5)
+            return 200, url.upper()
+        HttpRequestGovernor.setTransport(transport)
+        Instrumentation.enable(reportAtExit=False)
+        Instrumentation.reset()
+        try:
+            # an interactive request doesn't wait on an in-flight batch one
+            batch = threading.Thread(target=HttpRequestGovernor.governedGet,
+                                                                args=('x',))
+            batch.start()
+            self.assertTrue(started.wait(5))
+            self.assertEqual(HttpRequestGovernor.governedGet('x',
+                        priority=HttpRequestGovernor.INTERACTIVE), 'X')
+            self.assertEqual(self.requested, [ 'x', 'x' ])
+            release.set()
+            batch.join()
+
+            # a batch request shares an in-flight interactive one
+            started.clear()
+            release.clear()
+            del self.requested[:]
+            results = []
+            interactive = threading.Thread(target=lambda: results.append(
+                    HttpRequestGovernor.governedGet('y',
+                                priority=HttpRequestGovernor.INTERACTIVE)))
+            interactive.start()
+            self.assertTrue(started.wait(5))
+            batch = threading.Thread(target=lambda: results.append(
+                                    HttpRequestGovernor.governedGet('y')))
+            batch.start()
+            while Instrumentation.getStatistics()['counters'].get(
+                                'HttpRequestGovernor.coalesced', 0) < 1:
+                time.sleep(0.001)
+            release.set()
+            interactive.join()
+            batch.join()
+            self.assertEqual(results, [ 'Y', 'Y' ])
+            self.assertEqual(self.requested, [ 'y' ])
+            self.assertEqual(HttpRequestGovernor._inFlight, {})
+        finally:
+            release.set()
+            Instrumentation.disable()
+            Instrumentation.reset()
+# end class TestCoalescing -------------------
+
+###########################
+class TestSimulation(unittest.TestCase):
+
+    def test_per_request(self):
+        gov = HttpRequestGovernor.HttpRequestGovernor(1.0, 0, 0, 0)
+        result = gov.simulate(10)
+        self.assertAlmostEqual(result['completion_seconds'], 9.0)
+        self.assertEqual(result['binding_constraint'],
+                                            HttpRequestGovernor.PER_REQUEST)
+        self.assertAlmostEqual(result['max_wait_seconds'], 9.0)
+        self.assertEqual(gov.requestCount, 0)       # state not changed
+        self.assertIsNone(gov.lastRequestTime)
+
+    def test_per_day(self):
+        # the day limit lets 5 requests through per day
+        gov = HttpRequestGovernor.HttpRequestGovernor(0, 0, 0, 5)
+        result = gov.simulate(10, requestSeconds=2.0)
+        self.assertAlmostEqual(result['completion_seconds'],
+                                    HttpRequestGovernor.SECONDS_PER_DAY + 2.0)
+        self.assertEqual(result['binding_constraints'],
+                                            [ HttpRequestGovernor.PER_DAY ])
+        self.assertEqual(result['phases'][5]['constraint'],
+                                            HttpRequestGovernor.PER_DAY)
+        self.assertTrue(HttpRequestGovernor.formatSimulation(result))
+
+    def test_per_minute(self):
+        gov = HttpRequestGovernor.HttpRequestGovernor(0, 4, 0, 0)
+        result = gov.simulate(12)
+        self.assertAlmostEqual(result['completion_seconds'], 120.0)
+        self.assertEqual(result['utilization'],
+                                    {HttpRequestGovernor.PER_MINUTE: 1.0})
+        self.assertEqual(result['binding_constraint'],
+                                            HttpRequestGovernor.PER_MINUTE)
+
+    def test_arrivals_and_parent(self):
+        parent = HttpRequestGovernor.HttpRequestGovernor(2.0, 0, 0, 0)
+        gov = HttpRequestGovernor.HttpRequestGovernor(0.5, 0, 0, 0,
+                                                            parent=parent)
+        result = gov.simulate(arrivals=[ 0, 10, 20 ])
+        self.assertEqual(result['binding_constraint'], 'none')
+        self.assertAlmostEqual(result['max_wait_seconds'], 0.0)
+        result = gov.simulate(5)
+        self.assertAlmostEqual(result['completion_seconds'], 8.0)
+        self.assertEqual(result['binding_constraint'], 'parent per request')
+# end class TestSimulation -------------------
+
+###########################
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.statuses = [ 200, 200, 404, 429 ]
+        HttpRequestGovernor.setTransport(lambda url, data=None:
+                                        (self.statuses.pop(0), 'response'))
+
+    def tearDown(self):
+        HttpRequestGovernor.setTransport(None)
+
+    def test_metrics(self):
+        gov = HttpRequestGovernor.HttpRequestGovernor(0, 10, 0, 0,
+                                                        snapshotSeconds=3600)
+        for i in range(4):
+            gov.get('url%d\u00e9' % i, data=(i == 0 and 'id=1' or None))
+        metrics = gov.getMetrics()
+        self.assertEqual(metrics['requests'], 4)
+        self.assertEqual(metrics['http_status'],
+                                        {'200': 2, '404': 1, '429': 1})
+        self.assertEqual(metrics['http429'], 1)
+        self.assertEqual(metrics['errors'], 1)          # the 404
+        self.assertEqual(metrics['bytes_received'], 4 * len('response'))
+        self.assertEqual(metrics['bytes_sent'],
+                                    4 * len('url0\u00e9'.encode()) + len('id=1'))
+        self.assertEqual(metrics['response_seconds']['count'], 4)
+        self.assertEqual(sum([ b['count'] for b in
+                        metrics['wait_seconds']['histogram'] ]), 4)
+        self.assertAlmostEqual(
+                metrics['utilization'][HttpRequestGovernor.PER_MINUTE]['peak'],
+                0.4)
+        self.assertEqual(metrics['snapshots'], [])
+        gov.takeSnapshot()
+        snapshot = gov.getMetrics()['snapshots'][0]
+        self.assertEqual(snapshot['requests'], 4)
+        self.assertEqual(snapshot['errors'], 1)
+        self.assertIn('"http429": 1', gov.getMetricsJson())
+        self.assertIn('HTTP status counts: 200: 2, 404: 1, 429: 1',
+                                            gov.getStatistics())
+
+    def test_times_kept(self):
+        self.statuses = [ 200 ] * 6
+        saved = HttpRequestGovernor.MAX_TIMES_KEPT
+        HttpRequestGovernor.MAX_TIMES_KEPT = 3
+        try:
+            gov = HttpRequestGovernor.HttpRequestGovernor(0, 0, 0, 0,
+                                                        snapshotSeconds=3600)
+            for i in range(5):
+                gov.get('url%d' % i)
+        finally:
+            HttpRequestGovernor.MAX_TIMES_KEPT = saved
+        self.assertEqual(len(gov.timesWaited.recent), 3)
+        self.assertEqual(len(gov.responseTimes.recent), 3)
+        metrics = gov.getMetrics()
+        for times in [ metrics['wait_seconds'], metrics['response_seconds'],
+                            metrics['lanes']['batch']['latency_seconds'] ]:
+            self.assertEqual(times['count'], 5)
+            self.assertEqual(sum([ b['count'] for b in times['histogram'] ]), 5)
+        gov.takeSnapshot()
+        gov.get('url5')
+        gov.takeSnapshot()
+        snapshots = gov.getMetrics()['snapshots']
+        self.assertEqual([ s['requests'] for s in snapshots ], [ 5, 1 ])
+
+    def test_summarize_times(self):
+        summary = HttpRequestGovernor.summarizeTimes([ 0.01, 0.02, 400.0, 0.3 ])
+        self.assertEqual((summary['count'], summary['max'], summary['p50']),
+                                                            (4, 400.0, 0.3))
+        self.assertAlmostEqual(summary['mean'], 100.0825)
+        self.assertEqual([ b['count'] for b in summary['histogram'] ],
+                                    [ 1, 1, 0, 0, 1, 0, 0, 0, 0, 0, 0, 0, 1 ])
+# end class TestMetrics -------------------
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import Instrumentation
+
+"""
+These are tests for Instrumentation.py.
+
+Usage:   test_instrumentation.py [-v]
+"""
+
+###########################
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        Instrumentation.reset()
+        Instrumentation.enable(reportAtExit=False)
+
+    def tearDown(self):
+        Instrumentation.disable()
+        Instrumentation.reset()
+
+    def test_disabled(self):
+        Instrumentation.disable()
+        with Instrumentation.timer('t'):
+            pass
+        Instrumentation.count('c')
+        self.assertEqual(Instrumentation.getSummary(),
+                                            [ 'No instrumentation recorded' ])
+
+    def test_timer_timed_count(self):
+        @Instrumentation.timed('f')
+        def f(x):
+            return x + 1
+        self.assertEqual(f(1), 2)
+        self.assertEqual(f.__name__, 'f')
+        with Instrumentation.timer('t'):
+            pass
+        Instrumentation.addTime('t', 2.0)
+        Instrumentation.count('c')
+        Instrumentation.count('c', 2)
+
+        stats = Instrumentation.getStatistics()
+        self.assertEqual(stats['counters'], {'c': 3})
+        self.assertEqual(stats['timers']['f']['count'], 1)
+        t = stats['timers']['t']
+        self.assertEqual(t['count'], 2)
+        self.assertEqual(t['max_seconds'], 2.0)
+        self.assertLess(t['min_seconds'], 1.0)
+        self.assertAlmostEqual(t['total_seconds'], 2.0, places=2)
+        self.assertTrue(Instrumentation.getSummary()[1].startswith('t '))
+
+    def test_bounded_reservoir(self):
+        n = 5 * Instrumentation.RESERVOIR_SIZE
+        for i in range(n):
+            Instrumentation.addTime('t', float(i))
+        t = Instrumentation.getStatistics()['timers']['t']
+        self.assertEqual(t['count'], n)
+        self.assertEqual((t['min_seconds'], t['max_seconds']), (0.0, n - 1.0))
+        self.assertAlmostEqual(t['mean_seconds'], (n - 1) / 2.0)
+        self.assertEqual(len(Instrumentation._timers['t'].reservoir),
+                                            Instrumentation.RESERVOIR_SIZE)
+        self.assertLess(abs(t['p50_seconds'] - n / 2.0), n / 10.0)
+
+    def test_dump(self):
+        Instrumentation.addTime('t', 0.5)
+        Instrumentation.count('c')
+        tmpDir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpDir, 'stats.json')
+            Instrumentation.dump(filename)
+            with open(filename, 'r') as fp:
+                stats = json.load(fp)
+        finally:
+            shutil.rmtree(tmpDir)
+        self.assertEqual(stats, Instrumentation.getStatistics())
+        self.assertEqual(stats['timers']['t']['p99_seconds'], 0.5)
+# end class TestInstrumentation -------------------
+
+if __name__ == '__main__':
+    unittest.main()
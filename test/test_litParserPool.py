@@ -0,0 +1,131 @@
+import io
+import os
+import json
+import time
+import signal
+import shutil
+import tempfile
+import unittest
+import PdfParser
+import LitParserPool
+
+"""
+These are tests for LitParserPool.py. The workers run stub extraction
+commands (cat, false) on small text files, so litparser is not needed.
+
+Usage:   test_litParserPool.py [-v]
+"""
+
+###########################
+class TestFrames(unittest.TestCase):
+
+    def test_frames(self):
+        fp = io.BytesIO()
+        LitParserPool._writeFrame(fp, b'abc')
+        LitParserPool._writeFrame(fp, b'')
+        LitParserPool._writeFrame(fp, json.dumps({'op': 'ping'}).encode())
+        fp.seek(0)
+        self.assertEqual(LitParserPool._readFrame(fp), b'abc')
+        self.assertEqual(LitParserPool._readFrame(fp), b'')
+        self.assertEqual(json.loads(LitParserPool._readFrame(fp)),
+                                                            {'op': 'ping'})
+        self.assertRaises(EOFError, LitParserPool._readFrame, fp)
+        self.assertRaises(EOFError, LitParserPool._readFrame,
+                                            io.BytesIO(b'\0\0\0\5ab'))
+
+    def test_buildCommand(self):
+        self.assertEqual(LitParserPool._buildCommand(['cat', '%s', '-'], 'x'),
+                                                            ['cat', 'x', '-'])
+        self.assertEqual(LitParserPool._buildCommand(['cat'], 'x'),
+                                                            ['cat', 'x'])
+# end class TestFrames -------------------
+
+###########################
+class TestLitParserPool(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpDir, 'doc.pdf')
+        with open(self.path, 'w') as fp:
+            fp.write('page one\fpage two\f')
+        self.pool = LitParserPool.LitParserPool(size=2,
+                                        command=['/bin/cat', '%s'])
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.tmpDir)
+
+    def test_extract(self):
+        for i in range(3):
+            returncode, out, err = self.pool.extract(self.path)
+            self.assertEqual((returncode, out), (0, 'page one\fpage two\f'))
+        returncode, out, err = self.pool.extract(
+                                        os.path.join(self.tmpDir, 'missing'))
+        self.assertNotEqual(returncode, 0)
+        self.assertIn('missing', err)
+        self.assertEqual(self.pool.extractionCount, 4)
+
+    def test_ping_health_check(self):
+        for worker in self.pool.workers:
+            self.assertTrue(worker.ping())
+        self.assertEqual(self.pool.checkHealth(), 0)
+        self.pool.workers[0].process.kill()
+        self.pool.workers[0].process.wait()
+        self.assertFalse(self.pool.workers[0].ping())
+        self.assertEqual(self.pool.checkHealth(), 1)
+        self.assertEqual(self.pool.respawnCount, 1)
+        self.assertTrue(self.pool.workers[0].ping())
+
+    def test_respawn_killed_worker(self):
+        for worker in self.pool.workers:
+            os.kill(worker.process.pid, signal.SIGKILL)
+            worker.process.wait()
+        returncode, out, err = self.pool.extract(self.path)
+        self.assertEqual((returncode, out), (0, 'page one\fpage two\f'))
+        self.assertEqual(self.pool.respawnCount, 1)
+
+    def test_worker_dies_during_request(self):
+        # the first extraction kills its worker, the request is retried once
+        marker = os.path.join(self.tmpDir, 'killed')
+        script = 'if [ ! -e %s ]; then touch %s; kill -9 $PPID; fi; cat "$0"' \
+                                                            % (marker, marker)
+        with LitParserPool.LitParserPool(size=1,
+                                command=['/bin/sh', '-c', script]) as pool:
+            self.assertEqual(pool.extract(self.path)[:2],
+                                            (0, 'page one\fpage two\f'))
+            self.assertEqual(pool.respawnCount, 1)
+
+        # a worker that dies twice on the same PDF fails the request
+        with LitParserPool.LitParserPool(size=1,
+                        command=['/bin/sh', '-c', 'kill -9 $PPID']) as pool:
+            self.assertRaises(Exception, pool.extract, self.path)
+            self.assertEqual(pool.failedCount, 1)
+            self.assertTrue(pool.workers[0].ping())     # respawned
+
+    def test_default_command(self):
+        pdfToText = PdfParser.PDFTOTEXT
+        try:
+            PdfParser.setPdfToText(None)
+            self.assertRaises(Exception, LitParserPool.LitParserPool, size=1)
+            PdfParser.setPdfToText([ '/bin/sh', '-c', 'cat "$0"' ])
+            with LitParserPool.LitParserPool(size=1) as pool:
+                self.assertEqual(pool.command, [ '/bin/sh', '-c', 'cat "$0"',
+                                        LitParserPool.PATH_PLACEHOLDER, '-' ])
+                self.assertEqual(pool.extract(self.path)[:2],
+                                            (0, 'page one\fpage two\f'))
+        finally:
+            PdfParser.setPdfToText(pdfToText)
+
+    def test_idle_ping(self):
+        pool = LitParserPool.LitParserPool(size=1, command=['/bin/cat', '%s'],
+                                                    healthCheckInterval=0)
+        try:
+            time.sleep(0.01)
+            self.assertEqual(pool.extract(self.path)[0], 0)
+            self.assertEqual(pool.respawnCount, 0)
+        finally:
+            pool.close()
+# end class TestLitParserPool -------------------
+
+if __name__ == '__main__':
+    unittest.main()
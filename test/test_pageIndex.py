@@ -0,0 +1,44 @@
+import unittest
+import PageIndex
+
+"""
+These are tests for PageIndex.py.
+
+Usage:   test_pageIndex.py [-v]
+"""
+
+TEXT = 'page one\fpage two\fpage three\f'
+
+###########################
+class TestPageIndex(unittest.TestCase):
+
+    def test_pages(self):
+        index = PageIndex.fromText(TEXT)
+        self.assertEqual(index.getPageCount(), 3)
+        self.assertEqual(index.getPageOffsets(), [0, 9, 18])
+        self.assertEqual(index.getPage(TEXT, 0), 'page one\f')
+        self.assertEqual(index.getPage(TEXT, -1), 'page three\f')
+        self.assertEqual(index.getPages(TEXT, -2), 'page two\fpage three\f')
+        self.assertEqual(index.getPages(TEXT, 0, 1), 'page one\f')
+        self.assertEqual(index.getPages(TEXT, 5), '')
+        self.assertRaises(IndexError, index.getPage, TEXT, 3)
+
+    def test_no_final_page_break(self):
+        text = 'page one\fpage two'
+        index = PageIndex.fromText(text)
+        self.assertEqual(index.getPageCount(), 2)
+        self.assertEqual(index.getPage(text, 1), 'page two')
+        self.assertEqual(PageIndex.fromText('').getPageCount(), 0)
+
+    def test_chunks_and_strings(self):
+        index = PageIndex.PageIndex()
+        for i in range(0, len(TEXT), 4):
+            index.addChunk(TEXT[i:i+4])
+        self.assertEqual(index.getPageOffsets(), [0, 9, 18])
+        copy = PageIndex.PageIndex.fromString(index.toString())
+        self.assertEqual(copy.getPageOffsets(), [0, 9, 18])
+        self.assertEqual(copy.getPage(TEXT, 1), 'page two\f')
+# end class TestPageIndex -------------------
+
+if __name__ == '__main__':
+    unittest.main()
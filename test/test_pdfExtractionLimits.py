@@ -0,0 +1,135 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+import PdfParser
+import LitParserPool
+
+"""
+These are tests for PdfParser.py's extraction limits (setExtractionLimits()).
+litparser is replaced by fake pdfGetFullText.sh scripts: one that sleeps
+(and starts a child that sleeps), one that writes output forever, and one
+that allocates too much memory.
+
+Usage:   test_pdfExtractionLimits.py [-v]
+"""
+
+SCRIPTS = {
+    'sleep' : '#!/bin/sh\nsleep 30 &\necho $! > %(pidFile)s\nsleep 30\n',
+    'yes'   : '#!/bin/sh\nyes\n',
+    'memory': '#!/bin/sh\nexec %(python)s -c "x = bytearray(1 << 30)"\n',
+    }
+
+def isRunning(pid):
+    """ Is process pid running (not gone, not a zombie)?
+    """
+    try:
+        with open('/proc/%d/stat' % pid, 'r') as fp:
+            return fp.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except (FileNotFoundError, ProcessLookupError):
+        return False
+
+###########################
+class TestExtractionLimits(unittest.TestCase):
+
+    def setUp(self):
+        self.litParser = PdfParser.LITPARSER
+        self.tmpDir = tempfile.mkdtemp()
+        self.pdfPath = os.path.join(self.tmpDir, 'doc.pdf')
+        self.pidFile = os.path.join(self.tmpDir, 'child.pid')
+        with open(self.pdfPath, 'w') as fp:
+            fp.write('not really a PDF')
+
+    def tearDown(self):
+        PdfParser.setExtractionLimits()
+        PdfParser.LITPARSER = self.litParser
+        shutil.rmtree(self.tmpDir)
+
+    def useScript(self, name):
+        """ Make the named fake script our litparser
+        """
+        scriptDir = os.path.join(self.tmpDir, name)
+        os.mkdir(scriptDir)
+        path = os.path.join(scriptDir, 'pdfGetFullText.sh')
+        with open(path, 'w') as fp:
+            fp.write(SCRIPTS[name] % {'pidFile': self.pidFile,
+                                                    'python': sys.executable})
+        os.chmod(path, 0o755)
+        PdfParser.setLitParserDir(scriptDir)
+        return path
+
+    def assertChildKilled(self):
+        with open(self.pidFile, 'r') as fp:
+            pid = int(fp.read())
+        for i in range(50):             # give init a moment to reap it
+            if not isRunning(pid):
+                break
+            time.sleep(0.1)
+        self.assertFalse(isRunning(pid))
+
+    def test_timeout(self):
+        self.useScript('sleep')
+        PdfParser.setExtractionLimits(timeout=0.5)
+        timeouts = PdfParser.parserStats['timeouts']
+        startTime = time.time()
+        self.assertRaises(PdfParser.ExtractionTimeoutError,
+                                PdfParser.PdfParser(self.pdfPath).getText)
+        self.assertLess(time.time() - startTime, 10)
+        self.assertEqual(PdfParser.parserStats['timeouts'], timeouts + 1)
+        self.assertChildKilled()        # the whole process group
+
+    def test_timer_after_exit(self):
+        # the timer firing after the process finished is not a timeout
+        process = PdfParser._LitParserProcess([ 'sh', '-c', 'echo done' ],
+                                                            30, None, None)
+        process.process.wait()
+        process._onTimeout()
+        self.assertEqual(b''.join(process.iterChunks()), b'done\n')
+        self.assertFalse(process.timedOut)
+        self.assertEqual(process.returncode, 0)
+
+    def test_output_cap(self):
+        self.useScript('yes')
+        PdfParser.setExtractionLimits(maxOutputBytes=100000)
+        oversize = PdfParser.parserStats['oversize']
+        self.assertRaises(PdfParser.ExtractionOversizeError,
+                                PdfParser.PdfParser(self.pdfPath).getText)
+        self.assertEqual(PdfParser.parserStats['oversize'], oversize + 1)
+
+    def test_memory_limit(self):
+        self.useScript('memory')
+        failures = PdfParser.parserStats['failures']
+        PdfParser.setExtractionLimits(maxMemoryBytes=256 * 1024 * 1024)
+        try:
+            PdfParser.PdfParser(self.pdfPath).getText()
+            self.fail('extraction over the memory limit succeeded')
+        except Exception as e:
+            self.assertIn('MemoryError', str(e))
+        self.assertEqual(PdfParser.parserStats['failures'], failures + 1)
+
+    def test_memory_limit_no_command(self):
+        returncode, stdout, stderr = PdfParser.runLitParser(
+                    [ os.path.join(self.tmpDir, 'missing') ], None, None,
+                    256 * 1024 * 1024)
+        self.assertEqual((returncode, stdout), (127, b''))
+        self.assertIn(b'Failed to execute', stderr)
+
+    def test_pool_timeout(self):
+        script = self.useScript('sleep')
+        PdfParser.setExtractionLimits(timeout=0.5)
+        timeouts = PdfParser.parserStats['timeouts']
+        with LitParserPool.LitParserPool(size=1, command=[ script ]) as pool:
+            PdfParser.setLitParserPool(pool)
+            try:
+                self.assertRaises(PdfParser.ExtractionTimeoutError,
+                                PdfParser.PdfParser(self.pdfPath).getText)
+            finally:
+                PdfParser.setLitParserPool(None)
+        self.assertEqual(PdfParser.parserStats['timeouts'], timeouts + 1)
+        self.assertChildKilled()
+# end class TestExtractionLimits -------------------
+
+if __name__ == '__main__':
+    unittest.main()
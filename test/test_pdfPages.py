@@ -0,0 +1,353 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import PdfParser
+import LitParserPool
+
+"""
+These are tests for PdfParser.py's page range extraction (getPagesText())
+and the front matter DOI search in getFirstDoiID().
+
+pdftotext and litparser are replaced by fake scripts that write the pages
+of a text file (one line per page) instead of the PDF's text. The fake
+pdftotext logs its -f/-l options so we can check the page ranges asked for.
+The page counts come from the real PDFs in the pdfs/ subdirectory.
+
+Usage:   test_pdfPages.py [-v]
+"""
+
+PDF_SUBDIR = "pdfs"     # name of the subdirectory holding the test PDFs
+def getAbsolutePdfPath(pdfFile):
+    """ determine absolute path to pdf test file """
+    testDir = os.path.dirname(os.path.abspath(__file__))     # test directory
+    return os.path.abspath(os.path.join(testDir, PDF_SUBDIR, pdfFile))
+
+# fake pdftotext: [-f n] [-l m] pdfPath -  writes pages n..m of the pages
+#  file, each line ending with a form feed, as pdftotext does
+PDFTOTEXT = '''#!/bin/sh
+echo "$@" >> %(log)s
+f=1; l=$(wc -l < %(pages)s)
+while [ $# -gt 2 ]; do
+    case "$1" in
+        -f) f=$2; shift;;
+        -l) l=$2; shift;;
+    esac
+    shift
+done
+awk -v f=$f -v l=$l 'NR >= f && NR <= l { printf "%%s\\n\\f", $0 }' %(pages)s
+'''
+
+# fake litparser: writes all the pages. Notes its pid, then if the hang
+#  file exists it hangs (so we can see it is killed when we stop reading),
+#  and exits with the code in the exit file, if any
+LITPARSER = '''#!/bin/sh
+echo $$ > %(pid)s
+awk '{ printf "%%s\\n\\f", $0 }' %(pages)s
+[ -e %(hang)s ] && sleep 30
+[ -e %(exit)s ] && echo "fake failure" >&2 && exit $(cat %(exit)s)
+exit 0
+'''
+
+def isRunning(pid):
+    """ Is process pid running (not gone, not a zombie)?
+    """
+    try:
+        with open('/proc/%d/stat' % pid, 'r') as fp:
+            return fp.read().rsplit(')', 1)[1].split()[0] != 'Z'
+    except (FileNotFoundError, ProcessLookupError):
+        return False
+
+###########################
+class PdfPagesTestCase(unittest.TestCase):
+    """ Sets up the fake scripts, restores PdfParser's settings after
+    """
+    def setUp(self):
+        self.litParser = PdfParser.LITPARSER
+        self.pdfToText = PdfParser.PDFTOTEXT
+        self.doiFirstPages = PdfParser.DOI_FIRST_PAGES
+        self.tmpDir = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmpDir, 'pdftotext.log')
+        self.pages = os.path.join(self.tmpDir, 'pages.txt')
+        self.pidFile = os.path.join(self.tmpDir, 'litparser.pid')
+        self.hangFile = os.path.join(self.tmpDir, 'hang')
+        self.exitFile = os.path.join(self.tmpDir, 'exit')
+        names = {'log': self.log, 'pages': self.pages, 'pid': self.pidFile,
+                    'hang': self.hangFile, 'exit': self.exitFile}
+        for name, script in [ ('pdftotext', PDFTOTEXT),
+                                ('pdfGetFullText.sh', LITPARSER) ]:
+            path = os.path.join(self.tmpDir, name)
+            with open(path, 'w') as fp:
+                fp.write(script % names)
+            os.chmod(path, 0o755)
+        PdfParser.setLitParserDir(self.tmpDir)
+        PdfParser.setPdfToText([ os.path.join(self.tmpDir, 'pdftotext') ],
+                                                            doiFirstPages=2)
+
+    def tearDown(self):
+        PdfParser.LITPARSER = self.litParser
+        PdfParser.setPdfToText(self.pdfToText, self.doiFirstPages)
+        shutil.rmtree(self.tmpDir)
+
+    def setPages(self, pages):
+        """ Set the text of the pages the fake scripts write
+        """
+        with open(self.pages, 'w') as fp:
+            fp.write(''.join([ p + '\n' for p in pages ]))
+
+    def setHang(self):
+        """ Make the fake litparser hang after writing the pages
+        """
+        open(self.hangFile, 'w').close()
+
+    def setExitCode(self, code):
+        with open(self.exitFile, 'w') as fp:
+            fp.write(str(code))
+
+    def assertLitParserKilled(self):
+        with open(self.pidFile, 'r') as fp:
+            pid = int(fp.read())
+        for i in range(50):             # give init a moment to reap it
+            if not isRunning(pid):
+                break
+            time.sleep(0.1)
+        self.assertFalse(isRunning(pid))
+
+    def getRanges(self):
+        """ Return list of the option strings pdftotext was run with
+        """
+        if not os.path.exists(self.log):
+            return []
+        with open(self.log, 'r') as fp:
+            return [ ' '.join(line.split()[:-2]) for line in fp ]
+
+###########################
+class TestPagesText(PdfPagesTestCase):
+
+    def test_page_counts(self):
+        for pdfFile, pageCount in [ ('MGI_6304117.pdf', 3),
+                                    ('6378478.pdf', 12),        # linearized
+                                    ('MGI_6367457.pdf', 14),    # ObjStm
+                                    ('isInvalid.pdf', None) ]:
+            self.assertEqual(PdfParser.getPdfPageCount(
+                                getAbsolutePdfPath(pdfFile)), pageCount)
+
+    def test_first_last(self):
+        self.setPages([ 'page %d' % n for n in range(1, 13) ])
+        parser = PdfParser.PdfParser(getAbsolutePdfPath('6378478.pdf'))
+        self.assertEqual(parser.getPagesText(first=2), 'page 1\n\fpage 2\n\f')
+        self.assertEqual(parser.getPagesText(first=1, last=2),
+                                            'page 1\n\fpage 11\n\fpage 12\n\f')
+        self.assertEqual(parser.getPagesText(last=1), 'page 12\n\f')
+        self.assertEqual(self.getRanges(),
+                    [ '-f 1 -l 2', '-f 1 -l 1', '-f 11 -l 12', '-f 12 -l 12' ])
+        self.assertFalse(parser.loaded)         # never loaded the full text
+
+    def test_overlapping_ranges(self):
+        self.setPages([ 'page %d' % n for n in range(1, 4) ])
+        parser = PdfParser.PdfParser(getAbsolutePdfPath('MGI_6304117.pdf'))
+        self.assertEqual(parser.getPagesText(first=2, last=2),
+                                            'page 1\n\fpage 2\n\fpage 3\n\f')
+        self.assertEqual(self.getRanges(), [ '-f 1 -l 3' ])
+
+    def test_no_page_count(self):
+        # can't find the page count, so extract the whole document
+        self.setPages([ 'page 1', 'page 2' ])
+        parser = PdfParser.PdfParser(getAbsolutePdfPath('isInvalid.pdf'))
+        self.assertEqual(parser.getPagesText(last=1), 'page 1\n\fpage 2\n\f')
+        self.assertEqual(self.getRanges(), [ '-f 1' ])
+
+    def test_loaded_slices_full_text(self):
+        self.setPages([ 'page %d' % n for n in range(1, 4) ])
+        parser = PdfParser.PdfParser(getAbsolutePdfPath('MGI_6304117.pdf'))
+        parser.getText()
+        self.assertEqual(parser.getPagesText(first=1, last=1),
+                                                        'page 1\n\fpage 3\n\f')
+        self.assertEqual(self.getRanges(), [])
+
+    def test_crlf(self):
+        # '\r\n' is read as '\n', as in text mode
+        self.setPages([ 'doi: 10.1234/abc.5\r', 'More text\r', 'end\r' ])
+        pdfPath = getAbsolutePdfPath('MGI_6304117.pdf')
+        text = 'doi: 10.1234/abc.5\n\fMore text\n\fend\n\f'
+        self.assertEqual(PdfParser.PdfParser(pdfPath).getText(), text)
+        self.assertEqual(PdfParser.PdfParser(pdfPath).getPagesText(first=1),
+                                                    'doi: 10.1234/abc.5\n\f')
+        self.assertEqual(list(PdfParser.PdfParser(pdfPath).iterText(
+                            byPage=True)), [ p + '\f' for p in
+                                    text.split('\f')[:-1] ])
+        with LitParserPool.LitParserPool(size=1,
+                                command=[ PdfParser.LITPARSER ]) as pool:
+            PdfParser.setLitParserPool(pool)
+            try:
+                self.assertEqual(PdfParser.PdfParser(pdfPath).getText(), text)
+            finally:
+                PdfParser.setLitParserPool(None)
+# end class TestPagesText -------------------
+
+###########################
+class TestFrontMatterDoi(PdfPagesTestCase):
+
+    def getFirstDoiID(self, pages):
+        """ Return (getFirstDoiID(), DOI ID in the full text) for a PDF
+            with these pages
+        """
+        self.setPages(pages)
+        pdfPath = getAbsolutePdfPath('MGI_6391745.pdf')         # 16 pages
+        doiID = PdfParser.PdfParser(pdfPath).getFirstDoiID()
+        fullText = PdfParser.PdfParser(pdfPath).getText()
+        return doiID, PdfParser.PdfParser.doiFinder.getDoiID(fullText)
+
+    def test_front_matter(self):
+        frontMatter = PdfParser.parserStats['doiFrontMatter']
+        doiID, fullTextID = self.getFirstDoiID(
+                        [ 'title', 'doi: 10.1016/j.cell.2020.01.001' ] +
+                        [ 'body' ] * 14)
+        self.assertEqual(doiID, '10.1016/j.cell.2020.01.001')
+        self.assertEqual(doiID, fullTextID)
+        self.assertEqual(self.getRanges(), [ '-f 1 -l 2' ])
+        self.assertEqual(PdfParser.parserStats['doiFrontMatter'],
+                                                            frontMatter + 1)
+
+    def test_science_escalates(self):
+        # front matter has the end of the prior article's DOI
+        fullText = PdfParser.parserStats['doiFullText']
+        doiID, fullTextID = self.getFirstDoiID(
+                        [ 'prior article doi 10.1126/science.prior1' ] +
+                        [ 'body' ] * 14 +
+                        [ 'Accepted 1 May 2020 10.1126/science.right2' ])
+        self.assertEqual(doiID, '10.1126/science.right2')
+        self.assertEqual(doiID, fullTextID)
+        self.assertEqual(PdfParser.parserStats['doiFullText'], fullText + 1)
+
+    def test_blood_escalates(self):
+        fullText = PdfParser.parserStats['doiFullText']
+        doiID, fullTextID = self.getFirstDoiID(
+                        [ 'doi 10.1182/blood-2019-01-0001 title' ] +
+                        [ 'body' ] * 15)
+        self.assertEqual(doiID, fullTextID)
+        self.assertEqual(PdfParser.parserStats['doiFullText'], fullText + 1)
+
+    def test_no_doi_in_front_matter(self):
+        doiID, fullTextID = self.getFirstDoiID(
+                        [ 'title', 'abstract' ] + [ 'body' ] * 13 +
+                        [ 'doi: 10.1000/late' ])
+        self.assertEqual(doiID, '10.1000/late')
+        self.assertEqual(doiID, fullTextID)
+# end class TestFrontMatterDoi -------------------
+
+###########################
+class TestStreaming(PdfPagesTestCase):
+    """ iterText() and, with no pdftotext, getFirstDoiID() reading
+        litparser's output as it comes
+    """
+    def setUp(self):
+        PdfPagesTestCase.setUp(self)
+        PdfParser.setPdfToText(None)
+
+    def check(self, pdfFile, pages):
+        """ Assert getFirstDoiID() gives the same DOI ID as the full text,
+            return it
+        """
+        self.setPages(pages)
+        pdfPath = getAbsolutePdfPath(pdfFile)
+        doiID = PdfParser.PdfParser(pdfPath).getFirstDoiID()
+        fullText = PdfParser.PdfParser(pdfPath).getText()
+        self.assertEqual(doiID,
+                            PdfParser.PdfParser.doiFinder.getDoiID(fullText))
+        return doiID
+
+    def test_iterText(self):
+        self.setPages([ 'page %d' % n for n in range(1, 4) ])
+        parser = PdfParser.PdfParser(getAbsolutePdfPath('MGI_6304117.pdf'))
+        chunks = list(parser.iterText())
+        self.assertFalse(parser.loaded)         # text is not kept
+        pages = list(parser.iterText(byPage=True))
+        self.assertEqual(pages, [ 'page 1\n\f', 'page 2\n\f', 'page 3\n\f' ])
+        self.assertEqual(''.join(chunks), parser.getText())
+        self.assertEqual(pages, [ parser.getPage(n) for n in range(3) ])
+        self.assertEqual(list(parser.iterText(byPage=True)), pages) # loaded
+
+    def test_iterText_failure(self):
+        self.setPages([ 'page 1', 'page 2' ])
+        self.setExitCode(3)
+        parser = PdfParser.PdfParser(getAbsolutePdfPath('MGI_6304117.pdf'))
+        pages = []
+        try:
+            for page in parser.iterText(byPage=True):
+                pages.append(page)
+            self.fail('litparser failure not raised')
+        except Exception as e:
+            self.assertIn('fake failure', str(e))
+        self.assertEqual(pages, [ 'page 1\n\f', 'page 2\n\f' ])
+
+    def test_early_close(self):
+        self.setPages([ 'page %d' % n for n in range(1, 13) ])
+        self.setHang()
+        parser = PdfParser.PdfParser(getAbsolutePdfPath('6378478.pdf'))
+        for page in parser.iterText(byPage=True):
+            break                               # stops litparser
+        self.assertEqual(page, 'page 1\n\f')
+        self.assertLitParserKilled()
+
+    def test_off_by_default(self):
+        PdfParser.setDoiFirstPages(0)
+        self.setPages([ 'title', 'doi: 10.1016/j.cell.2020.01.001' ])
+        parser = PdfParser.PdfParser(getAbsolutePdfPath('MGI_6304117.pdf'))
+        parser._streamFrontMatterDoiID = lambda: self.fail('streamed')
+        self.assertEqual(parser.getFirstDoiID(), '10.1016/j.cell.2020.01.001')
+
+    def test_stream_front_matter(self):
+        self.setPages([ 'title', 'doi: 10.1016/j.cell.2020.01.001' ] +
+                                                            [ 'body' ] * 10)
+        self.setHang()
+        frontMatter = PdfParser.parserStats['doiFrontMatter']
+        parser = PdfParser.PdfParser(getAbsolutePdfPath('6378478.pdf'))
+        self.assertEqual(parser._streamFrontMatterDoiID(),
+                                                '10.1016/j.cell.2020.01.001')
+        self.assertFalse(parser.loaded)
+        self.assertEqual(PdfParser.parserStats['doiFrontMatter'],
+                                                            frontMatter + 1)
+        self.assertLitParserKilled()            # didn't read the rest
+
+    def test_stream_no_doi_loads_text(self):
+        self.setPages([ 'title', 'abstract', 'doi: 10.1000/late' ])
+        parser = PdfParser.PdfParser(getAbsolutePdfPath('MGI_6304117.pdf'))
+        self.assertEqual(parser._streamFrontMatterDoiID(), None)
+        self.assertTrue(parser.loaded)
+        self.assertEqual(parser.getPageCount(), 3)
+        self.assertEqual(parser.getFirstDoiID(), '10.1000/late')
+
+    def test_same_as_full_text(self):
+        for pdfFile, pages in [
+                ('MGI_6304117.pdf', [ 'x', 'doi:10.1038/s41598-019-47790-5',
+                                                                    'y' ]),
+                # Science: the right DOI is near the end
+                ('MGI_6367457.pdf', [ 'doi 10.1126/science.prior1' ] +
+                        [ 'body' ] * 12 +
+                        [ 'Accepted 1 May 2020 10.1126/science.right2' ]),
+                # truncated PLoS ID, the full ID is later
+                ('MGI_6304117.pdf', [ 'doi 10.1371/journal.pone. 0123456',
+                        'body', 'doi 10.1371/journal.pone.0123456' ]),
+                ]:
+            for firstPages in (0, 2):
+                PdfParser.setDoiFirstPages(firstPages)
+                self.check(pdfFile, pages)
+
+    def test_marker_after_front_matter(self):
+        # a PNAS marker after the first pages can't be seen there, which is
+        #  why setDoiFirstPages() is off by default
+        pages = [ 'doi 10.1000/other', 'body',
+                  'www.pnas.org doi 10.1073/pnas.0931458100' ] + [ 'body' ] * 9
+        PdfParser.setDoiFirstPages(0)
+        self.assertEqual(self.check('6378478.pdf', pages),
+                                                    '10.1073/pnas.0931458100')
+        PdfParser.setDoiFirstPages(2)
+        self.setPages(pages)
+        self.assertEqual(PdfParser.PdfParser(getAbsolutePdfPath(
+                        '6378478.pdf')).getFirstDoiID(), '10.1000/other')
+# end class TestStreaming -------------------
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import os.path
+import shutil
+import tempfile
+import unittest
+import PdfParser
+
+"""
+These are tests for PdfParser.py's preflight check of PDF files.
+They do not need litparser.
+
+Usage:   test_pdfPreflight.py [-v]
+
+    PDF files live in the pdfs/ subdirectory.
+"""
+
+PDF_SUBDIR = "pdfs"     # name of the subdirectory holding the test PDFs
+def getAbsolutePdfPath(pdfFile):
+    """ determine absolute path to pdf test file """
+    testDir = os.path.dirname(os.path.abspath(__file__))     # test directory
+    return os.path.abspath(os.path.join(testDir, PDF_SUBDIR, pdfFile))
+
+###########################
+class TestPdfPreflight(unittest.TestCase):
+
+    def setUp(self):
+        self.litParser = PdfParser.LITPARSER
+        self.tmpDir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        PdfParser.setPreflightCheck(False)
+        PdfParser.LITPARSER = self.litParser    # not our deleted tmpDir
+        shutil.rmtree(self.tmpDir)
+
+    def test_valid(self):
+        preflight = PdfParser.preflightPdf(getAbsolutePdfPath('MGI_6304117.pdf'))
+        self.assertTrue(preflight.isValid())
+        self.assertEqual(preflight.version, '1.3')
+        self.assertEqual(preflight.pageCount, 3)
+        self.assertFalse(preflight.isEncrypted)
+
+    def test_linearized_encrypted(self):
+        preflight = PdfParser.preflightPdf(getAbsolutePdfPath('6378478.pdf'))
+        self.assertTrue(preflight.isValid())
+        self.assertTrue(preflight.isEncrypted)
+        self.assertEqual(preflight.pageCount, 12)
+
+    def test_object_streams(self):      # page tree is compressed
+        self.assertEqual(PdfParser.getPdfPageCount(
+                                getAbsolutePdfPath('MGI_6367457.pdf')), 14)
+
+    def test_trailer(self):
+        # classic xref tables are read from the end, no full scan
+        findPageCount = PdfParser._findPageCount
+        PdfParser._findPageCount = lambda data: self.fail('full scan')
+        try:
+            for pdfFile, pageCount in [ ('MGI_6304117.pdf', 3),
+                                        ('27358912.pdf', 13),  # /Prev xref
+                                        ('MGI_6385447.pdf', 26) ]:
+                self.assertEqual(PdfParser.getPdfPageCount(
+                                getAbsolutePdfPath(pdfFile)), pageCount)
+        finally:
+            PdfParser._findPageCount = findPageCount
+
+        # the same answers as a full scan of the file
+        pdfDir = os.path.dirname(getAbsolutePdfPath('x.pdf'))
+        for pdfFile in sorted(os.listdir(pdfDir)):
+            with open(os.path.join(pdfDir, pdfFile), 'rb') as fp:
+                data = fp.read()
+            trailer = PdfParser._readTrailer(data, len(data))
+            if trailer:
+                self.assertEqual(trailer[0],
+                        PdfParser.ENCRYPT_RE.search(data) is not None, pdfFile)
+            if trailer and trailer[1] is not None:
+                self.assertEqual(trailer[1], PdfParser._findPageCount(data),
+                                                                    pdfFile)
+
+    def test_broken_xref(self):
+        # a bad startxref offset falls back to scanning the whole file
+        with open(getAbsolutePdfPath('MGI_6304117.pdf'), 'rb') as fp:
+            data = fp.read()
+        i = data.rfind(b'startxref')
+        data = data[:i] + b'startxref\n12\n%%EOF\n'
+        self.assertIsNone(PdfParser._readTrailer(data, len(data)))
+        pdfPath = os.path.join(self.tmpDir, 'badxref.pdf')
+        with open(pdfPath, 'wb') as fp:
+            fp.write(data)
+        preflight = PdfParser.preflightPdf(pdfPath)
+        self.assertTrue(preflight.isValid())
+        self.assertEqual(preflight.pageCount, 3)
+
+    def test_invalid(self):
+        preflight = PdfParser.preflightPdf(getAbsolutePdfPath('isInvalid.pdf'))
+        self.assertFalse(preflight.isValid())
+        self.assertEqual(preflight.pageCount, None)
+
+    def test_truncated(self):
+        with open(getAbsolutePdfPath('MGI_6304117.pdf'), 'rb') as fp:
+            data = fp.read()
+        pdfPath = os.path.join(self.tmpDir, 'truncated.pdf')
+        with open(pdfPath, 'wb') as fp:
+            fp.write(data[:len(data) // 2])
+        self.assertFalse(PdfParser.preflightPdf(pdfPath).isValid())
+
+    def test_rejected_without_litparser_run(self):
+        # a litparser that fails the test if it is run
+        with open(os.path.join(self.tmpDir, 'pdfGetFullText.sh'), 'w') as fp:
+            fp.write('#!/bin/sh\necho should not run\nexit 0\n')
+        os.chmod(os.path.join(self.tmpDir, 'pdfGetFullText.sh'), 0o755)
+        PdfParser.setLitParserDir(self.tmpDir)
+        PdfParser.setPreflightCheck(True)
+
+        pdfParser = PdfParser.PdfParser(getAbsolutePdfPath('isInvalid.pdf'))
+        self.assertRaises(PdfParser.PdfInvalidError, pdfParser.getText)
+        self.assertTrue(pdfParser.getStderr().startswith('Preflight: '))
+# end class TestPdfPreflight -------------------
+
+if __name__ == '__main__':
+    unittest.main()
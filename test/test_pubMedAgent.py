@@ -0,0 +1,252 @@
+import json
+import shutil
+import hashlib
+import tempfile
+import unittest
+import urllib.parse
+import HttpReplay
+import HttpRequestGovernor
+import PubMedAgent
+
+"""
+These are tests for PubMedAgent.py's bulk lookups, run against recorded
+responses (no network needed): each test records what a fake eutils returns
+in a cassette (see HttpReplay.py), then runs again replaying the cassette.
+
+Usage:   test_pubMedAgent.py [-v]
+"""
+
+EPOST_RESPONSE = '<?xml version="1.0" ?><ePostResult><QueryKey>1</QueryKey><WebEnv>%s</WebEnv></ePostResult>'
+EPOST_ERROR = '<?xml version="1.0" ?><ePostResult><ERROR>Invalid uid bad</ERROR></ePostResult>'
+
+def getMedline(pubMedID, title=None):
+    """ Return a Medline record for a fake reference
+    """
+    return '\n'.join([ 'PMID- %s' % pubMedID,
+                       'OWN - NLM',
+                       'TI  - %s' % (title or 'Title of %s' % pubMedID),
+                       'AB  - Abstract of %s.' % pubMedID,
+                       'AU  - Smith J',
+                       'TA  - J Foo',
+                       'DP  - 2020 Jan 5',
+                       'PT  - Journal Article',
+                       'AID - 10.1000/%s [doi]' % pubMedID, ]) + '\n'
+
+class FakeEutils (object):
+    """ Transport standing in for the real eutils while recording.
+        Knows the PubMed IDs in 'references' {pubMedID: title or None}.
+    """
+    def __init__(self, references):
+        self.references = references
+        self.posted = {}                # WebEnv -> list of PubMed IDs
+
+    def __call__(self, url, data=None):
+        query = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(url).query))
+        if 'epost.fcgi' in url:
+            pubMedIDs = data[len('id='):].split(',')
+            if 'bad' in pubMedIDs:
+                return 200, EPOST_ERROR
+            webEnv = 'ENV_' + hashlib.sha1(data.encode()).hexdigest()[:8]
+            self.posted[webEnv] = pubMedIDs
+            return 200, EPOST_RESPONSE % webEnv
+        if 'efetch.fcgi' in url and 'WebEnv' in query:
+            start = int(query['retstart'])
+            pubMedIDs = self.posted[query['WebEnv']]
+            page = pubMedIDs[start:start + int(query['retmax'])]
+            return 200, '\n'.join([ getMedline(p, self.references[p])
+                                    for p in page if p in self.references ])
+        return 500, 'server error'
+
+class FakeEsummary (object):
+    """ Transport standing in for the real esummary while recording.
+        Knows the PubMed IDs in 'references' {pubMedID: journal}; the uids
+        list of a response names every requested PubMed ID.
+    """
+    def __init__(self, references, body=None):
+        self.references = references
+        self.body = body                # return this instead, if given
+        self.batches = []               # lists of PubMed IDs requested
+
+    def __call__(self, url, data=None):
+        if self.body is not None:
+            return 200, self.body
+        pubMedIDs = data[len('id='):].split(',')
+        self.batches.append(pubMedIDs)
+        result = {'uids': pubMedIDs}
+        for p in pubMedIDs:
+            if p in self.references:
+                result[p] = {'uid': p, 'source': self.references[p],
+                    'pubdate': '2020 Jan 5', 'pubtype': ['Journal Article'],
+                    'articleids': [ {'idtype': 'doi', 'value': '10.1000/' + p},
+                                    {'idtype': 'pmc', 'value': 'PMC' + p}, ]}
+        return 200, json.dumps({'header': {'type': 'esummary'},
+                                                'result': result}, indent=1)
+
+###########################
+class PubMedTestCase(unittest.TestCase):
+    """ Uses a governor with no limits, replays recorded responses
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.realGov = HttpRequestGovernor.getGovernor(PubMedAgent.SUMMARY_URL)
+        HttpRequestGovernor.registerGovernor('eutils.ncbi.nlm.nih.gov/',
+                        HttpRequestGovernor.HttpRequestGovernor(0, 0, 0, 0))
+
+    def tearDown(self):
+        HttpRequestGovernor.setTransport(None)
+        HttpRequestGovernor.registerGovernor('eutils.ncbi.nlm.nih.gov/',
+                                                                self.realGov)
+        shutil.rmtree(self.directory)
+
+    def recordAndReplay(self, fake, func):
+        """ Return func() run recording fake's responses, and run again
+            replaying them (they must give the same result)
+        """
+        HttpRequestGovernor.setTransport(
+                        HttpReplay.RecordingTransport(self.directory, fake))
+        recorded = func()
+        replay = HttpReplay.ReplayTransport(self.directory)
+        HttpRequestGovernor.setTransport(replay)
+        self.assertEqual(func(), recorded)
+        self.assertEqual(replay.missing, 0)
+        return recorded
+
+###########################
+class TestHistoryPaging(PubMedTestCase):
+
+    def getReferences(self, pubMedIDs, pageSize):
+        agent = PubMedAgent.PubMedAgentMedline()
+        return [ (r.getPubMedID(), r.getDoiID(), r.getTitle())
+                    for r in agent.iterReferenceInfo(pubMedIDs, pageSize) ]
+
+    def test_pages(self):
+        fake = FakeEutils(dict([ (str(n), None) for n in range(1, 8) ]))
+        pubMedIDs = [ str(n) for n in range(1, 8) ]
+        refs = self.recordAndReplay(fake,
+                                lambda: self.getReferences(pubMedIDs, 3))
+        self.assertEqual(refs, [ (p, '10.1000/' + p, 'Title of ' + p)
+                                                        for p in pubMedIDs ])
+        self.assertEqual(len(fake.posted), 1)   # posted once, 3 pages
+
+    def test_empty_page(self):
+        # PubMed doesn't know 3 or 4, so the 2nd page is empty
+        fake = FakeEutils({'1': None, '2': None, '5': None})
+        refs = self.recordAndReplay(fake,
+                    lambda: self.getReferences([ 1, 2, 3, 4, 5 ], 2))
+        self.assertEqual([ r[0] for r in refs ], [ '1', '2', '5' ])
+
+    def test_epost_error(self):
+        HttpRequestGovernor.setTransport(FakeEutils({}))
+        try:
+            self.getReferences([ '1', 'bad' ], 2)
+            self.fail('EPost error not raised')
+        except Exception as e:
+            self.assertIn('EPost of 2 PubMed IDs failed', str(e))
+            self.assertIn('Invalid uid', str(e))
+        self.assertEqual(self.getReferences([], 2), [])
+
+    def test_parse_medline(self):
+        agent = PubMedAgent.PubMedAgentMedline()
+        ref = agent._parseMedlineRecord(getMedline('42', 'A long\n      title'))
+        self.assertEqual((ref.getPubMedID(), ref.getTitle(), ref.getJournal(),
+                        ref.getYear(), ref.getPrimaryAuthor()),
+                        ('42', 'A long title', 'J Foo', '2020', 'Smith J'))
+        self.assertFalse(agent._parseMedlineRecord(
+                                    'Error occurred: bad ID').isValid())
+# end class TestHistoryPaging -------------------
+
+class TestChangedReferences(PubMedTestCase):
+
+    def test_fingerprint_field_order(self):
+        agent = PubMedAgent.PubMedAgentMedline()
+        lines = getMedline('42').split('\n')
+        reordered = '\n'.join(lines[:1] + list(reversed(lines[1:])))
+        ref = agent._parseMedlineRecord(getMedline('42'))
+        self.assertEqual(agent._parseMedlineRecord(reordered).getFingerprint(),
+                                                        ref.getFingerprint())
+        # whitespace doesn't matter, the data does
+        spaced = agent._parseMedlineRecord(getMedline('42',
+                                            'Title  of\n      42'))
+        self.assertEqual(spaced.getFingerprint(), ref.getFingerprint())
+        changed = agent._parseMedlineRecord(getMedline('42', 'New title'))
+        self.assertNotEqual(changed.getFingerprint(), ref.getFingerprint())
+        self.assertEqual(ref.computeFingerprint(), ref.getFingerprint())
+
+    def test_changed_split(self):
+        agent = PubMedAgent.PubMedAgentMedline()
+        HttpRequestGovernor.setTransport(
+                        FakeEutils({'1': None, '2': None, '3': None}))
+        fingerprints = dict([ (r.getPubMedID(), r.getFingerprint())
+                    for r in agent.iterReferenceInfo([ '1', '2', '3' ]) ])
+        fingerprints['4'] = None                # never seen before
+
+        # 2's title changed, 3 was deleted from PubMed, 4 is new
+        fake = FakeEutils({'1': None, '2': 'New title', '4': None})
+        missing = []
+        def getChanged():
+            del missing[:]
+            return [ r.getPubMedID() for r in agent.iterChangedReferences(
+                            fingerprints, 2, missing=missing.extend) ]
+        self.assertEqual(self.recordAndReplay(fake, getChanged), [ '2', '4' ])
+        self.assertEqual(missing, [ '3' ])
+# end class TestChangedReferences -------------------
+
+class TestSummary(PubMedTestCase):
+
+    def getReferences(self, pubMedIDs, **kwargs):
+        agent = PubMedAgent.PubMedAgentSummary()
+        return [ (r.getPubMedID(), r.getDoiID(), r.getPmcID(), r.getJournal(),
+                  r.getYear(), r.getPublicationType())
+                    for r in agent.iterReferenceInfo(pubMedIDs, **kwargs) ]
+
+    def test_batches(self):
+        pubMedIDs = [ str(n) for n in range(1, 1202) ]
+        fake = FakeEsummary(dict([ (p, 'J Foo') for p in pubMedIDs ]))
+        refs = self.recordAndReplay(fake,
+                                    lambda: self.getReferences(pubMedIDs))
+        self.assertEqual([ len(b) for b in fake.batches ], [ 500, 500, 201 ])
+        self.assertEqual(refs, [ (p, '10.1000/' + p, 'PMC' + p, 'J Foo',
+                                '2020', 'Journal Article') for p in pubMedIDs ])
+
+    def test_uids_without_records(self):
+        # PubMed doesn't know 2 or 4: listed in uids, but no records
+        fake = FakeEsummary({'1': 'J Foo', '3': 'J Bar'})
+        refs = self.recordAndReplay(fake,
+                    lambda: self.getReferences([ 1, 2, 3, 4 ], batchSize=3))
+        self.assertEqual([ (r[0], r[3]) for r in refs ],
+                                        [ ('1', 'J Foo'), ('3', 'J Bar') ])
+        HttpRequestGovernor.setTransport(fake)
+        agent = PubMedAgent.PubMedAgentSummary()
+        self.assertFalse(agent.getReferenceInfo('2').isValid())
+
+    def test_error_body(self):
+        truncated = FakeEsummary({'1': 'J Foo', '2': 'J Bar'})(
+                                                    'url', 'id=1,2')[1][:-40]
+        for body in [ '{"error":"API rate limit exceeded","count":"4"}',
+                      '{"esummaryresult":["Invalid uid 1"]}',
+                      truncated, '{"result":', '{"result": [] }', '' ]:
+            HttpRequestGovernor.setTransport(FakeEsummary({}, body))
+            refs = []
+            try:
+                agent = PubMedAgent.PubMedAgentSummary()
+                for ref in agent.iterReferenceInfo([ '1', '2' ]):
+                    refs.append(ref)
+                self.fail('esummary error not raised')
+            except Exception as e:
+                self.assertIn('Error from esummary', str(e))
+                self.assertIn(body.strip(), str(e))
+            self.assertEqual(refs, [])          # none before the error
+
+    def test_summary_records(self):
+        response = ' { "result" : {\n "uids" : [ "7" ] ,\n\t"7" : {"error":' \
+                   ' "cannot get document summary"} } }'
+        records = list(PubMedAgent._iterSummaryRecords(response))
+        self.assertEqual(records,
+                    [ ('7', {'error': 'cannot get document summary'}) ])
+        ref = PubMedAgent.PubMedAgentSummary()._parseSummaryRecord(*records[0])
+        self.assertFalse(ref.isValid())
+        self.assertIn('cannot get document summary', ref.getErrorMessage())
+# end class TestSummary -------------------
+
+if __name__ == '__main__':
+    unittest.main()
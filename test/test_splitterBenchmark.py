@@ -0,0 +1,78 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import ExtractedTextCorpus
+import SplitterBenchmark
+
+"""
+These are tests for SplitterBenchmark.py over a small corpus written by the
+tests (no database needed).
+
+Usage:   test_splitterBenchmark.py [-v]
+"""
+
+BODY = 'Introduction\nSome body text about mice.\n' * 40
+REFS = '\nReferences\n1. Smith J. A paper. J Foo 2020.\n' * 3
+
+###########################
+class TestSplitterBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpDir = tempfile.mkdtemp()
+        self.corpusPath = os.path.join(self.tmpDir, 'corpus')
+        with ExtractedTextCorpus.CorpusWriter(self.corpusPath) as w:
+            w.addText(BODY + REFS, refsKey=1, pubmedID='11', journal='J A')
+            w.addText(BODY + BODY + REFS + BODY, refsKey=2, pubmedID='22',
+                                                                journal='J B')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpDir)
+
+    def test_parseConfig(self):
+        regexFile = os.path.join(self.tmpDir, 'regex.json')
+        with open(regexFile, 'w') as fp:
+            json.dump({'refSection1': ['References']}, fp)
+        config = SplitterBenchmark.parseConfig(' maxFraction=0.5 ', regexFile)
+        self.assertEqual(config['maxFraction'], 0.5)
+        self.assertEqual(config['minFraction'],
+                            SplitterBenchmark.DEFAULT_CONFIG['minFraction'])
+        self.assertEqual(config['regexDict'], {'refSection1': ['References']})
+        self.assertRaises(ValueError, SplitterBenchmark.parseConfig, 'foo=1')
+
+    def test_compareSpans(self):
+        self.assertEqual(SplitterBenchmark.compareSpans([10, 20], [12, 20], 2),
+                                                                    'same')
+        self.assertEqual(SplitterBenchmark.compareSpans([10, 20], [5, 20], 2),
+                                                                    'earlier')
+        self.assertEqual(SplitterBenchmark.compareSpans([10, 20], [10, 30], 2),
+                                                                    'later')
+
+    def test_same_configs_agree(self):
+        config = SplitterBenchmark.parseConfig('')
+        for workers in (1, 2):
+            results = SplitterBenchmark.runBenchmark(self.corpusPath, config,
+                                                    config, workers=workers)
+            self.assertEqual([ d['id'] for d in results['documents'] ],
+                                                                ['11', '22'])
+            agreement = SplitterBenchmark.getAgreement(results['documents'])
+            for counts in agreement['all'].values():
+                self.assertEqual(counts, {'same': 2, 'earlier': 0, 'later': 0})
+            self.assertEqual(len(SplitterBenchmark.getDetails(results)), 1)
+            self.assertTrue(SplitterBenchmark.getReport(results))
+
+    def test_different_configs(self):
+        # refs at 3/4 of doc 2 are too far in for maxFraction=0.1
+        configA = SplitterBenchmark.parseConfig('maxFraction=0.4')
+        configB = SplitterBenchmark.parseConfig('maxFraction=0.1')
+        results = SplitterBenchmark.runBenchmark(self.corpusPath, configA,
+                                                        configB, workers=1)
+        details = SplitterBenchmark.getDetails(results)
+        self.assertGreater(len(details), 1)
+        self.assertTrue(all([ line.split('\t')[0] == '22'
+                                                for line in details[1:] ]))
+# end class TestSplitterBenchmark -------------------
+
+if __name__ == '__main__':
+    unittest.main()